@@ -0,0 +1,4 @@
+# encoding=utf8
+"""
+moprofiler 自身开销的基准测试
+"""
@@ -0,0 +1,224 @@
+# encoding=utf8
+"""
+基准测试的计时工具
+
+参照 pytest-benchmark 的做法：每个用例先自动校准单轮的循环次数，使单轮耗时不低于 ``min_time`` ，
+再重复测量 ``rounds`` 轮，取各轮单次调用耗时的最小值，以减少调度抖动的干扰。
+
+每个用例都指定一个基线用例，其开销为两者单次调用耗时之差，
+如被装饰函数以同样形式的裸函数为基线，从而得到装饰器本身增加的开销。
+
+结果可保存为 JSON 基线文件，之后的结果可与其对比，按开销的相对变化判断是否退化
+"""
+from __future__ import absolute_import, division
+
+import json
+import platform
+import sys
+import time
+from collections import OrderedDict, namedtuple
+
+RESULT_VERSION = 1  #: 基线文件的格式版本
+MIN_TIME_DEFAULT = 0.05  #: 单轮测量的最短耗时，单位 ``s``
+ROUNDS_DEFAULT = 5  #: 默认的测量轮数
+THRESHOLD_DEFAULT = 0.1  #: 默认的退化判定阈值，即开销增加超过 10%
+MIN_DELTA_DEFAULT = 50  #: 默认的退化判定绝对差值下限，单位 ``ns`` ，用于忽略测量噪声
+
+_TIMER = getattr(time, 'perf_counter', time.time)
+
+#: 一个基准测试用例， ``baseline`` 为基线用例名称的序列，以首个测量了相同调用形式的用例为基线
+Case = namedtuple('Case', ['name', 'shape', 'run', 'baseline'])
+
+#: 一个用例的测量结果，耗时单位均为 ``ns``
+Result = namedtuple('Result', [
+    'name', 'shape', 'ns_per_call', 'baseline', 'baseline_ns', 'overhead_ns', 'rounds', 'loops'])
+
+#: 一项对比结果， ``ratio`` 为开销的相对变化
+Comparison = namedtuple('Comparison', ['name', 'shape', 'base_ns', 'head_ns', 'delta', 'ratio'])
+
+_ROW_FMT = '{name:<28} {shape:<12} {ns_per_call:>12.1f} {overhead_ns:>12.1f}  {baseline}'
+_HEADER = '{:<28} {:<12} {:>12} {:>12}  {}'.format('用例', '调用形式', '单次(ns)', '开销(ns)', '基线')
+_CMP_FMT = '{name:<28} {shape:<12} {base_ns:>12.1f} {head_ns:>12.1f} {ratio:>9}  {flag}'
+_CMP_HEADER = '{:<28} {:<12} {:>12} {:>12} {:>9}'.format('用例', '调用形式', '基线(ns)', '当前(ns)', '变化')
+
+
+def calibrate(run, min_time=MIN_TIME_DEFAULT):
+    """
+    校准单轮的循环次数
+
+    :param run: 执行一次被测调用的可调用对象
+    :param float min_time: 单轮测量的最短耗时，单位 ``s``
+    :return: 使单轮耗时不低于 ``min_time`` 的循环次数
+    :rtype: int
+    """
+    loops = 1
+    while True:
+        cost = _time_loops(run, loops)
+        if cost >= min_time:
+            return loops
+        # 按已测耗时估算所需次数，且至少翻倍，避免计时器精度不足时反复试探
+        loops = max(loops * 2, int(loops * min_time / cost * 1.2) if cost > 0 else 0)
+
+
+def _time_loops(run, loops):
+    """
+    :return: 执行 ``loops`` 次的总耗时，单位 ``s``
+    :rtype: float
+    """
+    _range = range(loops)
+    begin = _TIMER()
+    for _i in _range:
+        run()
+    return _TIMER() - begin
+
+
+def measure(run, rounds=ROUNDS_DEFAULT, min_time=MIN_TIME_DEFAULT):
+    """
+    测量单次调用耗时
+
+    :param run: 执行一次被测调用的可调用对象
+    :param int rounds: 测量轮数
+    :param float min_time: 单轮测量的最短耗时，单位 ``s``
+    :return: 各轮中最小的单次调用耗时（单位 ``ns`` ）及单轮的循环次数
+    :rtype: tuple[float, int]
+    """
+    loops = calibrate(run, min_time)
+    best = min(_time_loops(run, loops) for _r in range(rounds))
+    return best / loops * 1e9, loops
+
+
+def run_cases(cases, rounds=ROUNDS_DEFAULT, min_time=MIN_TIME_DEFAULT, stream=None):
+    """
+    按顺序测量用例，基线用例需排在依赖它的用例之前
+
+    :param cases: 用例序列
+    :type cases: Iterable[Case]
+    :param int rounds: 测量轮数
+    :param float min_time: 单轮测量的最短耗时，单位 ``s``
+    :param object stream: 指定时在每个用例测量完毕后输出一行结果
+    :rtype: list[Result]
+    """
+    measured = {}
+    results = []
+    if stream is not None:
+        stream.write(_HEADER + '\n' + '=' * len(_HEADER) + '\n')
+    for case in cases:
+        ns_per_call, loops = measure(case.run, rounds, min_time)
+        baseline = next((name for name in case.baseline if (name, case.shape) in measured), None)
+        baseline_ns = measured[(baseline, case.shape)] if baseline else 0.0
+        result = Result(
+            case.name, case.shape, ns_per_call, baseline, baseline_ns,
+            ns_per_call - baseline_ns, rounds, loops)
+        measured[(case.name, case.shape)] = ns_per_call
+        results.append(result)
+        if stream is not None:
+            stream.write(format_result(result) + '\n')
+    return results
+
+
+def format_result(result):
+    """
+    将一个结果格式化为一行文本
+
+    :param Result result: 测量结果
+    :rtype: str
+    """
+    return _ROW_FMT.format(**dict(result._asdict(), baseline=result.baseline or '-'))
+
+
+def environment():
+    """
+    获取运行环境信息，随结果一同保存，以便判断两份结果是否具有可比性
+
+    :rtype: dict
+    """
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'argv': sys.argv,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def save(results, path):
+    """
+    将结果保存为 JSON 基线文件
+
+    :param list[Result] results: 测量结果
+    :param str path: 文件路径
+    """
+    data = {
+        'version': RESULT_VERSION,
+        'environment': environment(),
+        'results': [r._asdict() for r in results],
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def load(path):
+    """
+    读取 JSON 基线文件
+
+    :param str path: 文件路径
+    :rtype: list[Result]
+    """
+    with open(path) as f:
+        data = json.load(f)
+    if data.get('version') != RESULT_VERSION:
+        raise ValueError('不支持的基线文件版本: {}'.format(data.get('version')))
+    return [Result(**r) for r in data['results']]
+
+
+def compare(base, head):
+    """
+    对比两份结果中的开销
+
+    :param list[Result] base: 基线结果
+    :param list[Result] head: 当前结果
+    :return: 两份结果中均存在的用例的对比，按相对变化从大到小排序
+    :rtype: list[Comparison]
+    """
+    base_map = OrderedDict(((r.name, r.shape), r) for r in base)
+    comparisons = []
+    for r in head:
+        prev = base_map.get((r.name, r.shape))
+        if prev is None:
+            continue
+        delta = r.overhead_ns - prev.overhead_ns
+        ratio = delta / prev.overhead_ns if prev.overhead_ns > 0 else 0.0
+        comparisons.append(
+            Comparison(r.name, r.shape, prev.overhead_ns, r.overhead_ns, delta, ratio))
+    return sorted(comparisons, key=lambda c: c.ratio, reverse=True)
+
+
+def regressions(comparisons, threshold=THRESHOLD_DEFAULT, min_delta=MIN_DELTA_DEFAULT):
+    """
+    筛选退化项
+
+    :param list[Comparison] comparisons: 对比结果
+    :param float threshold: 相对变化的下限
+    :param float min_delta: 绝对差值的下限，单位 ``ns``
+    :rtype: list[Comparison]
+    """
+    return [c for c in comparisons if c.ratio > threshold and c.delta >= min_delta]
+
+
+def format_comparisons(comparisons, threshold=THRESHOLD_DEFAULT, min_delta=MIN_DELTA_DEFAULT):
+    """
+    将对比结果格式化为文本，退化项以 ``!`` 标记
+
+    :param list[Comparison] comparisons: 对比结果
+    :param float threshold: 相对变化的下限
+    :param float min_delta: 绝对差值的下限，单位 ``ns``
+    :rtype: str
+    """
+    regressed = set(regressions(comparisons, threshold, min_delta))
+    lines = [_CMP_HEADER, '=' * len(_CMP_HEADER)]
+    for c in comparisons:
+        lines.append(_CMP_FMT.format(
+            name=c.name, shape=c.shape, base_ns=c.base_ns, head_ns=c.head_ns,
+            ratio='{:+.1%}'.format(c.ratio), flag='!' if c in regressed else ''))
+    return '\n'.join(lines)
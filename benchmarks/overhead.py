@@ -0,0 +1,292 @@
+# encoding=utf8
+"""
+moprofiler 各装饰器的单次调用开销
+
+分别测量秒表、秒表 Mixin 、打点以及时间/内存/采样分析器在函数、实例方法、类方法、生成器四种调用形式下的开销，
+被装饰对象的函数体仅做一次加法，故测得的耗时几乎全部来自装饰器本身。
+秒表的日志会被完整格式化后丢弃（ ``stopwatch_silent`` 用例则关闭日志输出，仅测量计时本身），分析器的结果输出到一个丢弃写入的流，从而计入格式化的开销而不受终端 IO 的影响。
+
+用法::
+
+    python -m benchmarks.overhead                          # 测量并输出结果
+    python -m benchmarks.overhead -k stopwatch             # 仅测量名称中包含 stopwatch 的用例
+    python -m benchmarks.overhead --save baseline.json     # 保存为基线
+    python -m benchmarks.overhead --compare baseline.json  # 与基线对比，存在退化时以 1 退出
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import logging
+import sys
+from collections import deque
+from contextlib import contextmanager
+
+from moprofiler import MemoryProfiler, SamplingProfiler, StopwatchMixin, TimeProfiler, stopwatch
+from moprofiler.registry import ProfilerRegistry
+from moprofiler.stopwatch import current_stopwatch
+
+from . import harness
+
+SHAPES = ('function', 'method', 'classmethod', 'generator')
+METHOD_SHAPES = SHAPES[1:]
+GENERATOR_ITEMS = 3  #: 生成器形式每次调用产出的元素个数
+ATTR_READS = 100  #: 属性访问用例中方法体每次调用读取实例/类属性的次数
+
+
+class _DiscardHandler(logging.Handler):
+    """格式化日志记录后将其丢弃"""
+
+    def emit(self, record):
+        """仅格式化，不输出"""
+        self.format(record)
+
+
+class _NullStream(object):
+    """丢弃写入内容的流"""
+
+    def write(self, text):
+        """丢弃写入的内容"""
+
+    def flush(self):
+        """无需刷新"""
+
+
+BENCH_LOG = logging.getLogger('moprofiler.bench')
+BENCH_LOG.addHandler(_DiscardHandler())
+BENCH_LOG.setLevel(logging.INFO)
+BENCH_LOG.propagate = False
+
+#: 日志级别高于输出级别的 logger ，用于测量不含日志开销的秒表本身
+SILENT_LOG = logging.getLogger('moprofiler.bench.silent')
+SILENT_LOG.setLevel(logging.CRITICAL)
+SILENT_LOG.propagate = False
+
+NULL_STREAM = _NullStream()
+#: 基准测试中的分析器加入此注册表，避免影响全局注册表
+BENCH_REGISTRY = ProfilerRegistry()
+
+
+class _ContextMixin(StopwatchMixin):
+    """覆写了 _get_stopwatch 的秒表 Mixin ，被装饰方法的每次调用都需绑定 callargs"""
+
+    @classmethod
+    @contextmanager
+    def _get_stopwatch(cls, self_or_cls, **callargs):
+        with super(_ContextMixin, cls)._get_stopwatch(self_or_cls, **callargs) as _self_or_cls:
+            yield _self_or_cls
+
+
+def _identity(func):
+    """不做任何装饰，用于构造裸调用的基线用例"""
+    return func
+
+
+def _target_base(mixin, context):
+    """
+    :return: 被装饰方法所属类的基类
+    :rtype: type
+    """
+    if context:
+        return _ContextMixin
+    return StopwatchMixin if mixin else object
+
+
+def _build_function(decorate, dot):
+    """
+    构造函数形式的被装饰对象
+
+    :rtype: function
+    """
+    def function(x):
+        """函数体仅做一次加法，指定 dot 时先打点"""
+        if dot:
+            dot(current_stopwatch())
+        return x + 1
+    return decorate(function)
+
+
+def _method(self, x):
+    """实例方法形式，读取实例属性后做一次加法"""
+    for _i in self._reads:
+        x = self.value + x
+    if self._dot:
+        self._dot(self)
+    return x + 1
+
+
+def _class_method(cls, x):
+    """类方法形式，读取类属性后做一次加法"""
+    for _i in cls._reads:
+        x = cls.value + x
+    if cls._dot:
+        cls._dot(cls)
+    return x + 1
+
+
+def _generator(self, x):
+    """生成器形式，每次调用产出 GENERATOR_ITEMS 个元素"""
+    for _i in self._reads:
+        x = self.value + x
+    for i in range(GENERATOR_ITEMS):
+        if self._dot:
+            self._dot(self)
+        yield x + i
+
+
+def _build_class(decorate, base, reads):
+    """
+    构造实例方法、类方法、生成器三种形式的被装饰对象所属的类
+
+    :rtype: type
+    """
+    class Target(base):
+        """
+        被装饰方法所属的类
+
+        方法体通过类属性而非闭包访问打点函数，因秒表在装饰时会沿闭包查找最里层的函数
+        """
+        _dot = None
+        _reads = range(reads)
+        value = 1
+
+        method = decorate(_method)
+        class_method = classmethod(decorate(_class_method))
+        generator = decorate(_generator)
+    return Target
+
+
+def build(decorate=_identity, mixin=False, dot=None, reads=0, context=False):
+    """
+    按四种调用形式构造被装饰对象
+
+    :param decorate: 装饰器
+    :param bool mixin: 被装饰的方法所属类是否继承 :py:class:`~moprofiler.StopwatchMixin`
+    :param dot: 指定时在函数体内以当前秒表为参数调用，用于测量打点开销
+    :param int reads: 方法体内读取实例/类属性的次数，用于测量装饰器对方法体内属性访问的影响
+    :param bool context: 被装饰的方法所属类是否覆写了 ``_get_stopwatch`` ，需同时开启 ``mixin``
+    :return: 调用形式到执行一次调用的可调用对象的映射
+    :rtype: dict
+    """
+    function = _build_function(decorate, dot)
+    target_class = _build_class(decorate, _target_base(mixin, context), reads)
+    if dot:
+        target_class._dot = staticmethod(
+            lambda owner: dot(owner.stopwatch if mixin else current_stopwatch()))
+    target = target_class()
+    return {
+        'function': lambda: function(1),
+        'method': lambda: target.method(1),
+        'classmethod': lambda: target_class.class_method(1),
+        'generator': lambda: deque(target.generator(1), maxlen=0),
+    }
+
+
+def _dotting(sw):
+    """打点并输出"""
+    sw.dotting()
+
+
+def _dotting_mute(sw):
+    """仅打点，不输出"""
+    sw.dotting(mute=True)
+
+
+#: 用例定义，依次为名称、构造参数、调用形式、基线用例名称
+CASE_SPECS = [
+    ('bare', {}, SHAPES, ()),
+    ('stopwatch', {'decorate': stopwatch(logger=BENCH_LOG)}, SHAPES, ('bare',)),
+    ('stopwatch_silent', {'decorate': stopwatch(logger=SILENT_LOG)}, SHAPES, ('bare',)),
+    ('stopwatch_streaming', {'decorate': stopwatch(logger=BENCH_LOG, streaming=True)},
+     ('generator',), ('bare',)),
+    ('stopwatch_print_mem', {'decorate': stopwatch(logger=BENCH_LOG, print_mem=True)},
+     SHAPES, ('bare',)),
+    ('stopwatch_mem_interval', {'decorate': stopwatch(logger=BENCH_LOG, mem_interval=0.01)},
+     SHAPES, ('bare',)),
+    ('stopwatch_print_gc', {'decorate': stopwatch(logger=BENCH_LOG, print_gc=True)},
+     SHAPES, ('bare',)),
+    ('stopwatch_mixin', {'decorate': stopwatch(logger=BENCH_LOG), 'mixin': True},
+     METHOD_SHAPES, ('bare',)),
+    ('stopwatch_mixin_context',
+     {'decorate': stopwatch(logger=BENCH_LOG), 'mixin': True, 'context': True},
+     METHOD_SHAPES, ('bare',)),
+    # 方法体内的属性访问以同样读取属性的裸方法为基线，其开销与 stopwatch_mixin 之差即为属性访问变慢的部分
+    ('bare_attr', {'reads': ATTR_READS}, METHOD_SHAPES, ()),
+    ('stopwatch_mixin_attr',
+     {'decorate': stopwatch(logger=BENCH_LOG), 'mixin': True, 'reads': ATTR_READS},
+     METHOD_SHAPES, ('bare_attr',)),
+    # 打点以不打点的同一秒表为基线，从而仅得到打点本身的开销
+    ('dotting', {'decorate': stopwatch(logger=BENCH_LOG), 'mixin': True, 'dot': _dotting},
+     SHAPES, ('stopwatch_mixin', 'stopwatch')),
+    ('dotting_mute', {'decorate': stopwatch(logger=BENCH_LOG), 'mixin': True, 'dot': _dotting_mute},
+     SHAPES, ('stopwatch_mixin', 'stopwatch')),
+    ('time_profiler', {'decorate': lambda f: TimeProfiler(
+        f, print_res=False, registry=BENCH_REGISTRY)}, SHAPES, ('bare',)),
+    ('time_profiler_print', {'decorate': lambda f: TimeProfiler(
+        f, stream=NULL_STREAM, registry=BENCH_REGISTRY)}, SHAPES, ('bare',)),
+    ('memory_profiler', {'decorate': lambda f: MemoryProfiler(
+        f, print_res=False, registry=BENCH_REGISTRY)}, SHAPES, ('bare',)),
+    ('memory_profiler_print', {'decorate': lambda f: MemoryProfiler(
+        f, stream=NULL_STREAM, registry=BENCH_REGISTRY)}, SHAPES, ('bare',)),
+    ('sampling_profiler', {'decorate': lambda f: SamplingProfiler(
+        f, print_res=False, registry=BENCH_REGISTRY)}, SHAPES, ('bare',)),
+]
+
+
+def get_cases(keyword=None):
+    """
+    获取用例
+
+    仅按关键字筛选时，被选中用例的基线用例也会一并返回，以便计算开销
+
+    :param str keyword: 仅返回名称中包含该关键字的用例
+    :rtype: list[harness.Case]
+    """
+    selected = set(
+        name for name, _param, _shapes, _baseline in CASE_SPECS if not keyword or keyword in name)
+    for name, _param, _shapes, baseline in reversed(CASE_SPECS):
+        if name in selected:
+            selected.update(baseline)
+    cases = []
+    for name, param, shapes, baseline in CASE_SPECS:
+        if name not in selected:
+            continue
+        runs = build(**param)
+        cases.extend(harness.Case(name, shape, runs[shape], baseline) for shape in shapes)
+    return cases
+
+
+def main(argv=None):
+    """
+    命令行入口
+
+    :param list argv: 命令行参数
+    :return: 退出码，与基线对比存在退化时为 1
+    :rtype: int
+    """
+    parser = argparse.ArgumentParser(description='测量 moprofiler 各装饰器的单次调用开销')
+    parser.add_argument('-k', '--keyword', help='仅测量名称中包含该关键字的用例')
+    parser.add_argument('--rounds', type=int, default=harness.ROUNDS_DEFAULT, help='测量轮数')
+    parser.add_argument(
+        '--min-time', type=float, default=harness.MIN_TIME_DEFAULT, help='单轮测量的最短耗时(s)')
+    parser.add_argument('--save', metavar='PATH', help='将结果保存为 JSON 基线文件')
+    parser.add_argument('--compare', metavar='PATH', help='与 JSON 基线文件对比')
+    parser.add_argument(
+        '--threshold', type=float, default=harness.THRESHOLD_DEFAULT, help='退化判定的相对变化下限')
+    parser.add_argument(
+        '--min-delta', type=float, default=harness.MIN_DELTA_DEFAULT, help='退化判定的绝对差值下限(ns)')
+    args = parser.parse_args(argv)
+
+    results = harness.run_cases(get_cases(args.keyword), args.rounds, args.min_time, sys.stdout)
+    if args.save:
+        harness.save(results, args.save)
+    if args.compare:
+        comparisons = harness.compare(harness.load(args.compare), results)
+        print()
+        print(harness.format_comparisons(comparisons, args.threshold, args.min_delta))
+        if harness.regressions(comparisons, args.threshold, args.min_delta):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
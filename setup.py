@@ -59,7 +59,9 @@ setup(
         'Tracker': 'https://github.com/littlemo/moprofiler/issues',
     },
     install_requires=open('requirements/pip.txt').read().splitlines(),
-    entry_points={},
+    entry_points={
+        'console_scripts': ['moprofiler = moprofiler.cli:main'],
+    },
 
     # https://pypi.org/classifiers/
     classifiers=[
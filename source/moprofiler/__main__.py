@@ -0,0 +1,9 @@
+# encoding=utf8
+"""
+``python -m moprofiler`` 的入口，详见 :py:mod:`moprofiler.cli`
+"""
+import sys
+
+from moprofiler.cli import main
+
+sys.exit(main())
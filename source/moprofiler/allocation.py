@@ -0,0 +1,303 @@
+# encoding=utf8
+"""
+提供基于 ``tracemalloc`` 快照的内存分配分析
+
+内存分析器默认逐行记录进程常驻内存的增量，只能说明哪一行代码执行时内存变多了，无法说明内存被谁持有。
+开启分配分析模式( ``MemoryProfiler(mode='allocation')`` )后，会在被装饰对象进入与退出时各获取一次
+``tracemalloc`` 快照，对比两者得到期间新增且尚未释放的内存分配位置，按净增字节数或内存块数排序输出，
+从而定位长期运行的进程中持续增长的内存由哪些代码分配。
+
+分配位置可按文件( ``filename`` )、行( ``lineno`` )或调用栈( ``traceback`` )分组。
+可排除标准库及 moprofiler 自身的调用帧：若调用栈深度 ``frames`` 大于 1 ，被排除帧中的分配会归到调用栈上
+最近的未被排除的帧，如调用 ``json.dumps`` 产生的分配归到调用它的代码行；深度为 1 时则直接忽略这些分配。
+
+注意 ``tracemalloc`` 追踪的是整个进程，被装饰对象执行期间其他线程的分配同样会被计入；
+获取快照的耗时与进程中存活的内存块数成正比，在生产环境中使用时建议配合 ``sampling`` 参数采样
+"""
+from __future__ import absolute_import
+
+import ast
+import linecache
+import logging
+import os
+import sys
+import sysconfig
+import threading
+from collections import namedtuple
+
+from . import base
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+LOG = logging.getLogger(__name__)
+
+GROUP_BY_CHOICES = ('filename', 'lineno', 'traceback')  #: 可选的分组方式
+SORT_BY_CHOICES = ('size', 'count')  #: 可选的排序方式
+TOP_DEFAULT = 10  #: 默认输出的分配位置个数
+
+#: 一个分配位置的统计， ``frames`` 为由旧到新的 ``(文件名, 行号)`` 序列，按文件分组时行号为 0 ，
+#: ``size`` 为净增字节数， ``count`` 为净增内存块数，二者在释放内存时可为负数，
+#: ``calls`` 为该位置的内存发生变化的调用次数
+AllocationStat = namedtuple('AllocationStat', ['frames', 'size', 'count', 'calls'])
+
+_HEADER = '{:>12} {:>10} {:>12}  {}'.format('净增(KiB)', '块数', '单块(B)', '分配位置')
+_ROW_FMT = '{size:>12.1f} {count:>10} {per_block:>12.1f}  {location}'
+
+_SELF_DIR = os.path.dirname(os.path.abspath(__file__))
+_STDLIB_DIRS = tuple(set(
+    os.path.normcase(os.path.abspath(path)) for path in (
+        sysconfig.get_paths().get('stdlib'), sysconfig.get_paths().get('platstdlib')) if path))
+_THIRD_PARTY_DIRS = ('site-packages', 'dist-packages')
+_FUNCTION_NODES = tuple(
+    getattr(ast, name) for name in ('FunctionDef', 'AsyncFunctionDef') if hasattr(ast, name))
+
+
+def is_stdlib(filename, _cache={}):  # pylint: disable=W0102
+    """
+    判断文件是否属于标准库，第三方库的安装目录不视为标准库
+
+    :param str filename: 文件名
+    :rtype: bool
+    """
+    result = _cache.get(filename)
+    if result is None:
+        if filename.startswith('<'):
+            result = True  # 如 <frozen importlib._bootstrap> 、 <unknown>
+        else:
+            path = os.path.normcase(os.path.abspath(filename))
+            result = _cache[filename] = any(
+                path.startswith(d + os.sep) and
+                not any(part in _THIRD_PARTY_DIRS for part in path[len(d):].split(os.sep))
+                for d in _STDLIB_DIRS)
+    return result
+
+
+def is_self(filename):
+    """
+    判断文件是否属于 moprofiler 自身
+
+    :param str filename: 文件名
+    :rtype: bool
+    """
+    return (filename.startswith(_SELF_DIR + os.sep) or
+            filename == getattr(tracemalloc, '__file__', None))
+
+
+def _function_scopes(filename):
+    """
+    解析源码中各函数定义的行范围
+
+    :param str filename: 文件名
+    :return: 按起始行排列的 ``(起始行, 结束行, 函数名)`` 列表，无法读取或解析源码时为空
+    :rtype: list[tuple]
+    """
+    try:
+        tree = ast.parse(''.join(linecache.getlines(filename)), filename)
+    except (SyntaxError, ValueError):
+        return []
+    scopes = []
+    for node in ast.walk(tree):
+        if isinstance(node, _FUNCTION_NODES):
+            begin = min([node.lineno] + [d.lineno for d in node.decorator_list])
+            end = getattr(node, 'end_lineno', None) or max(
+                getattr(n, 'lineno', 0) for n in ast.walk(node))
+            scopes.append((begin, end, node.name))
+    scopes.sort()
+    return scopes
+
+
+def function_name(filename, lineno, _cache={}):  # pylint: disable=W0102
+    """
+    获取代码行所在的函数名
+
+    ``tracemalloc`` 的调用帧仅记录文件名与行号，故按源码中函数定义的行范围查找包含该行的最内层函数
+
+    :param str filename: 文件名
+    :param int lineno: 行号
+    :return: 函数名，位于模块顶层或无法读取源码时返回 None
+    :rtype: str
+    """
+    scopes = _cache.get(filename)
+    if scopes is None:
+        scopes = _cache[filename] = _function_scopes(filename)
+    name = None
+    for begin, end, func_name in scopes:
+        if begin > lineno:
+            break
+        if lineno <= end:
+            name = func_name
+    return name
+
+
+class AllocationTracker(object):
+    """
+    内存分配追踪器，作为内存分析器在分配分析模式下使用的分析器
+
+    被追踪对象嵌套或并发执行时，仅在最外层进入与最后退出时获取快照，避免重复计入
+    """
+
+    def __init__(self, frames=1, group_by='lineno', exclude_stdlib=True, exclude_self=True):
+        """
+        :param int frames: 每个分配记录的调用栈深度，尚未开始追踪时以该深度启动 ``tracemalloc``
+        :param str group_by: 分组方式，可选 ``filename`` 、 ``lineno`` 、 ``traceback``
+        :param bool exclude_stdlib: 是否排除标准库的调用帧
+        :param bool exclude_self: 是否排除 moprofiler 自身及 ``tracemalloc`` 的调用帧
+        """
+        if tracemalloc is None:  # pragma: no cover
+            raise ValueError('当前 Python 版本不支持 tracemalloc')
+        if group_by not in GROUP_BY_CHOICES:
+            raise ValueError('不支持的分组方式: {}'.format(group_by))
+        self.frames = frames
+        self.group_by = group_by
+        self.exclude_stdlib = exclude_stdlib
+        self.exclude_self = exclude_self
+        self.stats = {}  #: 分配位置到 ``[净增字节数, 净增内存块数, 调用次数]`` 的映射
+        self._lock = threading.Lock()
+        self._depth = 0
+        self._begin = None  # type: tracemalloc.Snapshot
+
+    def _ensure_tracing(self):
+        """未开始追踪时启动 ``tracemalloc`` ，已按更浅的调用栈深度追踪时给出警告"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        elif tracemalloc.get_traceback_limit() < self.frames:
+            LOG.warning(
+                'tracemalloc 已按调用栈深度 %s 开始追踪，无法按指定的深度 %s 记录',
+                tracemalloc.get_traceback_limit(), self.frames)
+
+    def _take_snapshot(self):
+        """
+        获取快照，排除自身时在 C 层面直接过滤掉分配于 moprofiler 及 tracemalloc 中的记录
+
+        :rtype: tracemalloc.Snapshot
+        """
+        snapshot = tracemalloc.take_snapshot()
+        if self.exclude_self:
+            snapshot = snapshot.filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, os.path.join(_SELF_DIR, '*')),
+            ])
+        return snapshot
+
+    def enable_by_count(self):
+        """进入被追踪对象，最外层进入时获取快照"""
+        with self._lock:
+            self._depth += 1
+            if self._depth > 1:
+                return
+            self._ensure_tracing()
+            self._begin = self._take_snapshot()
+
+    def disable_by_count(self):
+        """退出被追踪对象，最后退出时获取快照并累计期间的分配"""
+        with self._lock:
+            self._depth -= 1
+            if self._depth > 0 or self._begin is None:
+                return
+            begin, self._begin = self._begin, None
+            self._accumulate(self._take_snapshot().compare_to(begin, 'traceback'))
+
+    def _site(self, traceback):
+        """
+        获取分配位置的分组键
+
+        :param tracemalloc.Traceback traceback: 分配时的调用栈
+        :return: 由旧到新的 ``(文件名, 行号)`` 元组，全部调用帧均被排除时返回 None
+        :rtype: tuple
+        """
+        frames = list(traceback)
+        if sys.version_info < (3, 7):  # pragma: no cover
+            frames.reverse()  # 旧版本中调用栈由新到旧排列
+        frames = [(f.filename, f.lineno) for f in frames if not (
+            (self.exclude_stdlib and is_stdlib(f.filename)) or
+            (self.exclude_self and is_self(f.filename)))]
+        if not frames:
+            return None
+        if self.group_by == 'traceback':
+            return tuple(frames)
+        filename, lineno = frames[-1]
+        return ((filename, lineno if self.group_by == 'lineno' else 0),)
+
+    def _accumulate(self, diffs):
+        """
+        累计一次调用期间的分配
+
+        :param list[tracemalloc.StatisticDiff] diffs: 进入与退出时快照的对比
+        """
+        stats = self.stats
+        sites = set()
+        for diff in diffs:
+            if not (diff.size_diff or diff.count_diff):
+                continue
+            site = self._site(diff.traceback)
+            if site is None:
+                continue
+            stat = stats.get(site)
+            if stat is None:
+                stat = stats[site] = [0, 0, 0]
+            stat[0] += diff.size_diff
+            stat[1] += diff.count_diff
+            sites.add(site)
+        for site in sites:
+            stats[site][2] += 1
+
+    def __call__(self, func):
+        """
+        封装被追踪对象，在其执行前后获取快照，生成器仅在其自身执行时追踪
+
+        :param function func: 被追踪的函数或生成器函数
+        :rtype: function
+        """
+        return base.wrap_profiled(self, func)
+
+    def snapshot(self, sort_by='size'):
+        """
+        获取当前统计结果的快照
+
+        :param str sort_by: 排序方式， ``size`` 为按净增字节数， ``count`` 为按净增内存块数，均从大到小排列
+        :rtype: list[AllocationStat]
+        """
+        if sort_by not in SORT_BY_CHOICES:
+            raise ValueError('不支持的排序方式: {}'.format(sort_by))
+        with self._lock:
+            stats = [AllocationStat(site, *stat) for site, stat in self.stats.items()]
+        index = 1 if sort_by == 'size' else 2
+        return sorted(stats, key=lambda s: (s[index], s[3 - index]), reverse=True)
+
+
+def _location(filename, lineno):
+    """
+    :return: 分配位置的显示文本
+    :rtype: str
+    """
+    return filename if not lineno else '{}:{}'.format(filename, lineno)
+
+
+def format_stats(stats, top=TOP_DEFAULT):
+    """
+    将分配统计格式化为文本
+
+    :param list[AllocationStat] stats: 已排序的分配统计
+    :param int top: 输出的分配位置个数，为空时全部输出
+    :rtype: str
+    """
+    lines = ['内存分配分析（共 {} 个分配位置）'.format(len(stats)), _HEADER, '=' * len(_HEADER)]
+    for stat in stats[:top]:
+        filename, lineno = stat.frames[-1]
+        lines.append(_ROW_FMT.format(
+            size=stat.size / 1024.0,
+            count=stat.count,
+            per_block=stat.size / float(stat.count) if stat.count else 0.0,
+            location=_location(filename, lineno)))
+        if len(stat.frames) > 1:
+            for frame_filename, frame_lineno in reversed(stat.frames[:-1]):
+                lines.append('{:>38}  <- {}'.format('', _location(frame_filename, frame_lineno)))
+        if lineno:
+            code = linecache.getline(filename, lineno).strip()
+            if code:
+                lines.append('{:>38}     {}'.format('', code))
+    lines.append('')
+    return '\n'.join(lines)
@@ -5,16 +5,94 @@
 import abc
 import inspect
 import logging
+import sys
+import threading
 import types
+import weakref
 from contextlib import contextmanager
-from functools import update_wrapper
+from functools import update_wrapper, wraps
 
 import six
 from pyaop import AOP, Proxy, Return
 
+from . import binary, clock, export, gcstats, policy
+from . import registry as _registry
+
+try:
+    from inspect import signature
+except ImportError:  # pragma: no cover
+    from funcsigs import signature  # Python 2
+
+try:
+    import contextvars
+except ImportError:  # pragma: no cover
+    contextvars = None
+
+try:
+    from . import coroutine
+except SyntaxError:  # pragma: no cover
+    coroutine = None
+
 LOG = logging.getLogger(__name__)
 
 
+class ThreadLocalVar(object):
+    """
+    仅按线程隔离的上下文变量
+
+    提供与 ``contextvars.ContextVar`` 相同的 ``get`` / ``set`` / ``reset`` 接口，
+    用于在不支持 ``contextvars`` 的 Python 版本中回退
+    """
+
+    def __init__(self, name, default=None):
+        """
+        :param str name: 变量名称
+        :param object default: 未设置时的默认值
+        """
+        self.name = name
+        self._default = default
+        self._local = threading.local()
+
+    def get(self, *args):
+        """获取当前线程中的值"""
+        return getattr(self._local, 'value', args[0] if args else self._default)
+
+    def set(self, value):
+        """
+        设置当前线程中的值
+
+        :return: 用于恢复原值的令牌
+        """
+        token = self.get()
+        self._local.value = value
+        return token
+
+    def reset(self, token):
+        """
+        恢复到设置前的值
+
+        :param object token: :py:meth:`set` 返回的令牌
+        """
+        self._local.value = token
+
+
+def context_local(name, default=None):
+    """
+    创建一个上下文变量
+
+    优先使用 ``contextvars.ContextVar`` ，从而同时按线程与 asyncio 任务隔离，
+    不支持时回退为仅按线程隔离的 :py:class:`ThreadLocalVar`
+
+    :param str name: 变量名称
+    :param object default: 未设置时的默认值
+    :return: 支持 ``get`` / ``set`` / ``reset`` 的上下文变量
+    :rtype: contextvars.ContextVar or ThreadLocalVar
+    """
+    if contextvars is None:  # pragma: no cover
+        return ThreadLocalVar(name, default)
+    return contextvars.ContextVar(name, default=default)
+
+
 def proxy(obj, prop, prop_name):
     """
     为 object 对象代理一个属性
@@ -37,25 +115,145 @@ def proxy(obj, prop, prop_name):
     ])
 
 
+def unwrap_function(func):
+    """
+    找到层层装饰器下最里层的函数
+
+    由于查找过程需要递归遍历闭包，建议在装饰时调用一次并缓存结果，避免在每次调用时重复查找
+
+    :param function func: 被装饰过的函数
+    :return: 最里层的函数
+    :rtype: types.FunctionType or types.MethodType
+    """
+    for closure in getattr(func, '__closure__', None) or []:
+        if isinstance(
+                closure.cell_contents,
+                (types.FunctionType, types.MethodType)):  # pragma: no cover
+            return unwrap_function(closure.cell_contents)
+    return func
+
+
+class CallargsBinder(object):
+    """
+    callargs 绑定器
+
+    在创建时一次性找到最里层的函数并解析其签名，之后每次绑定仅剩参数与形参的对应，
+    结果与 ``inspect.getcallargs`` 相同：包含默认值，未传入的可变位置/关键字参数分别为空元组/空字典。
+    仅含普通位置参数的函数走快速路径，其余情况或参数不匹配时交由 ``inspect.Signature.bind`` 处理，
+    Python 2 下使用其向后移植 ``funcsigs``
+    """
+    __slots__ = ('func', 'signature', '_prefix', '_names', '_defaults', '__weakref__')
+
+    def __init__(self, func):
+        """
+        :param function func: 被装饰过的函数
+        """
+        self.func = unwrap_function(func)
+        # 与 inspect.getcallargs 一致，绑定方法的 self/cls 也计入 callargs
+        self._prefix = (self.func.__self__,) if isinstance(self.func, types.MethodType) else ()
+        self.signature = signature(self.func.__func__ if self._prefix else self.func)
+        self._names = None  # 可走快速路径时为形参名称元组
+        self._defaults = ()  # 快速路径中带默认值的形参名称及默认值
+        if all(
+                p.kind == p.POSITIONAL_OR_KEYWORD for p in self.signature.parameters.values()):
+            params = list(self.signature.parameters.values())
+            self._names = tuple(p.name for p in params)
+            self._defaults = tuple((p.name, p.default) for p in params if p.default is not p.empty)
+
+    def bind(self, *args, **kwargs):
+        """
+        获取本次调用的 callargs
+
+        :param list args: 调用函数时的位置参数
+        :param dict kwargs: 调用函数时的关键字参数
+        :return: 调用参数字典
+        :rtype: dict
+        """
+        if self._prefix:
+            args = self._prefix + args
+        names = self._names
+        if names is not None and len(args) <= len(names):
+            callargs = dict(zip(names, args))
+            if not kwargs or (len(callargs) + len(kwargs) <= len(names) and
+                              all(k in names and k not in callargs for k in kwargs)):
+                callargs.update(kwargs)
+                for name, default in self._defaults:
+                    if name not in callargs:
+                        callargs[name] = default
+                if len(callargs) == len(names):
+                    return callargs
+        bound = self.signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return dict(bound.arguments)
+
+
+_BINDERS = weakref.WeakKeyDictionary()  # 被装饰函数到其 callargs 绑定器的缓存
+
+
+def get_binder(func):
+    """
+    获取函数的 callargs 绑定器，同一函数仅在首次获取时解析
+
+    :param function func: 被装饰过的函数
+    :rtype: CallargsBinder
+    """
+    binder = _BINDERS.get(func)
+    if binder is None:
+        binder = _BINDERS[func] = CallargsBinder(func)
+    return binder
+
+
 def get_callargs(func, *args, **kwargs):
     """
     找到层层装饰器下最里层的函数的 callargs
 
+    最里层函数的查找及签名解析按函数缓存，仅在首次调用时进行
+
     :param function func: 被装饰过的函数
     :param list args: 调用函数时的位置参数
     :param dict kwargs: 调用函数时的关键字参数
     :return: 调用参数字典
     :rtype: dict
     """
-    for closure in func.__closure__ or []:
-        if isinstance(
-                closure.cell_contents,
-                (types.FunctionType, types.MethodType)):  # pragma: no cover
-            func = closure.cell_contents
-            return get_callargs(func, *args, **kwargs)
-    else:  # pylint: disable=W0120
-        callargs = inspect.getcallargs(func, *args, **kwargs)
-        return callargs
+    return get_binder(func).bind(*args, **kwargs)
+
+
+_OVERRIDES = weakref.WeakKeyDictionary()  # 类到其各方法是否被覆写的缓存
+
+
+def overrides(self_or_cls, name, base_cls):
+    """
+    判断对象或类的指定方法是否覆写了基类中的实现，结果按类缓存
+
+    :param object self_or_cls: 对象或类
+    :param str name: 方法名称
+    :param class base_cls: 定义了默认实现的基类
+    :rtype: bool
+    """
+    cls = self_or_cls if isinstance(self_or_cls, type) else type(self_or_cls)
+    cached = _OVERRIDES.get(cls)
+    if cached is None:
+        cached = _OVERRIDES[cls] = {}
+    result = cached.get(name)
+    if result is None:
+        impl, default = getattr(cls, name), getattr(base_cls, name)
+        impl, default = getattr(impl, '__func__', impl), getattr(default, '__func__', default)
+        result = cached[name] = impl is not default
+    return result
+
+
+def qualified_name(func):
+    """
+    获取函数的限定名，如 ``Class.method`` ，使不同类中的同名方法得以区分
+
+    在函数内定义的函数或类省略外层函数的部分，即 ``<locals>`` 及其之前的部分；
+    ``Python 2`` 中没有 ``__qualname__`` ，此时返回函数名
+
+    :param function func: 函数或方法
+    :rtype: str
+    """
+    qualname = getattr(func, '__qualname__', None)
+    return qualname.rpartition('<locals>.')[2] if qualname else func.__name__
 
 
 def is_instance_or_subclass(self_or_cls, super_cls):
@@ -72,6 +270,88 @@ def is_instance_or_subclass(self_or_cls, super_cls):
         (isinstance(self_or_cls, type) and issubclass(self_or_cls, super_cls)))
 
 
+def forward_generator(g, step, start=None, finish=None):
+    """
+    逐步驱动被封装的生成器，并将消费者的操作转发给它
+
+    每一步均通过 ``step`` 执行，以便仅在被封装的生成器自身执行时计时或启用分析器。
+    消费者通过 ``send`` 发送的值、 ``throw`` 抛入的异常均会转发给被封装的生成器，
+    无论迭代完毕、被消费者提前关闭或抛出异常，被封装的生成器均会被关闭。
+    被封装的生成器的返回值即为返回的生成器的返回值，故 ``yield from`` 被分析的生成器时仍可获取其返回值
+
+    :param types.GeneratorType g: 被封装的生成器
+    :param function step: 以生成器的 ``send`` / ``throw`` / ``close`` 方法及其参数调用，执行该方法并返回其结果
+    :param function start: 首次迭代时调用
+    :param function finish: 结束时以结束迭代的异常调用，迭代完毕时为 None ，被消费者关闭时为 ``GeneratorExit``
+    :rtype: types.GeneratorType
+    """
+    if start is not None:
+        start()
+    send, exc, error = None, None, None
+    try:
+        while True:
+            try:
+                # 第一次迭代发送 None ，之后转发消费者发送的值或抛入的异常
+                item = step(g.send, send) if exc is None else step(g.throw, exc)
+            except StopIteration as e:
+                return e.value
+            try:
+                send, exc = (yield item), None
+            except GeneratorExit:
+                raise
+            except BaseException as e:  # pylint: disable=W0703
+                send, exc = None, e
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        # 被消费者提前关闭时，被封装的生成器中的 finally 等清理逻辑同样通过 step 执行
+        step(g.close)
+        if finish is not None:
+            finish(error)
+
+
+def profiler_step(profiler):
+    """
+    创建仅在执行期间启用分析器的 step 函数
+
+    :param profiler: 支持 ``enable_by_count`` / ``disable_by_count`` 的分析器
+    :return: 以被调用对象及其参数调用，启用分析器执行后返回其结果
+    :rtype: function
+    """
+    def step(method, *args, **kwargs):
+        """在分析器启用期间执行"""
+        profiler.enable_by_count()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            profiler.disable_by_count()
+    return step
+
+
+def wrap_profiled(profiler, func):
+    """
+    封装被分析对象，仅在其执行期间启用分析器，生成器仅在其自身执行时启用
+
+    :param profiler: 支持 ``enable_by_count`` / ``disable_by_count`` 的分析器
+    :param function func: 被分析的函数或生成器函数
+    :rtype: function
+    """
+    step = profiler_step(profiler)
+    if inspect.isgeneratorfunction(func):
+        @wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            """仅在生成器自身执行时启用分析器"""
+            return forward_generator(func(*args, **kwargs), step)
+        return generator_wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        """在被分析对象执行期间启用分析器"""
+        return step(func, *args, **kwargs)
+    return wrapper
+
+
 class ProfilerMixin(object):
     """
     分析器 Mixin 的基类
@@ -137,9 +417,12 @@ class ClassDecoratorBase(object):
             args = (self.__instance,) + args
         return self if not _func else self._wrapper(*args, **kwargs)
 
-    def __get__(self, *args, **kwargs):
-        self.__instance = args[0]
-        return six.create_bound_method(self, self.__instance) if self.__fake_method else self
+    def __get__(self, instance, owner=None):
+        self.__instance = instance
+        if instance is None or not self.__fake_method:
+            # 通过类访问时与普通函数一致，返回未绑定的类装饰器，调用时需显式传入实例
+            return self
+        return six.create_bound_method(self, instance)
 
     @abc.abstractmethod
     def _wrapper(self, *args, **kwargs):
@@ -150,13 +433,17 @@ class ProfilerClassDecorator(ClassDecoratorBase):
     """
     分析器的类装饰器
     """
-    @abc.abstractproperty
+    report_kind = None  #: 合并报告中的统计类型，详见 :py:mod:`moprofiler.registry`
+
+    @property
+    @abc.abstractmethod
     def profiler_factory(self):
         """用于生产分析器的工厂"""
 
     def __init__(
             self, _function=None, print_res=True, force_new_profiler=False,
-            profiler_args=None, profiler_kwargs=None, **kwargs):
+            profiler_args=None, profiler_kwargs=None, exporter=None, sampling=None,
+            registry=None, print_gc=False, profiler=None, **kwargs):
         """
         分析器的类装饰器初始化
 
@@ -171,39 +458,266 @@ class ProfilerClassDecorator(ClassDecoratorBase):
         :param bool force_new_profiler: 是否强制使用新的分析器，默认为 ``否``
         :param tuple profiler_args: 分析器工厂的位置参数列表
         :param dict profiler_kwargs: 分析器工厂的关键字参数字典
+        :param moprofiler.export.Exporter exporter: 后台输出器，指定后 ``print_res`` 的输出将交由其在后台线程中
+            渲染并写入其输出目标，调用线程仅获取一份统计结果的快照
+        :param sampling: 采样策略，默认追踪每次调用，未被采样的调用将直接执行被装饰对象，
+            取值详见 :py:mod:`moprofiler.policy`
+        :type sampling: float or int or moprofiler.policy.SamplingPolicy
+        :param moprofiler.registry.ProfilerRegistry registry: 加入的分析器注册表，默认为全局注册表
+        :param bool print_gc: 是否统计被装饰对象执行期间（协程/生成器挂起的时间除外）的垃圾回收，
+            并在输出结果时一并输出，详见 :py:mod:`moprofiler.gcstats` ，默认为 ``否``
+        :param profiler: 使用的分析器实例，默认由分析器工厂创建，指定时可由多个类装饰器共用同一个分析器
         """
         super(ProfilerClassDecorator, self).__init__(_function=_function, **kwargs)
 
-        self.profiler = None  #: 分析器实例对象
+        self.profiler = profiler  #: 分析器实例对象
+        self._profiled = None  # 由分析器封装后的被装饰对象，在同一个分析器的各次调用间复用
         self.profiler_args = profiler_args or ()
         self.profiler_kwargs = profiler_kwargs or {}
 
         self._print_res = print_res
+        self.exporter = exporter  #: 后台输出器
+        self.sampling = policy.get_policy(sampling)  #: 采样策略，为空时追踪每次调用
+        self.sampled_calls = 0  #: 被采样追踪的调用次数
+        self.skipped_calls = 0  #: 未被采样而直接执行的调用次数
         self._force_new_profiler = force_new_profiler
 
+        # 协程的运行/挂起耗时统计，单位 ns
+        self.coroutine_calls = 0  #: 被装饰协程的调用次数
+        self.coroutine_run_ns = 0  #: 被装饰协程在事件循环上真正运行的累计时间
+        self.coroutine_suspend_ns = 0  #: 被装饰协程挂起等待的累计时间
+        #: 被采样追踪的调用期间的累计垃圾回收统计，未开启 ``print_gc`` 时为 None
+        self.gc_stats = gcstats.GCStats() if print_gc else None
+
         self.__init_profiler_from_factory()
+        (registry or _registry.REGISTRY).register(self)
 
     def __init_profiler_from_factory(self):
-        """从工厂实例化分析器"""
-        if self._force_new_profiler or not self.profiler:
+        """从工厂实例化分析器，同时丢弃由旧分析器封装的被装饰对象"""
+        if self._force_new_profiler or self.profiler is None:
             self.profiler = self.profiler_factory(
                 *self.profiler_args, **self.profiler_kwargs)
+            self._profiled = None
 
     def __call__(self, *args, **kwargs):
         """
         :rtype: ProfilerClassDecorator
         """
-        self.__init_profiler_from_factory()
+        if self._force_new_profiler:
+            self.__init_profiler_from_factory()
         return super(ProfilerClassDecorator, self).__call__(*args, **kwargs)
 
+    def _get_profiled(self):
+        """
+        获取由分析器封装后的被装饰对象
+
+        封装时分析器会注册被装饰对象的代码对象，故仅在首次调用或更换分析器后封装一次
+
+        :rtype: function
+        """
+        profiled = self._profiled
+        if profiled is None:
+            profiled = self._profiled = self.profiler(self.func)
+        return profiled
+
     def _wrapper(self, *args, **kwargs):
-        profiler_wrapper = self.profiler(self.func)
-        res = profiler_wrapper(*args, **kwargs)
+        if self.sampling is not None and not self.sampling.should_sample():
+            self.skipped_calls += 1
+            # 仅在被装饰后才会调用 _wrapper ，此时 func 不为 None
+            return self.func(*args, **kwargs)  # pylint: disable=E1102
+        self.sampled_calls += 1
+
+        if coroutine and coroutine.is_async(self.func):
+            # 协程/异步生成器需在被等待/迭代时逐步启停分析器，而非仅观察其创建过程
+            if inspect.isasyncgenfunction(self.func):
+                return coroutine.profile_async_generator(self, args, kwargs)
+            return coroutine.profile_coroutine(self, args, kwargs)
+
+        profiler_wrapper = self._get_profiled()
+        if self.gc_stats is not None:
+            if inspect.isgeneratorfunction(self.func):
+                profiler_wrapper = self._gc_generator(profiler_wrapper)
+            else:
+                profiler_wrapper = self._gc_function(profiler_wrapper)
+        if self.sampling is None:
+            res = profiler_wrapper(*args, **kwargs)
+        else:
+            begin = clock.CLOCKS['perf_counter_ns']()
+            try:
+                res = profiler_wrapper(*args, **kwargs)
+            finally:
+                self.sampling.record(clock.CLOCKS['perf_counter_ns']() - begin)
+        self._finish_call()
+        return res
+
+    def _gc_begin(self):
+        """
+        开始统计垃圾回收
+
+        :rtype: gcstats.GCStats
+        """
+        return gcstats.MONITOR.start()
+
+    def _gc_end(self, stats):
+        """
+        结束统计垃圾回收，并累计到 :py:attr:`gc_stats`
+
+        :param gcstats.GCStats stats: :py:meth:`_gc_begin` 返回的统计
+        """
+        self.gc_stats.merge(gcstats.MONITOR.stop(stats))
+
+    def _gc_step(self, method, *args, **kwargs):
+        """
+        执行被调用对象，并统计其执行期间的垃圾回收
+
+        :param function method: 被调用对象
+        :return: 被调用对象的返回值
+        """
+        stats = self._gc_begin()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self._gc_end(stats)
+
+    def _gc_function(self, func):
+        """
+        封装被调用对象，在其执行期间统计垃圾回收
+
+        :param function func: 由分析器封装后的被装饰对象
+        :rtype: function
+        """
+        def wrapper(*args, **kwargs):
+            return self._gc_step(func, *args, **kwargs)
+        return wrapper
+
+    def _gc_generator(self, func):
+        """
+        封装生成器函数，仅在生成器自身执行时统计垃圾回收，详见 :py:func:`forward_generator`
+
+        :param function func: 由分析器封装后的被装饰生成器函数
+        :rtype: function
+        """
+        def wrapper(*args, **kwargs):
+            return forward_generator(func(*args, **kwargs), self._gc_step)
+        return wrapper
+
+    def _finish_call(self, run_ns=None, total_ns=None):
+        """
+        被装饰对象执行完毕后的处理
+
+        :param int run_ns: 协程在事件循环上真正运行的时间，仅协程需传入
+        :param int total_ns: 协程从开始到结束的总时间，仅协程需传入
+        """
+        if run_ns is not None:
+            if self.sampling is not None:
+                self.sampling.record(run_ns)
+            self.coroutine_calls += 1
+            self.coroutine_run_ns += run_ns
+            self.coroutine_suspend_ns += total_ns - run_ns
 
         # 此处由于 LineProfiler 的 C 库造成的 coverage 统计 Bug ，故手动配置为 no cover
         if self._print_res:
-            self.print_stats()
-        return res
+            if self.exporter is None:
+                self.print_stats()
+            else:
+                self.exporter.submit(export.ProfileItem(self, self.snapshot_stats()))
+
+    def _coroutine_stats(self):
+        """
+        :return: 协程的调用次数、运行耗时、挂起耗时
+        :rtype: tuple
+        """
+        return self.coroutine_calls, self.coroutine_run_ns, self.coroutine_suspend_ns
+
+    def _gc_snapshot(self):
+        """
+        :return: 累计垃圾回收统计的副本，未开启 ``print_gc`` 时为 None
+        :rtype: gcstats.GCStats
+        """
+        return self.gc_stats.copy() if self.gc_stats is not None else None
+
+    @staticmethod
+    def _print_gc_stats(stream=None, gc_stats=None):
+        """
+        打印垃圾回收统计，未开启 ``print_gc`` 时不输出
+
+        :param object stream: 输出方式，默认为 stdout ，可指定为文件
+        :param gcstats.GCStats gc_stats: 垃圾回收统计的快照
+        """
+        if gc_stats is None:
+            return
+        (stream or sys.stdout).write(gc_stats.format())
+
+    def _print_coroutine_stats(self, stream=None, coroutine_stats=None):
+        """
+        打印协程的运行/挂起耗时统计，未调用过协程时不输出
+
+        :param object stream: 输出方式，默认为 stdout ，可指定为文件
+        :param tuple coroutine_stats: 协程统计的快照，默认使用当前统计
+        """
+        calls, run_ns, suspend_ns = coroutine_stats or self._coroutine_stats()
+        if not calls:
+            return
+        (stream or sys.stdout).write(
+            '协程调用次数: {}, 运行耗时: {:.6f}s, 挂起耗时: {:.6f}s\n'.format(
+                calls, run_ns / 1e9, suspend_ns / 1e9))
+
+    def reset_stats(self, profiler=None):
+        """
+        清空统计结果
+
+        以新的分析器替换当前分析器，之后的调用将重新封装被装饰对象
+
+        :param profiler: 替换使用的分析器实例，默认由分析器工厂创建
+        """
+        self.profiler = profiler or self.profiler_factory(
+            *self.profiler_args, **self.profiler_kwargs)
+        self._profiled = None
+        self.coroutine_calls = self.coroutine_run_ns = self.coroutine_suspend_ns = 0
+        self.sampled_calls = self.skipped_calls = 0
+        if self.gc_stats is not None:
+            self.gc_stats = gcstats.GCStats()
+
+    @abc.abstractmethod
+    def line_records(self):
+        """
+        获取逐行统计记录，用于合并报告
+
+        抽象方法，需子类实现
+
+        :rtype: Iterable[moprofiler.registry.LineRecord]
+        """
+
+    def dump_stats(self, path, metadata=None):
+        """
+        将逐行统计写入二进制文件，可通过 :py:func:`moprofiler.binary.load` 读取
+
+        :param str path: 文件路径
+        :param dict metadata: 额外的元数据
+        """
+        writer = binary.ProfileWriter(metadata)
+        writer.add_lines(self.line_records())
+        writer.write(path)
+
+    @abc.abstractmethod
+    def snapshot_stats(self):
+        """
+        获取当前统计结果的快照
+
+        快照不受之后调用的影响，可交由其他线程通过 :py:meth:`render_stats` 输出。
+        抽象方法，需子类实现
+        """
+
+    @abc.abstractmethod
+    def render_stats(self, snapshot, stream=None):
+        """
+        输出统计结果的快照
+
+        抽象方法，需子类实现
+
+        :param snapshot: 由 :py:meth:`snapshot_stats` 获取的快照
+        :param object stream: 输出方式，默认为 stdout ，可指定为文件
+        """
 
     @abc.abstractmethod
     def print_stats(self):
@@ -0,0 +1,459 @@
+# encoding=utf8
+"""
+提供分析结果的二进制存储格式
+
+文本输出仅能用于阅读，无法在事后进一步分析。此模块将时间/内存分析的逐行记录、按函数汇总的记录、
+秒表的统计量（含分位数草图）及元数据写入紧凑的二进制文件，读取时通过 ``mmap`` 映射，
+逐行记录等均为定长结构，可按序号随机访问，即使是长时间压测产生的数百 MB 文件，也无需整体读入内存即可查询。
+
+文件结构如下（均为小端序）:
+
+#. 文件头: 魔数 ``MOPROF`` 、格式版本、分段数量
+#. 分段表: 每个分段的类型、偏移量、长度及记录数
+#. 各分段: 字符串索引、字符串数据、逐行记录、函数记录、秒表统计量、分位数草图的桶、 JSON 格式的元数据
+
+逐行记录在写入时按数值从大到小排序，故查询最热的若干行时仅需读取文件开头的少量记录
+"""
+from __future__ import absolute_import
+
+import itertools
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+from collections import OrderedDict, namedtuple
+
+import six
+
+from . import clock, registry, stats
+
+MAGIC = b'MOPROF\x00\x00'  #: 文件魔数
+VERSION = 1  #: 格式版本
+
+_HEADER = struct.Struct('<8sHHI')  # 魔数、版本、保留字段、分段数量
+_SECTION = struct.Struct('<HHIQQQ')  # 分段类型、保留字段、保留字段、偏移量、长度、记录数
+_STRING = struct.Struct('<QI')  # 字符串在数据段中的偏移量、长度
+_LINE = struct.Struct('<BxxxIIIQd')  # 统计类型、文件名、函数名、行号、次数、数值
+_FUNCTION = struct.Struct('<BxxxIIIQd')  # 统计类型、文件名、函数名、行数、次数、数值
+_STOPWATCH = struct.Struct('<IxxxxQddddddQQQQ')  # 名称、次数、总和、最小、最大、均值、平方和、相对误差、桶上限、零值计数、桶偏移、桶数
+_BIN = struct.Struct('<qQ')  # 桶序号、计数
+
+SECTION_STRING_INDEX = 1
+SECTION_STRING_DATA = 2
+SECTION_LINES = 3
+SECTION_FUNCTIONS = 4
+SECTION_STOPWATCH = 5
+SECTION_BINS = 6
+SECTION_METADATA = 7
+
+_KIND_CODES = {registry.KIND_TIME: 1, registry.KIND_MEMORY: 2}
+_KIND_NAMES = dict((v, k) for k, v in _KIND_CODES.items())
+
+#: 按函数汇总的记录， ``lines`` 为有记录的行数， ``value`` 含义与 :py:class:`~moprofiler.registry.LineRecord` 相同
+FunctionRecord = namedtuple(
+    'FunctionRecord', ['kind', 'filename', 'func_name', 'lines', 'hits', 'value'])
+
+
+def summarize_functions(records):
+    """
+    将逐行记录按函数汇总
+
+    :param records: 逐行记录
+    :type records: Iterable[moprofiler.registry.LineRecord]
+    :return: 按数值从大到小排序的函数记录
+    :rtype: list[FunctionRecord]
+    """
+    functions = OrderedDict()
+    for rec in records:
+        key = (rec.kind, rec.filename, rec.func_name)
+        prev = functions.get(key)
+        if prev is None:
+            functions[key] = FunctionRecord(
+                rec.kind, rec.filename, rec.func_name, 1, rec.hits, rec.value)
+        else:
+            functions[key] = prev._replace(
+                lines=prev.lines + 1, hits=prev.hits + rec.hits, value=prev.value + rec.value)
+    return sorted(functions.values(), key=lambda r: r.value, reverse=True)
+
+
+def _nan_if_none(value):
+    """将空值转换为 NaN 以便写入浮点字段"""
+    return float('nan') if value is None else value
+
+
+def _none_if_nan(value):
+    """将 NaN 还原为空值"""
+    return None if math.isnan(value) else value
+
+
+class ProfileWriter(object):
+    """
+    二进制分析结果的写入器
+
+    先通过 :py:meth:`add_lines` 、 :py:meth:`add_stopwatch` 等方法添加内容，最后调用 :py:meth:`write` 写入文件
+    """
+
+    def __init__(self, metadata=None):
+        """
+        :param dict metadata: 元数据，需可 JSON 序列化，默认包含进程号、创建时间及命令行参数
+        """
+        self.metadata = {
+            'pid': os.getpid(),
+            'created': clock.CLOCKS['time_ns'](),
+            'argv': list(sys.argv),
+        }
+        self.metadata.update(metadata or {})
+        self._lines = []
+        self._stopwatch = OrderedDict()
+        self._strings = OrderedDict()
+
+    def add_lines(self, records):
+        """
+        添加逐行记录，同一位置的记录将被合并
+
+        :param records: 逐行记录
+        :type records: Iterable[moprofiler.registry.LineRecord]
+        """
+        self._lines.extend(records)
+
+    def add_stopwatch(self, name, running):
+        """
+        添加秒表的统计量，同名的统计量将被合并
+
+        :param str name: 秒表名称
+        :param stats.RunningStats running: 统计量
+        """
+        if name in self._stopwatch:
+            self._stopwatch[name].merge(running)
+        else:
+            self._stopwatch[name] = running.copy()
+
+    def add_registries(self, profiler_registry=None, stats_registry=None):
+        """
+        添加注册表中的全部分析结果
+
+        :param registry.ProfilerRegistry profiler_registry: 分析器注册表，默认为全局注册表
+        :param stats.StatsRegistry stats_registry: 秒表统计量注册表，默认为全局注册表
+        """
+        self.add_lines((profiler_registry or registry.REGISTRY).records())
+        for name, running in (stats_registry or stats.REGISTRY).cumulative().items():
+            self.add_stopwatch(name, running)
+
+    def _string_id(self, value):
+        """
+        获取字符串在字符串表中的序号
+
+        :param str value: 字符串，空值按空字符串处理
+        :rtype: int
+        """
+        value = value or ''
+        string_id = self._strings.get(value)
+        if string_id is None:
+            string_id = self._strings[value] = len(self._strings)
+        return string_id
+
+    def write(self, path):
+        """
+        写入文件
+
+        先写入同目录下的临时文件，完成后再替换目标文件
+
+        :param str path: 文件路径
+        """
+        lines = sorted(registry.merge_records(self._lines), key=lambda r: r.value, reverse=True)
+        sections = [
+            (SECTION_LINES, len(lines), b''.join(_LINE.pack(
+                _KIND_CODES[r.kind], self._string_id(r.filename), self._string_id(r.func_name),
+                r.lineno, r.hits, r.value) for r in lines)),
+        ]
+        functions = summarize_functions(lines)
+        sections.append((SECTION_FUNCTIONS, len(functions), b''.join(_FUNCTION.pack(
+            _KIND_CODES[r.kind], self._string_id(r.filename), self._string_id(r.func_name),
+            r.lines, r.hits, r.value) for r in functions)))
+
+        stopwatch, bins = [], []
+        for name, running in self._stopwatch.items():
+            sketch = running.sketch
+            sketch_bins = sorted(sketch.bins.items())
+            stopwatch.append(_STOPWATCH.pack(
+                self._string_id(name), running.count, running.sum,
+                _nan_if_none(running.min), _nan_if_none(running.max), running.mean,
+                running._m2, sketch.relative_accuracy, sketch.max_bins,  # pylint: disable=W0212
+                sketch.zero_count, len(bins), len(sketch_bins)))
+            bins.extend(_BIN.pack(key, count) for key, count in sketch_bins)
+        sections.append((SECTION_STOPWATCH, len(stopwatch), b''.join(stopwatch)))
+        sections.append((SECTION_BINS, len(bins), b''.join(bins)))
+        sections.append((SECTION_METADATA, 1, json.dumps(self.metadata).encode('utf8')))
+
+        # 字符串表需在其他分段生成后再生成
+        encoded = [value.encode('utf8') for value in self._strings]
+        index, offset = [], 0
+        for data in encoded:
+            index.append(_STRING.pack(offset, len(data)))
+            offset += len(data)
+        sections = [
+            (SECTION_STRING_INDEX, len(index), b''.join(index)),
+            (SECTION_STRING_DATA, len(encoded), b''.join(encoded)),
+        ] + sections
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, 0, len(sections)))
+            offset = _HEADER.size + _SECTION.size * len(sections)
+            for kind, count, data in sections:
+                f.write(_SECTION.pack(kind, 0, 0, offset, len(data), count))
+                offset += len(data)
+            for _kind, _count, data in sections:
+                f.write(data)
+        os.rename(tmp_path, path)
+
+
+class ProfileReader(object):
+    """
+    二进制分析结果的读取器
+
+    通过 ``mmap`` 映射文件，仅在访问时才读取并解析对应的记录，可作为上下文管理器使用
+    """
+
+    def __init__(self, path):
+        """
+        :param str path: 文件路径
+        :raises ValueError: 文件格式不正确
+        """
+        self.path = path
+        self._mmap = None  # type: mmap.mmap
+        self._string_cache = {}
+        self._metadata = None
+        self._stopwatch_index = None  # 秒表名称到记录序号的映射，首次按名称读取时创建
+        # 文件在读取器的生命周期内保持打开，由 close 关闭
+        self._file = open(path, 'rb')  # pylint: disable=R1732
+        try:
+            # 空文件无法映射，预先检查以给出明确的错误
+            if not os.fstat(self._file.fileno()).st_size:
+                raise ValueError('文件为空: {}'.format(path))
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._sections = self._read_sections()
+        except BaseException:
+            self.close()
+            raise
+
+    def _read_sections(self):
+        """
+        校验文件头并读取分段表
+
+        :return: 分段类型到偏移量、长度及记录数的映射
+        :rtype: dict
+        :raises ValueError: 文件格式不正确
+        """
+        if len(self._mmap) < _HEADER.size:
+            raise ValueError('不是 moprofiler 二进制分析结果文件: {}'.format(self.path))
+        magic, version, _reserved, section_count = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError('不是 moprofiler 二进制分析结果文件: {}'.format(self.path))
+        if version > VERSION:
+            raise ValueError('不支持的格式版本: {}'.format(version))
+        sections = {}
+        for i in range(section_count):
+            kind, _r1, _r2, offset, length, count = _SECTION.unpack_from(
+                self._mmap, _HEADER.size + _SECTION.size * i)
+            sections[kind] = (offset, length, count)
+        return sections
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """关闭文件"""
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+    def _section(self, kind):
+        """
+        :return: 分段的偏移量、长度及记录数，分段不存在时均为 0
+        :rtype: tuple
+        """
+        return self._sections.get(kind, (0, 0, 0))
+
+    def string(self, string_id):
+        """
+        根据序号读取字符串
+
+        :param int string_id: 字符串序号
+        :rtype: str
+        """
+        value = self._string_cache.get(string_id)
+        if value is None:
+            index_offset = self._section(SECTION_STRING_INDEX)[0]
+            offset, length = _STRING.unpack_from(
+                self._mmap, index_offset + _STRING.size * string_id)
+            start = self._section(SECTION_STRING_DATA)[0] + offset
+            value = self._string_cache[string_id] = self._mmap[start:start + length].decode('utf8')
+        return value
+
+    @property
+    def metadata(self):
+        """
+        元数据
+
+        :rtype: dict
+        """
+        if self._metadata is None:
+            offset, length, _count = self._section(SECTION_METADATA)
+            self._metadata = json.loads(
+                self._mmap[offset:offset + length].decode('utf8')) if length else {}
+        return self._metadata
+
+    @property
+    def line_count(self):
+        """
+        逐行记录的数量
+
+        :rtype: int
+        """
+        return self._section(SECTION_LINES)[2]
+
+    def line(self, index):
+        """
+        按序号读取逐行记录，序号越小数值越大
+
+        :param int index: 序号
+        :rtype: moprofiler.registry.LineRecord
+        """
+        offset, _length, count = self._section(SECTION_LINES)
+        if not 0 <= index < count:
+            raise IndexError(index)
+        kind, filename, func_name, lineno, hits, value = _LINE.unpack_from(
+            self._mmap, offset + _LINE.size * index)
+        return registry.LineRecord(
+            _KIND_NAMES[kind], self.string(filename), lineno, self.string(func_name) or None,
+            hits, value)
+
+    def lines(self, kind=None, filename=None, func_name=None):
+        """
+        按数值从大到小依次读取逐行记录
+
+        :param str kind: 仅读取指定统计类型的记录
+        :param str filename: 仅读取指定文件的记录
+        :param str func_name: 仅读取指定函数的记录
+        :rtype: Iterator[moprofiler.registry.LineRecord]
+        """
+        for index in six.moves.range(self.line_count):
+            rec = self.line(index)
+            if (kind is None or rec.kind == kind) and \
+                    (filename is None or rec.filename == filename) and \
+                    (func_name is None or rec.func_name == func_name):
+                yield rec
+
+    def top(self, kind=None, n=registry.TOP_DEFAULT):
+        """
+        读取数值最大的若干行记录
+
+        :param str kind: 仅读取指定统计类型的记录
+        :param int n: 行数
+        :rtype: list[moprofiler.registry.LineRecord]
+        """
+        return list(itertools.islice(self.lines(kind), n))
+
+    def functions(self, kind=None):
+        """
+        按数值从大到小依次读取函数记录
+
+        :param str kind: 仅读取指定统计类型的记录
+        :rtype: Iterator[FunctionRecord]
+        """
+        offset, _length, count = self._section(SECTION_FUNCTIONS)
+        for index in six.moves.range(count):
+            code, filename, func_name, lines, hits, value = _FUNCTION.unpack_from(
+                self._mmap, offset + _FUNCTION.size * index)
+            if kind is None or _KIND_NAMES[code] == kind:
+                yield FunctionRecord(
+                    _KIND_NAMES[code], self.string(filename), self.string(func_name) or None,
+                    lines, hits, value)
+
+    def stopwatch_names(self):
+        """
+        :return: 所有秒表统计量的名称
+        :rtype: list[str]
+        """
+        return list(self._get_stopwatch_index())
+
+    def _get_stopwatch_index(self):
+        """
+        获取秒表名称到记录序号的映射，仅在首次调用时读取全部名称
+
+        :rtype: OrderedDict
+        """
+        if self._stopwatch_index is None:
+            offset, _length, count = self._section(SECTION_STOPWATCH)
+            self._stopwatch_index = OrderedDict(
+                (self.string(_STOPWATCH.unpack_from(self._mmap, offset + _STOPWATCH.size * i)[0]),
+                 i) for i in six.moves.range(count))
+        return self._stopwatch_index
+
+    def stopwatch(self, name):
+        """
+        读取秒表的统计量
+
+        :param str name: 秒表名称
+        :return: 统计量，不存在时返回 None
+        :rtype: stats.RunningStats
+        """
+        index = self._get_stopwatch_index().get(name)
+        if index is None:
+            return None
+        offset = self._section(SECTION_STOPWATCH)[0]
+        bins_offset = self._section(SECTION_BINS)[0]
+        (_name, count, total, min_value, max_value, mean, m2,
+         relative_accuracy, max_bins, zero_count, bin_start, bin_count) = _STOPWATCH.unpack_from(
+             self._mmap, offset + _STOPWATCH.size * index)
+        running = stats.RunningStats(relative_accuracy, max_bins)
+        running.count, running.sum, running.mean = count, total, mean
+        running.min, running.max = _none_if_nan(min_value), _none_if_nan(max_value)
+        running._m2 = m2  # pylint: disable=W0212
+        running.sketch.zero_count = zero_count
+        running.sketch.count = count
+        for j in six.moves.range(bin_start, bin_start + bin_count):
+            key, bin_value = _BIN.unpack_from(self._mmap, bins_offset + _BIN.size * j)
+            running.sketch.bins[key] = bin_value
+        return running
+
+    def histogram(self, name):
+        """
+        读取秒表耗时的直方图
+
+        :param str name: 秒表名称
+        :return: 按代表值从小到大排列的 ``(桶代表值, 计数)`` 列表，单位与记录时一致，不存在时返回 None
+        :rtype: list[tuple]
+        """
+        running = self.stopwatch(name)
+        return None if running is None else running.sketch.histogram()
+
+
+def dump(path, profiler_registry=None, stats_registry=None, metadata=None):
+    """
+    将注册表中的全部分析结果写入二进制文件
+
+    :param str path: 文件路径
+    :param registry.ProfilerRegistry profiler_registry: 分析器注册表，默认为全局注册表
+    :param stats.StatsRegistry stats_registry: 秒表统计量注册表，默认为全局注册表
+    :param dict metadata: 额外的元数据
+    """
+    writer = ProfileWriter(metadata)
+    writer.add_registries(profiler_registry, stats_registry)
+    writer.write(path)
+
+
+def load(path):
+    """
+    以 ``mmap`` 方式打开二进制文件
+
+    :param str path: 文件路径
+    :rtype: ProfileReader
+    """
+    return ProfileReader(path)
@@ -0,0 +1,143 @@
+# encoding=utf8
+"""
+提供秒表的调用树汇总工具
+
+被秒表观察的函数/方法相互调用时，内层秒表会将自身的耗时汇总到外层秒表的调用树中，
+同名的子节点将被合并，故调用树的大小只与调用路径的数量相关，而与调用次数无关。
+
+调用树可输出为缩进文本，或输出为火焰图工具（如 ``flamegraph.pl`` 、 ``speedscope`` ）可读取的折叠栈格式
+"""
+from __future__ import absolute_import
+
+import io
+import threading
+from collections import OrderedDict
+
+import six
+
+from . import clock
+
+_MERGE_LOCK = threading.Lock()  # 子节点可能在其他线程中结束，合并时加锁
+TREE_FMT_DEFAULT = '{indent}{name} [{count}次] 总耗时: {total:.4f}s, 自身耗时: {self_time:.4f}s'
+
+
+class CallTreeNode(object):
+    """
+    调用树节点
+
+    记录同一调用路径上同名秒表的调用次数、总耗时、自身耗时（总耗时减去子节点耗时）
+    """
+
+    def __init__(self, name):
+        """
+        :param str name: 秒表名称
+        """
+        self.name = name
+        self.count = 0  #: 调用次数
+        self.total_ns = 0  #: 总耗时，单位 ``ns``
+        self.self_ns = 0  #: 自身耗时，单位 ``ns``
+        self.children = OrderedDict()  # type: dict[str, CallTreeNode]
+
+    def merge(self, other):
+        """
+        合并另一个同名节点及其子树
+
+        :param CallTreeNode other: 被合并的节点
+        """
+        self.count += other.count
+        self.total_ns += other.total_ns
+        self.self_ns += other.self_ns
+        for name, child in six.iteritems(other.children):
+            self.child(name).merge(child)
+
+    def child(self, name):
+        """
+        获取指定名称的子节点，不存在时创建
+
+        :param str name: 子节点名称
+        :rtype: CallTreeNode
+        """
+        node = self.children.get(name)
+        if node is None:
+            node = self.children[name] = CallTreeNode(name)
+        return node
+
+    def add_child(self, node):
+        """
+        将一个已结束的子节点汇总到当前节点
+
+        :param CallTreeNode node: 子节点
+        """
+        with _MERGE_LOCK:
+            self.child(node.name).merge(node)
+
+    def walk(self, depth=0, path=()):
+        """
+        深度优先遍历调用树
+
+        :param int depth: 当前节点的深度
+        :param tuple path: 从根节点到当前节点父节点的名称路径
+        :return: 依次产出 ``(深度, 名称路径, 节点)``
+        :rtype: Iterator[tuple]
+        """
+        path = path + (self.name,)
+        yield depth, path, self
+        for child in list(self.children.values()):
+            for item in child.walk(depth + 1, path):
+                yield item
+
+    def format_tree(self, fmt=TREE_FMT_DEFAULT, indent='    '):
+        """
+        输出为缩进文本
+
+        模板中可使用变量如下: ``indent`` 、 ``depth`` 、 ``name`` 、 ``count`` 、
+        ``total`` 、 ``self_time`` （单位 ``s`` ）、 ``total_ns`` 、 ``self_ns`` （单位 ``ns`` ）
+
+        :param str fmt: 每个节点的输出模板
+        :param str indent: 每层的缩进字符串
+        :rtype: str
+        """
+        return '\n'.join(fmt.format(
+            indent=indent * depth, depth=depth, name=node.name, count=node.count,
+            total=clock.ns_to_sec(node.total_ns), self_time=clock.ns_to_sec(node.self_ns),
+            total_ns=node.total_ns, self_ns=node.self_ns,
+        ) for depth, _path, node in self.walk())
+
+    def iter_collapsed(self):
+        """
+        输出为折叠栈格式
+
+        每行为以 ``;`` 分隔的调用路径，空格后为该路径上的自身耗时，单位 ``ns``
+
+        :rtype: Iterator[str]
+        """
+        for _depth, path, node in self.walk():
+            if node.self_ns > 0:
+                yield '{} {}'.format(';'.join(path), node.self_ns)
+
+    def write_collapsed(self, file_or_path):
+        """
+        以折叠栈格式写入文件
+
+        :param file_or_path: 文件路径（以追加方式写入）或可写的文件对象
+        :type file_or_path: str or object
+        """
+        write_collapsed(self.iter_collapsed(), file_or_path)
+
+
+def write_collapsed(lines, file_or_path, mode='a'):
+    """
+    将折叠栈格式的各行写入文件，文件路径以 ``UTF-8`` 编码写入
+
+    :param lines: 折叠栈格式的各行，不含换行符
+    :type lines: Iterable[str]
+    :param file_or_path: 文件路径或可写的文件对象
+    :type file_or_path: str or object
+    :param str mode: 写入文件路径的方式，默认为追加，传入 ``w`` 时覆盖
+    """
+    text = ''.join(line + '\n' for line in lines)
+    if isinstance(file_or_path, six.string_types):
+        with io.open(file_or_path, mode, encoding='utf-8') as stream:
+            stream.write(six.ensure_text(text))
+    else:
+        file_or_path.write(text)
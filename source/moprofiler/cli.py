@@ -0,0 +1,379 @@
+# encoding=utf8
+"""
+提供 ``moprofiler`` （或 ``python -m moprofiler`` ）命令行入口
+
+在不修改代码的情况下，对脚本或模块导入的模块插桩后运行之，并在结束后输出合并报告::
+
+    moprofiler -i 'myapp.*' -x 'myapp.vendor.*' job.py --job-arg 1
+    moprofiler -p memory -m myapp.jobs.nightly --date 2019-01-01
+    moprofiler -p stopwatch -i 'myapp.db:Session.*' -s avg -u ms job.py
+    moprofiler -i 'myapp.*' -f json -o profile.json job.py
+    moprofiler -i 'myapp.*' -f binary -o profile.mprof job.py
+
+插桩规则详见 :py:mod:`moprofiler.instrument` 。被运行的脚本或模块自身作为 ``__main__`` 运行，
+其代码在插桩的命名空间中执行，其中定义的函数及方法在定义时即被插桩：
+未指定 ``-i`` 时插桩其中的全部函数及方法，指定时同样按通配符匹配，脚本的模块名为 ``__main__`` ，
+以 ``-m`` 运行的模块仍使用其原本的模块名。以 ``-m`` 运行模块且未指定 ``-i`` 时，默认同时插桩该模块所在的顶层包。
+运行结束后若没有任何函数被插桩，会在 stderr 输出警告。
+
+使用秒表时，各函数以聚合模式汇总耗时，不逐次输出日志，结束后输出按名称汇总的统计。
+
+输出格式如下:
+
+#. ``text`` : 与 :py:meth:`moprofiler.registry.ProfilerRegistry.print_report` 相同的文本报告，默认输出到 stdout
+#. ``json`` : 包含运行信息、逐行记录及秒表统计的 JSON ，数值使用 ``-u`` 指定的单位，同样按 ``-s`` 排序并按 ``-n`` 截取
+#. ``binary`` : :py:mod:`moprofiler.binary` 格式的完整分析结果，需通过 ``-o`` 指定文件，不受排序、截取及单位参数影响，
+   可通过 :py:func:`moprofiler.binary.load` 读取或由 :py:func:`moprofiler.diff.diff` 对比
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import io
+import json
+import os
+import pkgutil
+import runpy
+import sys
+import types
+from contextlib import contextmanager
+
+import six
+
+from . import binary, clock, instrument, registry, spool, stats
+
+try:
+    from importlib import util as importlib_util
+except ImportError:  # pragma: no cover
+    importlib_util = None  # Python 2 中没有 importlib.util ，改用 pkgutil 查找模块
+
+FORMAT_TEXT = 'text'  #: 文本报告
+FORMAT_JSON = 'json'  #: JSON
+FORMAT_BINARY = 'binary'  #: 二进制格式
+FORMATS = (FORMAT_TEXT, FORMAT_JSON, FORMAT_BINARY)
+
+JSON_VERSION = 1  #: JSON 输出的格式版本
+
+_UNIT_CHOICES = [u for units in registry.UNITS.values() for u in units]
+
+
+def build_parser():
+    """
+    :rtype: argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(
+        prog='moprofiler', description='对脚本或模块导入的模块插桩后运行之，结束后输出分析结果')
+    parser.add_argument(
+        '-p', '--profiler', choices=instrument.PROFILERS, default=instrument.PROFILER_TIME,
+        help='使用的分析器，默认为 time')
+    parser.add_argument(
+        '-i', '--instrument', metavar='PATTERN', action='append', default=[],
+        help='需插桩的模块名通配符，或 模块名:限定名 形式的函数/方法通配符，可多次指定')
+    parser.add_argument(
+        '-x', '--exclude', metavar='PATTERN', action='append', default=[],
+        help='排除的模块名通配符，或 模块名:限定名 形式的函数/方法通配符，可多次指定')
+    parser.add_argument(
+        '-o', '--outfile', metavar='PATH',
+        help='结果的输出文件，默认输出到 stdout')
+    parser.add_argument(
+        '-f', '--format', choices=FORMATS, default=FORMAT_TEXT,
+        help='输出格式，默认为 text ， binary 需同时指定 -o')
+    parser.add_argument(
+        '-s', '--sort', choices=registry.SORT_BY_CHOICES, default=registry.SORT_TOTAL,
+        help='排序方式： total 为总量， hits 为次数， avg 为单次均值，默认为 total')
+    parser.add_argument(
+        '-n', '--top', type=int, default=registry.TOP_DEFAULT,
+        help='每种统计输出的条数，为 0 时全部输出，默认为 {}'.format(registry.TOP_DEFAULT))
+    parser.add_argument(
+        '-u', '--unit', choices=_UNIT_CHOICES,
+        help='输出单位，时间单位仅作用于时间统计，内存单位仅作用于内存统计')
+    parser.add_argument(
+        '-m', dest='module', nargs=argparse.REMAINDER,
+        help='以模块方式运行，其后的参数均传给该模块')
+    parser.add_argument('script', nargs='?', help='运行的脚本路径')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='传给脚本的参数')
+    return parser
+
+
+def _exit_code(e):
+    """
+    :param SystemExit e: 脚本退出的异常
+    :return: 退出码
+    :rtype: int
+    """
+    if e.code is None or isinstance(e.code, int):
+        return e.code or 0
+    print(e.code, file=sys.stderr)
+    return 1
+
+
+def _exec_main(code, module, namespace):
+    """
+    以 ``__main__`` 执行代码
+
+    :param code: 代码对象
+    :param types.ModuleType module: 执行期间替换 ``sys.modules['__main__']`` 的模块
+    :param dict namespace: 执行代码的全局命名空间
+    :return: 退出码
+    :rtype: int
+    """
+    saved = sys.modules.get('__main__')
+    sys.modules['__main__'] = module
+    try:
+        exec(code, namespace)  # pylint: disable=W0122
+    except SystemExit as e:
+        return _exit_code(e)
+    finally:
+        sys.modules['__main__'] = saved
+    return 0
+
+
+def _main_namespace(module, instrumenter, name, whole):
+    """
+    :param types.ModuleType module: 作为 ``__main__`` 运行的模块
+    :param moprofiler.instrument.Instrumenter instrumenter: 插桩器，为 None 时不插桩
+    :param str name: 用于匹配通配符的模块名
+    :param bool whole: 是否插桩其中的全部函数及方法
+    :return: 执行代码的全局命名空间
+    :rtype: dict
+    """
+    if instrumenter is None:
+        return vars(module)
+    return instrumenter.namespace(module, name, whole)
+
+
+@contextmanager
+def _main_environ(argv, path):
+    """
+    运行脚本或模块期间替换 ``sys.argv`` 并将目录插入 ``sys.path`` 开头，结束后恢复
+
+    :param list argv: 运行期间的 ``sys.argv``
+    :param str path: 插入 ``sys.path`` 开头的目录
+    """
+    saved_argv, saved_path = sys.argv, sys.path[:]
+    sys.argv = argv
+    sys.path.insert(0, path)
+    try:
+        yield
+    finally:
+        sys.argv = saved_argv
+        sys.path[:] = saved_path
+
+
+def run_script(path, args, instrumenter=None, whole=False):
+    """
+    以 ``__main__`` 运行脚本
+
+    脚本为目录或 zip 文件时交由 :py:func:`runpy.run_path` 运行，其中的 ``__main__.py`` 不插桩
+
+    :param str path: 脚本路径
+    :param list args: 传给脚本的参数
+    :param moprofiler.instrument.Instrumenter instrumenter: 对脚本中定义的函数插桩的插桩器，为 None 时不插桩
+    :param bool whole: 是否插桩脚本中的全部函数及方法，否则按模块名 ``__main__`` 匹配通配符
+    :return: 脚本的退出码
+    :rtype: int
+    """
+    with _main_environ([path] + list(args), os.path.dirname(os.path.abspath(path))):
+        if not os.path.isfile(path) or path.endswith('.zip'):
+            try:
+                runpy.run_path(path, run_name='__main__')
+            except SystemExit as e:
+                return _exit_code(e)
+            return 0
+        with open(path, 'rb') as f:
+            code = compile(f.read(), path, 'exec', dont_inherit=True)
+        module = types.ModuleType('__main__')
+        module.__file__ = path
+        return _exec_main(code, module, _main_namespace(module, instrumenter, '__main__', whole))
+
+
+def run_module(name, args, instrumenter=None, whole=False):
+    """
+    以 ``__main__`` 运行模块，与 ``python -m`` 相同
+
+    :param str name: 模块名，为包时运行其中的 ``__main__`` 子模块
+    :param list args: 传给模块的参数
+    :param moprofiler.instrument.Instrumenter instrumenter: 对模块中定义的函数插桩的插桩器，为 None 时不插桩
+    :param bool whole: 是否插桩模块中的全部函数及方法，否则按模块原本的模块名匹配通配符
+    :return: 模块的退出码
+    :rtype: int
+    """
+    with _main_environ([name] + list(args), os.getcwd()):
+        name, spec, loader = _find_module(name)
+        code = loader.get_code(name)
+        if code is None:
+            raise ImportError('模块 {} 没有可执行的代码'.format(name))
+        module = types.ModuleType('__main__')
+        if spec is not None:
+            module.__file__ = spec.origin
+            module.__cached__ = spec.cached
+            module.__spec__ = spec
+        else:  # pragma: no cover
+            module.__file__ = loader.get_filename(name)
+        module.__loader__ = loader
+        module.__package__ = name.rpartition('.')[0]
+        sys.argv[0] = module.__file__
+        return _exec_main(code, module, _main_namespace(module, instrumenter, name, whole))
+
+
+def _find_module(name):
+    """
+    查找模块，为包时查找其中的 ``__main__`` 子模块
+
+    :param str name: 模块名
+    :return: 实际运行的模块名、模块规格及加载器， ``Python 2`` 中模块规格为 None
+    :rtype: tuple
+    :raises ImportError: 找不到模块
+    """
+    if importlib_util is None:  # pragma: no cover
+        loader = pkgutil.get_loader(name)
+        if loader is not None and loader.is_package(name):
+            name += '.__main__'
+            loader = pkgutil.get_loader(name)
+        if loader is None:
+            raise ImportError('找不到模块: {}'.format(name))
+        return name, None, loader
+    spec = importlib_util.find_spec(name)
+    if spec is not None and spec.submodule_search_locations is not None:
+        name += '.__main__'
+        spec = importlib_util.find_spec(name)
+    if spec is None or spec.loader is None:
+        raise ImportError('找不到模块: {}'.format(name))
+    return name, spec, spec.loader
+
+
+def build_json(records, stopwatch, sort_by=registry.SORT_TOTAL, top=registry.TOP_DEFAULT, unit=None,
+               **info):
+    """
+    将分析结果转换为可 JSON 序列化的字典
+
+    :param records: 逐行记录
+    :type records: Iterable[moprofiler.registry.LineRecord]
+    :param stopwatch: 秒表名称与统计量的映射，统计量的单位为 ``ns``
+    :type stopwatch: dict[str, moprofiler.stats.RunningStats]
+    :param str sort_by: 排序方式，可选 ``total`` 、 ``hits`` 、 ``avg``
+    :param int top: 每种统计输出的条数，为空时全部输出
+    :param str unit: 输出单位
+    :param dict info: 附加的运行信息
+    :rtype: dict
+    """
+    data = dict(info, version=JSON_VERSION, sort=sort_by, units={}, lines=[], stopwatch=[])
+    merged = registry.merge_records(records)
+    for kind in (registry.KIND_TIME, registry.KIND_MEMORY):
+        rows = sorted(
+            (r for r in merged if r.kind == kind), key=registry.sort_key(sort_by), reverse=True)
+        (total_unit, scale), _per_hit = registry.get_units(kind, unit)
+        data['units'][kind] = total_unit
+        for rec in rows[:top]:
+            row = rec._asdict()
+            row.update(
+                value=rec.value * scale, per_hit=rec.value / rec.hits * scale if rec.hits else 0)
+            data['lines'].append(row)
+
+    time_units = registry.UNITS[registry.KIND_TIME]
+    stopwatch_unit = unit if unit in time_units else 's'
+    data['units'][instrument.PROFILER_STOPWATCH] = stopwatch_unit
+    attr = spool.STOPWATCH_SORT_ATTRS[sort_by]
+    ordered = sorted(stopwatch.items(), key=lambda item: getattr(item[1], attr), reverse=True)
+    scale = float(clock.NS_PER_SEC) / time_units[stopwatch_unit]
+    for name, running in ordered[:top]:
+        data['stopwatch'].append(dict(running.snapshot(scale=scale), name=name))
+    return data
+
+
+def write_report(args, report_registry, stats_registry, info):
+    """
+    按命令行参数输出分析结果
+
+    :param argparse.Namespace args: 命令行参数
+    :param moprofiler.registry.ProfilerRegistry report_registry: 分析器注册表
+    :param moprofiler.stats.StatsRegistry stats_registry: 秒表统计量注册表
+    :param dict info: 附加的运行信息
+    """
+    top = args.top or None
+    if args.format == FORMAT_BINARY:
+        binary.dump(args.outfile, report_registry, stats_registry, metadata=info)
+        return
+    stopwatch = stats_registry.cumulative()
+    if args.format == FORMAT_JSON:
+        data = build_json(report_registry.records(), stopwatch, args.sort, top, args.unit, **info)
+        text = json.dumps(data, indent=2) + '\n'
+    else:
+        texts = [report_registry.format_report(top, args.sort, args.unit)]
+        if stopwatch:
+            texts.append(spool.format_stopwatch(stopwatch, top, args.sort, args.unit))
+        text = '\n'.join(t for t in texts if t)
+        text = text + '\n' if text else ''
+    if args.outfile:
+        with io.open(args.outfile, 'w', encoding='utf-8') as f:
+            f.write(six.ensure_text(text))
+    else:
+        sys.stdout.write(text)
+
+
+def _parse_args(argv):
+    """
+    解析并校验命令行参数
+
+    :param list argv: 命令行参数
+    :return: 命令行参数、以 ``-m`` 运行的模块名（运行脚本时为 None ）及传给脚本或模块的参数
+    :rtype: (argparse.Namespace, str, list)
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    module, target_args = None, args.args
+    if args.module is not None:
+        if not args.module:
+            parser.error('-m 需指定模块名')
+        module, target_args = args.module[0], args.module[1:]
+    elif args.script is None:
+        parser.error('需指定运行的脚本或 -m 模块名')
+    if args.format == FORMAT_BINARY and not args.outfile:
+        parser.error('binary 格式需通过 -o 指定输出文件')
+    if args.top < 0:
+        parser.error('-n 不能为负数')
+    return args, module, target_args
+
+
+def main(argv=None):
+    """
+    命令行入口
+
+    :param list argv: 命令行参数，默认为 ``sys.argv[1:]``
+    :return: 退出码，为脚本或模块的退出码
+    :rtype: int
+    """
+    args, module, target_args = _parse_args(argv)
+    patterns = args.instrument
+    if not patterns and module:
+        package = module.split('.', 1)[0]
+        patterns = [package, package + '.*']
+
+    report_registry = registry.ProfilerRegistry()
+    stats_registry = stats.StatsRegistry()
+    if args.profiler == instrument.PROFILER_STOPWATCH:
+        instrumenter = instrument.Instrumenter(
+            patterns, args.exclude, args.profiler, registry=stats_registry, aggregate=True)
+    else:
+        instrumenter = instrument.Instrumenter(
+            patterns, args.exclude, args.profiler, registry=report_registry)
+    if patterns:
+        instrumenter.install()
+    whole = not args.instrument  # 未指定 -i 时插桩被运行的脚本或模块中的全部函数
+    code = 1  # 脚本或模块抛出异常时，仍输出已收集的分析结果
+    try:
+        if module:
+            code = run_module(module, target_args, instrumenter, whole)
+        else:
+            code = run_script(args.script, target_args, instrumenter, whole)
+    finally:
+        instrumenter.uninstall()
+        if not any(instrumenter.instrumented.values()):
+            print('moprofiler: 警告: 没有任何函数被插桩，请检查 -i / -x 参数', file=sys.stderr)
+        info = {
+            'profiler': args.profiler,
+            'target': module or args.script,
+            'target_args': list(target_args),
+            'exit_code': code,
+        }
+        write_report(args, report_registry, stats_registry, info)
+    return code
@@ -0,0 +1,93 @@
+# encoding=utf8
+"""
+提供秒表使用的时钟后端
+
+所有时钟均返回整数纳秒，便于在内部以整数存储计时，仅在输出时换算为秒。
+可选时钟如下:
+
+#. ``perf_counter_ns`` : 最高精度的单调时钟，默认使用，适合统计墙上耗时
+#. ``monotonic_ns`` : 单调时钟，不受系统时间调整影响
+#. ``process_time_ns`` : 当前进程的 CPU 时间（用户态 + 内核态），不含睡眠、等待 IO 的时间
+#. ``thread_time_ns`` : 当前线程的 CPU 时间，不含睡眠、等待锁的时间
+#. ``time_ns`` : 系统墙上时间，可能因 NTP 校时而回退，仅为兼容保留
+
+在不支持纳秒接口的 Python 版本中，将回退为对应的浮点秒接口并换算为纳秒
+"""
+from __future__ import absolute_import
+
+import time
+
+NS_PER_SEC = 10 ** 9  #: 每秒对应的纳秒数
+
+CLOCK_DEFAULT = 'perf_counter_ns'  #: 默认使用的时钟
+
+
+def _to_ns(clock):
+    """
+    将返回浮点秒的时钟转换为返回整数纳秒的时钟
+
+    :param function clock: 返回浮点秒的时钟函数
+    :return: 返回整数纳秒的时钟函数
+    :rtype: function
+    """
+    def clock_ns():
+        """以纳秒为单位返回时钟读数"""
+        return int(clock() * NS_PER_SEC)
+    return clock_ns
+
+
+def _resolve(name_ns, name, fallback=None):
+    """
+    优先使用纳秒接口，不存在时回退为浮点秒接口
+
+    :param str name_ns: 纳秒接口名
+    :param str name: 浮点秒接口名
+    :param str fallback: 上述接口均不存在时使用的替代接口名
+    :return: 返回整数纳秒的时钟函数，均不存在时返回 None
+    :rtype: function
+    """
+    if hasattr(time, name_ns):
+        return getattr(time, name_ns)
+    for _name in (name, fallback):
+        if _name and hasattr(time, _name):  # pragma: no cover
+            return _to_ns(getattr(time, _name))
+    return None  # pragma: no cover
+
+
+CLOCKS = {
+    'perf_counter_ns': _resolve('perf_counter_ns', 'perf_counter', 'time'),
+    'monotonic_ns': _resolve('monotonic_ns', 'monotonic', 'time'),
+    'process_time_ns': _resolve('process_time_ns', 'process_time', 'clock'),
+    'thread_time_ns': _resolve('thread_time_ns', 'thread_time'),
+    'time_ns': _resolve('time_ns', 'time'),
+}  #: 可用的时钟名称与时钟函数的映射
+
+
+def get_clock(clock=None):
+    """
+    获取时钟函数
+
+    :param clock: 时钟名称，或一个返回整数纳秒的可调用对象，为空时使用默认时钟
+    :type clock: str or function
+    :return: 返回整数纳秒的时钟函数
+    :rtype: function
+    :raises ValueError: 时钟名称未知或当前平台不支持
+    """
+    if callable(clock):
+        return clock
+    func = CLOCKS.get(clock or CLOCK_DEFAULT)
+    if func is None:
+        raise ValueError('不支持的时钟: {}，可选值: {}'.format(
+            clock, ', '.join(sorted(k for k, v in CLOCKS.items() if v))))
+    return func
+
+
+def ns_to_sec(ns):
+    """
+    将纳秒换算为秒
+
+    :param int ns: 纳秒
+    :return: 秒
+    :rtype: float
+    """
+    return ns / float(NS_PER_SEC)
@@ -0,0 +1,302 @@
+# encoding=utf8
+"""
+提供对 asyncio 协程及异步生成器的支持
+
+协程在 ``await`` 时会将控制权交还事件循环，若仅在调用前后计时，得到的只是创建协程对象的耗时。
+此模块逐步驱动被观察的协程，在每次恢复运行与挂起时进行记录，
+从而将在事件循环上真正运行的时间与挂起等待的时间分开统计。
+
+注意此模块使用了 ``async`` 语法，仅在 ``Python 3.6`` 及以上版本中可用
+"""
+from __future__ import absolute_import
+
+import inspect
+import types
+from functools import partial, wraps
+
+from . import clock as _clock
+
+
+def is_async(func):
+    """
+    判断是否为协程函数或异步生成器函数
+
+    :param function func: 被判断的函数
+    :rtype: bool
+    """
+    return inspect.iscoroutinefunction(func) or inspect.isasyncgenfunction(func)
+
+
+class StepTimer(object):
+    """
+    协程分步计时器
+
+    在协程每次恢复运行时调用 :py:meth:`resume` ，每次挂起时调用 :py:meth:`suspend` ，
+    累计协程真正运行的时间，并可在恢复/挂起时额外执行回调，如启停分析器
+    """
+
+    def __init__(self, clock=None, on_resume=None, on_suspend=None):
+        """
+        :param function clock: 返回整数纳秒的时钟函数，默认使用默认时钟
+        :param function on_resume: 协程恢复运行前执行的回调
+        :param function on_suspend: 协程挂起后执行的回调
+        """
+        self.clock = clock or _clock.get_clock()
+        self.begin = None  #: 开始时间，单位 ``ns``
+        self.run_ns = 0  #: 累计运行时间，单位 ``ns``
+        self.steps = 0  #: 协程被恢复运行的次数
+        self._on_resume = on_resume
+        self._on_suspend = on_suspend
+        self._resumed = None
+
+    def start(self):
+        """协程开始执行"""
+        self.begin = self.clock()
+
+    def resume(self):
+        """协程恢复运行"""
+        if self._on_resume:
+            self._on_resume()
+        self._resumed = self.clock()
+
+    def suspend(self):
+        """协程挂起"""
+        self.run_ns += self.clock() - self._resumed
+        self.steps += 1
+        if self._on_suspend:
+            self._on_suspend()
+
+
+@types.coroutine
+def drive(coro, timer):
+    """
+    逐步驱动一个协程（或 ``asend`` 等可等待对象），并在每一步前后通知计时器
+
+    事件循环发送的值与抛入的异常均会原样转发给被驱动的协程
+
+    :param coro: 被驱动的协程
+    :param StepTimer timer: 分步计时器
+    :return: 协程的返回值
+    """
+    send, exc = None, None
+    while True:
+        timer.resume()
+        try:
+            if exc is None:
+                yielded = coro.send(send)
+            else:
+                yielded = coro.throw(exc)
+        except StopIteration as e:
+            return e.value
+        finally:
+            timer.suspend()
+        try:
+            send, exc = (yield yielded), None
+        except GeneratorExit:
+            coro.close()
+            raise
+        except BaseException as e:  # pylint: disable=W0703
+            send, exc = None, e
+
+
+def as_coroutine_function(wrapper):
+    """
+    将返回可等待对象的普通函数封装为协程函数
+
+    使 ``inspect.iscoroutinefunction`` 等判断对装饰后的函数依然成立
+
+    :param function wrapper: 返回可等待对象的函数
+    :return: 协程函数
+    :rtype: function
+    """
+    @wraps(wrapper)
+    async def inner(*args, **kwargs):
+        """等待被封装函数返回的可等待对象"""
+        return await wrapper(*args, **kwargs)
+    return inner
+
+
+def as_context_coroutine_function(func, get_context, call):
+    """
+    将协程函数封装为在被等待时才进入上下文的协程函数
+
+    若在创建协程时进入上下文，上下文会在协程真正执行前即已退出，故需在被等待的协程中进入
+
+    :param function func: 被封装的协程函数，用于复制函数名等属性
+    :param function get_context: 以位置参数元组及关键字参数字典调用，返回上下文管理器，无需上下文时返回 None
+    :param function call: 以位置参数元组及关键字参数字典调用，返回可等待对象，
+        进入上下文时首个位置参数替换为上下文返回的对象
+    :return: 协程函数
+    :rtype: function
+    """
+    @wraps(func)
+    async def inner(*args, **kwargs):
+        """在上下文中等待被封装函数返回的可等待对象"""
+        context = get_context(args, kwargs)
+        if context is None:
+            return await call(args, kwargs)
+        with context as self_or_cls:
+            return await call((self_or_cls,) + args[1:], kwargs)
+    return inner
+
+
+async def run_coroutine(stopwatch, func, args, kwargs):
+    """
+    使用秒表观察一次协程的执行
+
+    :param moprofiler.stopwatch.Stopwatch stopwatch: 秒表
+    :param function func: 被观察的协程函数
+    :param tuple args: 位置参数
+    :param dict kwargs: 关键字参数
+    :return: 协程的返回值
+    """
+    stopwatch._start(func, args, kwargs)  # pylint: disable=W0212
+    timer = StepTimer(stopwatch.clock)
+    # 协程自始至终运行于同一个 asyncio 任务的上下文中，故在整个执行期间将秒表设为正在运行
+    token = stopwatch._activate()  # pylint: disable=W0212
+    try:
+        result = await drive(func(*args, **kwargs), timer)
+    except BaseException:
+        stopwatch._abort()  # pylint: disable=W0212
+        raise
+    finally:
+        stopwatch._deactivate(token)  # pylint: disable=W0212
+    stopwatch.run_ns = timer.run_ns
+    stopwatch._end()  # pylint: disable=W0212
+    return result
+
+
+async def forward_async_generator(agen, timer, start=None, finish=None):
+    """
+    逐步驱动被封装的异步生成器，并将消费者的操作转发给它
+
+    与 :py:func:`moprofiler.base.forward_generator` 相同，消费者通过 ``asend`` 发送的值、
+    ``athrow`` 抛入的异常均会转发给被封装的异步生成器，无论迭代完毕、被消费者提前关闭或抛出异常，
+    被封装的异步生成器均会被关闭；其每一步均由 :py:func:`drive` 驱动并通知计时器
+
+    :param agen: 被封装的异步生成器
+    :param StepTimer timer: 分步计时器
+    :param function start: 首次迭代时调用
+    :param function finish: 结束时以结束迭代的异常调用，迭代完毕时为 None ，被消费者关闭时为 ``GeneratorExit``
+    """
+    if start is not None:
+        start()
+    send, exc, error = None, None, None
+    try:
+        while True:
+            step = agen.asend(send) if exc is None else agen.athrow(exc)
+            try:
+                item = await drive(step, timer)
+            except StopAsyncIteration:
+                return
+            try:
+                send, exc = (yield item), None
+            except GeneratorExit:
+                raise
+            except BaseException as e:  # pylint: disable=W0703
+                send, exc = None, e
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        # 消费者提前关闭时，被封装的异步生成器中的 finally 等清理逻辑也计入运行时间；
+        # 在等待中途被关闭（如事件循环关闭时）的异步生成器仍处于运行状态，无法再关闭
+        if not agen.ag_running:
+            await drive(agen.aclose(), timer)
+        if finish is not None:
+            finish(error)
+
+
+def run_async_generator(stopwatch, func, args, kwargs):
+    """
+    使用秒表观察一次异步生成器的执行
+
+    仅统计异步生成器自身的运行时间，消费者处理每个元素的时间计入挂起时间。
+    与 :py:meth:`moprofiler.stopwatch.Stopwatch.run_generator` 相同，
+    无论迭代完毕、被消费者提前关闭或抛出异常，秒表均会结束并输出，结束状态记录在 ``status`` 变量中
+
+    :param moprofiler.stopwatch.Stopwatch stopwatch: 秒表
+    :param function func: 被观察的异步生成器函数
+    :param tuple args: 位置参数
+    :param dict kwargs: 关键字参数
+    :return: 被观察的异步生成器
+    """
+    # 异步生成器的各次迭代可能由不同的任务驱动，故仅在其自身运行的每一步中将秒表设为正在运行
+    tokens = []
+    timer = StepTimer(
+        stopwatch.clock,
+        on_resume=lambda: tokens.append(stopwatch._activate()),  # pylint: disable=W0212
+        on_suspend=lambda: stopwatch._deactivate(tokens.pop()))  # pylint: disable=W0212
+
+    def finish(error):
+        """结束秒表"""
+        stopwatch.run_ns = timer.run_ns
+        stopwatch.dkwargs['status'] = stopwatch.generator_status(error)
+        stopwatch._end()  # pylint: disable=W0212
+    return forward_async_generator(
+        func(*args, **kwargs), timer,
+        partial(stopwatch._start, func, args, kwargs), finish)  # pylint: disable=W0212
+
+
+def _profiler_timer(decorator):
+    """
+    创建在协程运行时启用分析器、挂起时停用分析器的计时器
+
+    :param moprofiler.base.ProfilerClassDecorator decorator: 分析器的类装饰器
+    :rtype: StepTimer
+    """
+    profiler = decorator.profiler
+    decorator._get_profiled()  # pylint: disable=W0212  # 确保被装饰对象已注册到分析器
+    if decorator.gc_stats is None:
+        return StepTimer(
+            on_resume=profiler.enable_by_count,
+            on_suspend=profiler.disable_by_count)
+
+    # 同时仅在协程运行时统计垃圾回收
+    gc_stats = []
+
+    def on_resume():
+        gc_stats.append(decorator._gc_begin())  # pylint: disable=W0212
+        profiler.enable_by_count()
+
+    def on_suspend():
+        profiler.disable_by_count()
+        decorator._gc_end(gc_stats.pop())  # pylint: disable=W0212
+    return StepTimer(on_resume=on_resume, on_suspend=on_suspend)
+
+
+async def profile_coroutine(decorator, args, kwargs):
+    """
+    使用分析器观察一次协程的执行
+
+    仅在协程真正运行时启用分析器，挂起期间事件循环上执行的其他代码不会被计入
+
+    :param moprofiler.base.ProfilerClassDecorator decorator: 分析器的类装饰器
+    :param tuple args: 位置参数
+    :param dict kwargs: 关键字参数
+    :return: 协程的返回值
+    """
+    timer = _profiler_timer(decorator)
+    timer.start()
+    result = await drive(decorator.func(*args, **kwargs), timer)
+    decorator._finish_call(timer.run_ns, timer.clock() - timer.begin)  # pylint: disable=W0212
+    return result
+
+
+def profile_async_generator(decorator, args, kwargs):
+    """
+    使用分析器观察一次异步生成器的执行
+
+    被消费者提前关闭或抛出异常时，被观察的异步生成器同样会被关闭，且本次调用仍会被统计
+
+    :param moprofiler.base.ProfilerClassDecorator decorator: 分析器的类装饰器
+    :param tuple args: 位置参数
+    :param dict kwargs: 关键字参数
+    :return: 被观察的异步生成器
+    """
+    timer = _profiler_timer(decorator)
+
+    def finish(_error):
+        """统计本次调用"""
+        decorator._finish_call(timer.run_ns, timer.clock() - timer.begin)  # pylint: disable=W0212
+    return forward_async_generator(decorator.func(*args, **kwargs), timer, timer.start, finish)
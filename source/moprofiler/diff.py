@@ -0,0 +1,280 @@
+# encoding=utf8
+"""
+提供两次分析结果的差异对比
+
+可对比由 :py:mod:`moprofiler.binary` 保存的二进制文件或 :py:mod:`moprofiler.spool` 的落盘目录，
+分别对比逐行记录、按函数汇总的记录及秒表统计量，计算绝对差值与相对差值，并按差值排列退化与改进项。
+
+逐行记录按 ``(统计类型, 文件名, 函数名)`` 分组后，以行号相对于函数内首个有记录行的偏移量进行匹配，
+故函数整体移动位置时仍可匹配；偏移量无法匹配时，再在 ``tolerance`` 行以内就近匹配，
+用于应对函数内少量增删行的情况。文件名仅比较其基本名称，故不同机器上的路径差异不影响匹配
+
+对于耗时与内存增量，数值增大即视为退化
+"""
+from __future__ import absolute_import
+
+import os
+from collections import OrderedDict, namedtuple
+
+from . import binary, clock, registry, spool
+
+KIND_STOPWATCH = 'stopwatch'  #: 秒表统计量的统计类型
+TOLERANCE_DEFAULT = 3  #: 行号就近匹配的最大距离
+STOPWATCH_METRICS = ('mean', 'p99')  #: 秒表对比的统计量
+TOP_DEFAULT = 20  #: 文本输出中退化与改进各自默认输出的条数
+
+#: 一项差异， ``scope`` 为 ``line`` 、 ``function`` 或 ``stopwatch`` ， ``base`` / ``head`` 为空表示该项仅存在于另一方
+DiffEntry = namedtuple(
+    'DiffEntry', ['scope', 'kind', 'name', 'metric', 'base', 'head', 'delta', 'ratio'])
+
+_UNITS = {registry.KIND_TIME: 's', registry.KIND_MEMORY: 'MiB', KIND_STOPWATCH: 's'}
+_ROW_FMT = '{delta:>+14.6f}{unit:<4} {ratio:>9}  {base:>14} -> {head:<14} {scope:<9} {name}'
+
+
+def _entry(scope, kind, name, metric, base, head):
+    """
+    构造一项差异
+
+    :rtype: DiffEntry
+    """
+    delta = (head or 0) - (base or 0)
+    # 释放内存时增量为负数，相对差值以基准的绝对值为分母，使其符号与差值一致
+    ratio = delta / float(abs(base)) if base else (0.0 if not delta else float('inf'))
+    return DiffEntry(scope, kind, name, metric, base, head, delta, ratio)
+
+
+def load_profile(source):
+    """
+    读取一次分析结果
+
+    :param source: 二进制文件路径、落盘目录或已打开的 :py:class:`~moprofiler.binary.ProfileReader`
+    :type source: str or binary.ProfileReader
+    :return: 逐行记录及按名称的秒表统计量
+    :rtype: tuple[list[registry.LineRecord], dict[str, moprofiler.stats.RunningStats]]
+    """
+    if isinstance(source, binary.ProfileReader):
+        stopwatch = dict((name, source.stopwatch(name)) for name in source.stopwatch_names())
+        return list(source.lines()), stopwatch
+    if os.path.isdir(source):
+        return spool.merge(source)
+    with binary.load(source) as reader:
+        return load_profile(reader)
+
+
+def _match_key(rec):
+    """
+    逐行及函数记录的匹配键，仅比较文件名而不比较目录
+
+    :rtype: tuple
+    """
+    return rec.kind, os.path.basename(rec.filename), rec.func_name
+
+
+def _group_lines(records):
+    """
+    按统计类型、文件基本名称及函数名分组
+
+    :rtype: OrderedDict
+    """
+    groups = OrderedDict()
+    for rec in registry.merge_records(records):
+        groups.setdefault(_match_key(rec), []).append(rec)
+    return groups
+
+
+def _summarize_functions(records):
+    """
+    将逐行记录按匹配键汇总为函数记录，不同目录下同名文件中的同名函数汇总为一项
+
+    :rtype: list[binary.FunctionRecord]
+    """
+    return binary.summarize_functions(
+        rec._replace(filename=os.path.basename(rec.filename)) for rec in records)
+
+
+def match_lines(base_records, head_records, tolerance=TOLERANCE_DEFAULT):
+    """
+    匹配两次分析结果中的逐行记录
+
+    :param list base_records: 基准的逐行记录
+    :param list head_records: 对比的逐行记录
+    :param int tolerance: 行号就近匹配的最大距离
+    :return: ``(基准记录, 对比记录)`` 列表，未匹配的一方为 None
+    :rtype: list[tuple]
+    """
+    base_groups, head_groups = _group_lines(base_records), _group_lines(head_records)
+    pairs = []
+    for key, base_group in base_groups.items():
+        head_group = head_groups.pop(key, [])
+        base_first = min(r.lineno for r in base_group)
+        head_first = min(r.lineno for r in head_group) if head_group else 0
+        unmatched = dict((r.lineno - head_first, r) for r in head_group)
+        pending = []
+        for rec in base_group:
+            match = unmatched.pop(rec.lineno - base_first, None)
+            if match is None:
+                pending.append(rec)
+            else:
+                pairs.append((rec, match))
+        for rec in pending:
+            offset = rec.lineno - base_first
+            candidates = sorted(
+                (abs(other_offset - offset), other_offset) for other_offset in unmatched
+                if abs(other_offset - offset) <= tolerance)
+            pairs.append((rec, unmatched.pop(candidates[0][1]) if candidates else None))
+        pairs.extend((None, rec) for rec in unmatched.values())
+    for head_group in head_groups.values():
+        pairs.extend((None, rec) for rec in head_group)
+    return pairs
+
+
+def _line_name(rec):
+    """逐行记录的显示名称"""
+    return '{}:{} {}'.format(os.path.basename(rec.filename), rec.lineno, rec.func_name or '')
+
+
+def _function_name(rec):
+    """函数记录的显示名称"""
+    return '{} {}'.format(os.path.basename(rec.filename), rec.func_name or '')
+
+
+class ProfileDiff(object):
+    """两次分析结果的差异"""
+
+    def __init__(self, entries):
+        """
+        :param list[DiffEntry] entries: 所有差异项
+        """
+        self.entries = entries
+
+    def select(self, scope=None, kind=None):
+        """
+        筛选差异项
+
+        :param str scope: 仅返回指定范围的差异项
+        :param str kind: 仅返回指定统计类型的差异项
+        :rtype: list[DiffEntry]
+        """
+        return [e for e in self.entries
+                if (scope is None or e.scope == scope) and (kind is None or e.kind == kind)]
+
+    def regressions(self, threshold=0.0, min_delta=0.0, scope=None):
+        """
+        获取退化项，按差值从大到小排序
+
+        :param float threshold: 相对差值的下限，如 ``0.1`` 表示仅返回增大超过 10% 的项
+        :param float min_delta: 绝对差值的下限，用于忽略测量噪声
+        :param str scope: 仅返回指定范围的差异项
+        :rtype: list[DiffEntry]
+        """
+        entries = [e for e in self.select(scope)
+                   if e.delta > 0 and e.delta >= min_delta and e.ratio > threshold]
+        return sorted(entries, key=lambda e: e.delta, reverse=True)
+
+    def improvements(self, threshold=0.0, min_delta=0.0, scope=None):
+        """
+        获取改进项，按差值从小到大（即改进从多到少）排序
+
+        :param float threshold: 相对差值的下限，如 ``0.1`` 表示仅返回减少超过 10% 的项
+        :param float min_delta: 绝对差值的下限，用于忽略测量噪声
+        :param str scope: 仅返回指定范围的差异项
+        :rtype: list[DiffEntry]
+        """
+        entries = [e for e in self.select(scope)
+                   if e.delta < 0 and -e.delta >= min_delta and -e.ratio > threshold]
+        return sorted(entries, key=lambda e: e.delta)
+
+    def has_regression(self, threshold=0.1, min_delta=0.0, scope=None):
+        """
+        是否存在超过阈值的退化，可用于在持续集成中判断构建是否失败
+
+        :param float threshold: 相对差值的下限，默认为 10%
+        :param float min_delta: 绝对差值的下限
+        :param str scope: 仅检查指定范围的差异项
+        :rtype: bool
+        """
+        return bool(self.regressions(threshold, min_delta, scope))
+
+    def to_dict(self, threshold=0.0, min_delta=0.0):
+        """
+        导出为可 JSON 序列化的字典
+
+        :param float threshold: 退化/改进的相对差值下限
+        :param float min_delta: 退化/改进的绝对差值下限
+        :rtype: dict
+        """
+        def _dump(entries):
+            return [dict(e._asdict(), ratio=None if e.ratio == float('inf') else e.ratio)
+                    for e in entries]
+
+        return {
+            'regressions': _dump(self.regressions(threshold, min_delta)),
+            'improvements': _dump(self.improvements(threshold, min_delta)),
+            'entries': _dump(self.entries),
+        }
+
+    def format_text(self, top=TOP_DEFAULT, threshold=0.0, min_delta=0.0, scope=None):
+        """
+        输出为文本
+
+        :param int top: 退化与改进各自输出的条数
+        :param float threshold: 退化/改进的相对差值下限
+        :param float min_delta: 退化/改进的绝对差值下限
+        :param str scope: 仅输出指定范围的差异项
+        :rtype: str
+        """
+        lines = []
+        for title, entries in (
+                ('退化（按增加量排序）', self.regressions(threshold, min_delta, scope)),
+                ('改进（按减少量排序）', self.improvements(threshold, min_delta, scope))):
+            lines.extend(['{}: {} 项'.format(title, len(entries))])
+            for e in entries[:top]:
+                lines.append(_ROW_FMT.format(
+                    delta=e.delta, unit=_UNITS[e.kind],
+                    ratio='new' if e.ratio == float('inf') else '{:+.1%}'.format(e.ratio),
+                    base='-' if e.base is None else '{:.6f}'.format(e.base),
+                    head='-' if e.head is None else '{:.6f}'.format(e.head),
+                    scope=e.scope,
+                    name=e.name if e.metric == 'total' else '{} [{}]'.format(e.name, e.metric)))
+            lines.append('')
+        return '\n'.join(lines)
+
+
+def diff(base, head, tolerance=TOLERANCE_DEFAULT):
+    """
+    对比两次分析结果
+
+    :param base: 基准，二进制文件路径、落盘目录或已打开的 :py:class:`~moprofiler.binary.ProfileReader`
+    :type base: str or binary.ProfileReader
+    :param head: 对比对象，类型同 ``base``
+    :type head: str or binary.ProfileReader
+    :param int tolerance: 行号就近匹配的最大距离
+    :rtype: ProfileDiff
+    """
+    base_lines, base_stopwatch = load_profile(base)
+    head_lines, head_stopwatch = load_profile(head)
+    entries = []
+    for base_rec, head_rec in match_lines(base_lines, head_lines, tolerance):
+        rec = head_rec or base_rec
+        entries.append(_entry(
+            'line', rec.kind, _line_name(rec), 'total',
+            base_rec and base_rec.value, head_rec and head_rec.value))
+
+    base_functions = dict((_match_key(f), f) for f in _summarize_functions(base_lines))
+    for func in _summarize_functions(head_lines):
+        base_func = base_functions.pop(_match_key(func), None)
+        entries.append(_entry(
+            'function', func.kind, _function_name(func), 'total',
+            base_func and base_func.value, func.value))
+    for func in base_functions.values():
+        entries.append(_entry(
+            'function', func.kind, _function_name(func), 'total', func.value, None))
+
+    for name in sorted(set(base_stopwatch) | set(head_stopwatch)):
+        snapshots = [s[name].snapshot(scale=clock.NS_PER_SEC) if s.get(name) else None
+                     for s in (base_stopwatch, head_stopwatch)]
+        for metric in STOPWATCH_METRICS:
+            base_value, head_value = [snap and snap[metric] for snap in snapshots]
+            entries.append(_entry(
+                'stopwatch', KIND_STOPWATCH, name, metric, base_value, head_value))
+    return ProfileDiff(entries)
@@ -0,0 +1,264 @@
+# encoding=utf8
+"""
+提供非阻塞的后台输出工具
+
+分析器与秒表默认在调用线程中同步输出结果，时间分析器每次输出还需重新读取源文件并渲染整张逐行统计表。
+将 :py:class:`Exporter` 传给分析器或秒表的 ``exporter`` 参数后，调用线程仅需获取一份结果快照并放入队列，
+渲染与写入均在后台线程中批量完成。
+
+队列已满时的处理方式由 ``block`` 参数决定：默认丢弃新结果并计数，也可设为阻塞等待队列空出位置
+"""
+from __future__ import absolute_import
+
+import atexit
+import io
+import logging
+import os
+import sys
+import threading
+
+import six
+from six.moves import queue
+
+from . import clock
+
+LOG = logging.getLogger(__name__)
+
+_STOP = object()  # 通知后台线程退出的哨兵
+
+
+class TextItem(object):
+    """已渲染好的文本结果"""
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        """
+        :param str text: 文本
+        """
+        self.text = text
+
+    def render(self):
+        """
+        :return: 需写入输出目标的文本
+        :rtype: str
+        """
+        return self.text
+
+
+class ProfileItem(object):
+    """分析器的结果快照，在后台线程中渲染"""
+    __slots__ = ('decorator', 'snapshot')
+
+    def __init__(self, decorator, snapshot):
+        """
+        :param moprofiler.base.ProfilerClassDecorator decorator: 分析器的类装饰器
+        :param snapshot: 由 :py:meth:`~moprofiler.base.ProfilerClassDecorator.snapshot_stats` 获取的快照
+        """
+        self.decorator = decorator
+        self.snapshot = snapshot
+
+    def render(self):
+        """
+        :return: 需写入输出目标的文本
+        :rtype: str
+        """
+        stream = six.StringIO()
+        self.decorator.render_stats(self.snapshot, stream)
+        return stream.getvalue()
+
+
+class LogItem(object):
+    """
+    秒表的日志记录
+
+    日志记录在调用线程中创建，故记录的时间、线程等信息与同步输出时一致，
+    仅由后台线程交给原 logger 的处理器处理，不写入输出器的输出目标
+    """
+    __slots__ = ('logger', 'record')
+
+    def __init__(self, logger, level, msg, extra=None):
+        """
+        :param logging.Logger logger: 用来日志输出的 logger
+        :param int level: 日志输出级别
+        :param msg: 日志消息
+        :param dict extra: 附带在日志记录上的额外属性
+        """
+        self.logger = getattr(logger, 'logger', logger)  # 兼容 logging.LoggerAdapter
+        self.record = self.logger.makeRecord(
+            self.logger.name, level, '(unknown file)', 0, msg, (), None, extra=extra)
+
+    def render(self):
+        """
+        交给 logger 处理
+
+        :return: 无需写入输出目标，返回 None
+        """
+        self.logger.handle(self.record)
+
+
+class Exporter(object):
+    """
+    后台输出器
+
+    输出目标可为:
+
+    #. ``None`` : 默认值，写入 stdout
+    #. 文件路径: 以追加方式写入
+    #. ``logging.Logger`` : 每个结果作为一条日志输出
+    #. 具有 ``write`` 方法的文件对象
+
+    后台线程在首次提交结果时启动，在 ``fork`` 后的子进程中首次提交时重新启动，并在解释器退出前输出剩余结果
+    """
+
+    def __init__(self, target=None, level=logging.INFO, max_size=10000, block=False,
+                 batch_size=256):
+        """
+        :param target: 输出目标
+        :type target: str or logging.Logger or object
+        :param int level: 输出目标为 logger 时的日志级别，默认为 INFO
+        :param int max_size: 队列的最大长度
+        :param bool block: 队列已满时是否阻塞等待，默认为 False ，即丢弃新结果并计入 :py:attr:`dropped`
+        :param int batch_size: 每批最多写入的结果数
+        """
+        self.target = target
+        self.level = level
+        self.max_size = max_size
+        self.block = block
+        self.batch_size = batch_size
+        self.dropped = 0  #: 因队列已满而被丢弃的结果数
+        self._lock = threading.Lock()
+        self._pid = None
+        self._atexit_registered = False
+        self._queue = None  # type: queue.Queue
+        self._thread = None  # type: threading.Thread
+
+    def _ensure_started(self):
+        """启动后台线程，若进程号变化（即发生了 ``fork`` ）则重新启动"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if not self._atexit_registered:
+                atexit.register(self.close)
+                self._atexit_registered = True
+            self._queue = queue.Queue(self.max_size)
+            self._thread = threading.Thread(target=self._run, name='moprofiler-exporter')
+            self._thread.daemon = True
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def submit(self, item):
+        """
+        提交一个结果
+
+        :param item: 具有 ``render`` 方法的结果对象，或直接传入文本
+        :return: 是否成功放入队列
+        :rtype: bool
+        """
+        if isinstance(item, six.string_types):
+            item = TextItem(item)
+        self._ensure_started()
+        try:
+            self._queue.put(item, self.block)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def flush(self, timeout=None):
+        """
+        等待已提交的结果全部写入
+
+        :param float timeout: 最长等待时间，单位 ``s`` ，默认一直等待
+        :return: 是否已全部写入
+        :rtype: bool
+        """
+        if self._pid != os.getpid():
+            return True
+        now = clock.CLOCKS['monotonic_ns']
+        deadline = None if timeout is None else now() + int(timeout * clock.NS_PER_SEC)
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                if deadline is None:
+                    self._queue.all_tasks_done.wait()
+                    continue
+                remaining = clock.ns_to_sec(deadline - now())
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout=None):
+        """
+        写入剩余结果并停止后台线程，之后再次提交时将重新启动
+
+        :param float timeout: 最长等待时间，单位 ``s`` ，默认一直等待
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            self._pid = None
+            self._queue.put(_STOP)
+            thread = self._thread
+        thread.join(timeout)
+
+    def _run(self):
+        """后台线程，批量取出结果并写入"""
+        _queue = self._queue
+        while True:
+            batch = [_queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(_queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = _STOP in batch
+            try:
+                self._write([item for item in batch if item is not _STOP])
+            finally:
+                for _item in batch:
+                    _queue.task_done()
+            if stop:
+                return
+
+    def _write(self, batch):
+        """
+        渲染并写入一批结果
+
+        :param list batch: 结果列表
+        """
+        texts = []
+        for item in batch:
+            try:
+                text = item.render()
+            except Exception:  # pylint: disable=W0703
+                LOG.exception('渲染结果失败: %r', item)
+                continue
+            if text:
+                texts.append(text)
+        if not texts:
+            return
+        try:
+            self._write_target(texts)
+        except Exception:  # pylint: disable=W0703
+            LOG.exception('写入结果失败: %r', self.target)
+
+    def _write_target(self, texts):
+        """
+        将文本写入输出目标
+
+        :param list texts: 文本列表
+        """
+        if isinstance(self.target, (logging.Logger, logging.LoggerAdapter)):
+            for text in texts:
+                self.target.log(self.level, text.rstrip('\n'))
+            return
+        if isinstance(self.target, six.string_types):
+            with io.open(self.target, 'a', encoding='utf-8') as stream:
+                stream.write(six.ensure_text(''.join(texts)))
+            return
+        stream = self.target or sys.stdout
+        stream.write(''.join(texts))
+        if hasattr(stream, 'flush'):
+            stream.flush()
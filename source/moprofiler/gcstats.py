@@ -0,0 +1,223 @@
+# encoding=utf8
+"""
+提供基于 ``gc.callbacks`` 的垃圾回收统计
+
+热点函数中大量创建临时对象时，会频繁触发垃圾回收，其中第 2 代回收需遍历所有被追踪的对象，
+往往是偶发延迟尖刺的来源，而这部分耗时在秒表与分析器的输出中无从区分。
+
+:py:class:`GCMonitor` 在有观察进行时向 ``gc.callbacks`` 注册回调，按代统计回收次数、回收的对象数、
+无法回收的对象数及回收造成的暂停时间，并记录到所有进行中的观察。
+垃圾回收执行时持有 GIL ，会暂停进程内所有 Python 线程，故一次回收会同时计入所有进行中的观察，
+而不仅是触发回收的线程。
+
+可通过秒表或时间/内存分析器的 ``print_gc`` 参数开启，也可直接使用::
+
+    with gcstats.MONITOR.observe() as stats:
+        do_something()
+    print(stats.total_pause_ns)
+"""
+from __future__ import absolute_import
+
+import gc
+import threading
+from contextlib import contextmanager
+
+from . import clock
+
+GENERATIONS = 3  #: 垃圾回收的代数
+
+
+class GCStats(object):
+    """
+    垃圾回收统计，各字段均为按代排列的列表
+    """
+    __slots__ = ('collections', 'collected', 'uncollectable', 'pause_ns')
+
+    def __init__(self):
+        self.collections = [0] * GENERATIONS  #: 回收次数
+        self.collected = [0] * GENERATIONS  #: 回收的对象数
+        self.uncollectable = [0] * GENERATIONS  #: 无法回收的对象数
+        self.pause_ns = [0] * GENERATIONS  #: 回收造成的暂停时间，单位 ``ns``
+
+    def add(self, generation, collected, uncollectable, pause_ns):
+        """
+        记录一次回收
+
+        :param int generation: 回收的代
+        :param int collected: 回收的对象数
+        :param int uncollectable: 无法回收的对象数
+        :param int pause_ns: 暂停时间，单位 ``ns``
+        """
+        self.collections[generation] += 1
+        self.collected[generation] += collected
+        self.uncollectable[generation] += uncollectable
+        self.pause_ns[generation] += pause_ns
+
+    def merge(self, other):
+        """
+        合并另一份统计
+
+        :param GCStats other: 另一份统计
+        """
+        for name in self.__slots__:
+            mine, theirs = getattr(self, name), getattr(other, name)
+            for i in range(GENERATIONS):
+                mine[i] += theirs[i]
+
+    def copy(self):
+        """
+        :rtype: GCStats
+        """
+        stats = GCStats()
+        stats.merge(self)
+        return stats
+
+    @property
+    def total_collections(self):
+        """
+        各代回收次数之和
+
+        :rtype: int
+        """
+        return sum(self.collections)
+
+    @property
+    def total_collected(self):
+        """
+        各代回收的对象数之和
+
+        :rtype: int
+        """
+        return sum(self.collected)
+
+    @property
+    def total_pause_ns(self):
+        """
+        各代暂停时间之和，单位 ``ns``
+
+        :rtype: int
+        """
+        return sum(self.pause_ns)
+
+    def as_fields(self):
+        """
+        转换为秒表输出模板中使用的变量
+
+        :return: 包含 ``gc_collections`` 、 ``gc_collected`` 、 ``gc_uncollectable`` 、
+            ``gc_pause`` 、 ``gc_pause_ns`` 各代之和，以及 ``gc0_collections`` 、 ``gc2_pause`` 等按代的变量
+        :rtype: dict
+        """
+        fields = {
+            'gc_collections': self.total_collections,
+            'gc_collected': self.total_collected,
+            'gc_uncollectable': sum(self.uncollectable),
+            'gc_pause_ns': self.total_pause_ns,
+            'gc_pause': clock.ns_to_sec(self.total_pause_ns),
+        }
+        for i in range(GENERATIONS):
+            prefix = 'gc{}_'.format(i)
+            fields[prefix + 'collections'] = self.collections[i]
+            fields[prefix + 'collected'] = self.collected[i]
+            fields[prefix + 'uncollectable'] = self.uncollectable[i]
+            fields[prefix + 'pause_ns'] = self.pause_ns[i]
+            fields[prefix + 'pause'] = clock.ns_to_sec(self.pause_ns[i])
+        return fields
+
+    def format(self):
+        """
+        格式化为一行文本，用于分析器的结果输出
+
+        :rtype: str
+        """
+        return 'GC 回收次数: {}, 回收对象: {}, 暂停: {:.6f}s ({})\n'.format(
+            self.total_collections, self.total_collected, clock.ns_to_sec(self.total_pause_ns),
+            ', '.join('第{}代: {}次/{}个/{:.6f}s'.format(
+                i, self.collections[i], self.collected[i], clock.ns_to_sec(self.pause_ns[i]))
+                for i in range(GENERATIONS)))
+
+
+class GCMonitor(object):
+    """
+    垃圾回收监视器
+
+    有观察进行时向 ``gc.callbacks`` 注册回调，没有观察时移除，不产生开销。
+    回调中可能因任意一次内存分配而被触发，故不获取任何锁，仅读取以不可变元组保存的进行中观察
+    """
+
+    def __init__(self, clock_func=None):
+        """
+        :param function clock_func: 测量暂停时间使用的时钟，返回整数纳秒，默认为 ``perf_counter_ns``
+        """
+        self.clock = clock_func or clock.CLOCKS['perf_counter_ns']
+        self._lock = threading.Lock()
+        self._active = ()  # 进行中的观察，仅在持有锁时整体替换
+        self._started = None  # 当前回收的开始时刻
+        self._installed = False
+
+    def start(self):
+        """
+        开始一次观察
+
+        :rtype: GCStats
+        """
+        stats = GCStats()
+        with self._lock:
+            self._active += (stats,)
+            if not self._installed:
+                gc.callbacks.append(self._callback)
+                self._installed = True
+        return stats
+
+    def stop(self, stats):
+        """
+        结束一次观察
+
+        :param GCStats stats: :py:meth:`start` 返回的统计
+        :rtype: GCStats
+        """
+        with self._lock:
+            self._active = tuple(s for s in self._active if s is not stats)
+            if not self._active and self._installed:
+                try:
+                    gc.callbacks.remove(self._callback)
+                except ValueError:  # pragma: no cover
+                    pass
+                self._installed = False
+        return stats
+
+    @contextmanager
+    def observe(self):
+        """
+        在上下文中进行一次观察
+
+        :return: 统计，退出上下文后完整
+        :rtype: Iterator[GCStats]
+        """
+        stats = self.start()
+        try:
+            yield stats
+        finally:
+            self.stop(stats)
+
+    def _callback(self, phase, info):
+        """
+        ``gc.callbacks`` 回调
+
+        :param str phase: ``start`` 或 ``stop``
+        :param dict info: 回收信息
+        """
+        if phase == 'start':
+            self._started = self.clock()
+            return
+        started, self._started = self._started, None
+        if started is None:  # 回调在回收进行中注册
+            return
+        pause_ns = self.clock() - started
+        generation = info['generation']
+        collected = info.get('collected', 0)
+        uncollectable = info.get('uncollectable', 0)
+        for stats in self._active:
+            stats.add(generation, collected, uncollectable, pause_ns)
+
+
+MONITOR = GCMonitor()  #: 进程内共享的垃圾回收监视器
@@ -0,0 +1,426 @@
+# encoding=utf8
+"""
+提供无需逐个装饰函数的模块级插桩
+
+使用时间/内存/采样分析器或秒表时，需修改源码逐个装饰函数。
+:py:class:`Instrumenter` 可在导入时为名称匹配通配符的模块中定义的所有函数及方法自动套上分析器，
+从而在压测等场景下无需修改代码即可分析整个子系统::
+
+    from moprofiler import instrument
+
+    instrument.instrument(
+        ['myapp.services', 'myapp.services.*'], exclude=['myapp.services.legacy*'])
+    import myapp.services  # 导入时插桩
+
+    ...
+    registry.REGISTRY.print_report()
+
+插桩规则如下:
+
+#. ``patterns`` 与 ``exclude`` 为模块名的通配符（ :py:mod:`fnmatch` 语法），如 ``myapp.*`` 匹配 ``myapp`` 的所有子模块，
+   二者均可以 ``模块名:限定名`` 的形式指定单个函数或方法，如 ``myapp.db:Session.*`` ，
+   ``patterns`` 中以该形式指定时仅插桩匹配的函数/方法，而非整个模块
+#. 仅插桩在该模块中定义的函数、类中的实例方法/类方法/静态方法及嵌套类中的方法，从其他模块导入的对象保持不变；
+   ``__init__`` 与 ``__call__`` 以外的特殊方法不插桩
+#. 同一模块中的函数共用一个分析器，逐行统计合并为一份，并以模块为单位加入分析器注册表；
+   各函数仅在首次调用时向分析器登记一次，此后每次调用不再有额外的登记开销
+#. 使用秒表时，秒表名称默认为函数/方法的限定名，如 ``Session.commit``
+#. 开始插桩时已导入的匹配模块会被立即插桩，但其他模块在此之前通过 ``from ... import`` 获取的函数引用不受影响，
+   故应尽早开始插桩
+#. 作为 ``__main__`` 运行的脚本或模块不经过导入，需以 :py:meth:`Instrumenter.namespace` 创建的命名空间执行其代码，
+   其中的函数及类在定义时即被插桩
+"""
+from __future__ import absolute_import
+
+import fnmatch
+import inspect
+import logging
+import sys
+import threading
+import types
+
+import six
+
+from . import base
+from . import registry as _registry
+from .memory import MemoryProfiler
+from .sampler import SamplingProfiler
+from .stopwatch import stopwatch
+from .time import TimeProfiler
+
+LOG = logging.getLogger(__name__)
+
+PROFILER_TIME = 'time'  #: 时间分析器
+PROFILER_MEMORY = 'memory'  #: 内存分析器
+PROFILER_SAMPLING = 'sampling'  #: 采样分析器
+PROFILER_STOPWATCH = 'stopwatch'  #: 秒表
+PROFILERS = (PROFILER_TIME, PROFILER_MEMORY, PROFILER_SAMPLING, PROFILER_STOPWATCH)
+
+#: 会被插桩的特殊方法
+_DUNDER_ALLOWED = ('__init__', '__call__')
+
+
+def get_decorator_class(profiler):
+    """
+    获取分析器名称对应的类装饰器
+
+    :param str profiler: 分析器名称，可选 ``time`` 、 ``memory`` 、 ``sampling``
+    :rtype: type
+    """
+    return {
+        PROFILER_TIME: TimeProfiler,
+        PROFILER_MEMORY: MemoryProfiler,
+        PROFILER_SAMPLING: SamplingProfiler,
+    }[profiler]
+
+
+class ModuleProfile(object):
+    """
+    一个模块中被插桩函数共用的分析器
+
+    模块中的每个函数仍由各自的分析器类装饰器封装，从而保留协程、采样策略等处理，
+    但这些类装饰器共用由首个类装饰器创建的同一个分析器实例，且不加入全局注册表，而是由本对象代表整个模块加入
+    """
+
+    def __init__(self, module, decorator_class, registry=None, name=None, **options):
+        """
+        :param types.ModuleType module: 被插桩的模块
+        :param type decorator_class: 分析器的类装饰器
+        :param moprofiler.registry.ProfilerRegistry registry: 加入的分析器注册表，默认为全局注册表
+        :param str name: 报告中显示的模块名，默认为模块的 ``__name__``
+        :param dict options: 分析器类装饰器的参数
+        """
+        self.func = module  #: 被插桩的模块，注册表据此判断是否已有被分析的对象
+        self.name = name or module.__name__  #: 模块名
+        self.report_kind = decorator_class.report_kind  #: 合并报告中的统计类型
+        self.decorators = []  #: 模块中各函数的类装饰器
+        self.profiler = None  #: 模块共用的分析器
+        self._decorator_class = decorator_class
+        self._options = dict(options, print_res=options.get('print_res', False))
+        self._private = _registry.ProfilerRegistry()
+        (registry or _registry.REGISTRY).register(self)
+
+    def wrap(self, func):
+        """
+        使用模块共用的分析器封装一个函数
+
+        :param function func: 被插桩的函数
+        :rtype: moprofiler.base.ProfilerClassDecorator
+        """
+        decorator = self._decorator_class(
+            func, registry=self._private, profiler=self.profiler, **self._options)
+        self.profiler = decorator.profiler
+        self.decorators.append(decorator)
+        return decorator
+
+    def line_records(self):
+        """
+        获取模块的逐行统计记录
+
+        :rtype: Iterator[moprofiler.registry.LineRecord]
+        """
+        if not self.decorators:
+            return iter(())
+        return self.decorators[0].line_records()
+
+    def print_stats(self):
+        """打印模块的统计结果"""
+        if self.decorators:
+            self.decorators[0].print_stats()
+
+    def reset_stats(self):
+        """清空统计结果，各函数在下次调用时向新的分析器重新登记"""
+        self.profiler = None
+        for decorator in self.decorators:
+            decorator.reset_stats(self.profiler)
+            self.profiler = decorator.profiler
+
+
+class _Loader(object):
+    """在模块执行完毕后对其插桩的加载器代理"""
+
+    def __init__(self, loader, instrumenter):
+        self._loader = loader
+        self._instrumenter = instrumenter
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        """由原加载器创建模块"""
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        """由原加载器执行模块后插桩"""
+        self._loader.exec_module(module)
+        self._instrumenter.instrument_module(module)
+
+
+class _Finder(object):
+    """为匹配的模块替换加载器的查找器，需置于 ``sys.meta_path`` 的最前面"""
+
+    def __init__(self, instrumenter):
+        self._instrumenter = instrumenter
+
+    def find_spec(self, fullname, path=None, target=None):
+        """
+        查找模块
+
+        :return: 模块名匹配时，返回由其余查找器找到、加载器被替换后的模块规格，否则返回 None 交由其余查找器处理
+        """
+        if not self._instrumenter.matches(fullname):
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                    spec.loader = _Loader(spec.loader, self._instrumenter)
+                return spec
+        return None
+
+
+class _Namespace(dict):
+    """
+    在函数及类被定义时即对其插桩的命名空间
+
+    以本对象作为全局命名空间通过 ``exec`` 执行模块代码时，顶层的赋值（包括函数及类的定义）均经过 ``__setitem__`` ，
+    写入的值同时同步到模块的 ``__dict__`` ，使 ``import __main__`` 等方式获取的模块属性保持一致
+    """
+
+    def __init__(self, module, instrument_attr):
+        """
+        :param types.ModuleType module: 代码所属的模块
+        :param function instrument_attr: 以属性名及属性值调用，返回插桩后的属性值
+        """
+        super(_Namespace, self).__init__(vars(module))
+        self._module = module
+        self._instrument_attr = instrument_attr
+
+    def __setitem__(self, key, value):
+        value = self._instrument_attr(key, value)
+        super(_Namespace, self).__setitem__(key, value)
+        vars(self._module)[key] = value
+
+    def __delitem__(self, key):
+        super(_Namespace, self).__delitem__(key)
+        vars(self._module).pop(key, None)
+
+
+class Instrumenter(object):
+    """模块插桩器"""
+
+    def __init__(self, patterns, exclude=(), profiler=PROFILER_TIME, registry=None, **options):
+        """
+        :param list[str] patterns: 需插桩的模块名通配符，或 ``模块名:限定名`` 形式的函数/方法通配符
+        :param list[str] exclude: 排除的模块名通配符，或 ``模块名:限定名`` 形式的函数/方法通配符
+        :param str profiler: 使用的分析器，可选 ``time`` 、 ``memory`` 、 ``sampling`` 、 ``stopwatch`` ，
+            默认为 ``time``
+        :param registry: 各模块分析器加入的注册表，默认为全局注册表；使用秒表时为聚合模式使用的统计量注册表
+        :type registry: moprofiler.registry.ProfilerRegistry or moprofiler.stats.StatsRegistry
+        :param dict options: 分析器类装饰器或秒表的参数，分析器默认不在每次调用后输出结果
+        """
+        if profiler not in PROFILERS:
+            raise ValueError('不支持的分析器: {}'.format(profiler))
+        if isinstance(patterns, six.string_types):
+            patterns = [patterns]
+        if isinstance(exclude, six.string_types):
+            exclude = [exclude]
+        self.patterns = [p for p in patterns if ':' not in p]  #: 需插桩的模块名通配符
+        self.include_functions = [p for p in patterns if ':' in p]  #: 需插桩的函数/方法通配符
+        self._include_modules = [p.split(':', 1)[0] for p in self.include_functions]
+        self.exclude_modules = [p for p in exclude if ':' not in p]  #: 排除的模块名通配符
+        self.exclude_functions = [p for p in exclude if ':' in p]  #: 排除的函数/方法通配符
+        self.profiler = profiler
+        self.registry = registry
+        self.options = options
+        self.profiles = {}  #: 模块名到 :py:class:`ModuleProfile` 的映射，使用秒表时为空
+        self.instrumented = {}  #: 模块名到已插桩的函数/方法限定名列表的映射
+        self._finder = None
+        self._lock = threading.RLock()
+
+    def matches(self, module_name):
+        """
+        判断模块是否需要插桩
+
+        :param str module_name: 模块名
+        :rtype: bool
+        """
+        include = self.patterns + self._include_modules
+        return (module_name.split('.', 1)[0] != 'moprofiler' and
+                any(fnmatch.fnmatchcase(module_name, p) for p in include) and
+                not any(fnmatch.fnmatchcase(module_name, p) for p in self.exclude_modules))
+
+    def _excluded(self, module_name, qualname):
+        """
+        :return: 函数/方法是否被排除
+        :rtype: bool
+        """
+        name = '{}:{}'.format(module_name, qualname)
+        return any(fnmatch.fnmatchcase(name, p) for p in self.exclude_functions)
+
+    def _selected(self, module_name, qualname):
+        """
+        :return: 函数/方法是否需要插桩
+        :rtype: bool
+        """
+        if self._excluded(module_name, qualname):
+            return False
+        name = '{}:{}'.format(module_name, qualname)
+        return (any(fnmatch.fnmatchcase(module_name, p) for p in self.patterns) or
+                any(fnmatch.fnmatchcase(name, p) for p in self.include_functions))
+
+    def install(self):
+        """
+        开始插桩：在 ``sys.meta_path`` 最前面加入查找器，并对已导入的匹配模块插桩
+
+        :rtype: Instrumenter
+        """
+        with self._lock:
+            if self._finder is None:
+                self._finder = _Finder(self)
+                sys.meta_path.insert(0, self._finder)
+        for name, module in list(sys.modules.items()):
+            # 作为 __main__ 运行的脚本或模块需通过 namespace 插桩
+            if module is not None and name != '__main__' and self.matches(name):
+                self.instrument_module(module)
+        return self
+
+    def uninstall(self):
+        """停止对之后导入的模块插桩，已插桩的函数保持不变"""
+        with self._lock:
+            if self._finder is not None:
+                sys.meta_path.remove(self._finder)
+                self._finder = None
+
+    def _wrapper(self, module, name):
+        """
+        :param types.ModuleType module: 模块
+        :param str name: 模块名
+        :return: 用于封装该模块中函数的方法
+        :rtype: function
+        """
+        if self.profiler == PROFILER_STOPWATCH:
+            options = dict(self.options)
+            if self.registry is not None:
+                options['registry'] = self.registry
+            return lambda func: stopwatch(
+                func, **dict(options, name=options.get('name') or base.qualified_name(func)))
+        profile = self.profiles.get(name)
+        if profile is None:
+            profile = self.profiles[name] = ModuleProfile(
+                module, get_decorator_class(self.profiler), self.registry, name, **self.options)
+        return profile.wrap
+
+    def instrument_module(self, module):
+        """
+        对模块中定义的函数及方法插桩，同一模块仅插桩一次
+
+        :param types.ModuleType module: 模块
+        :return: 已插桩的函数/方法限定名列表
+        :rtype: list[str]
+        """
+        name = module.__name__
+        with self._lock:
+            if name in self.instrumented:
+                return self.instrumented[name]
+            done = self.instrumented[name] = []
+            wrap = self._wrapper(module, name)
+            self._instrument_namespace(
+                module, name, '', wrap, lambda qualname: self._selected(name, qualname), done)
+        LOG.debug('已插桩模块 %s 中的 %s 个函数/方法', name, len(done))
+        return done
+
+    def namespace(self, module, name=None, whole=False):
+        """
+        创建在定义时即对函数及类插桩的命名空间
+
+        作为 ``__main__`` 运行的脚本或模块不经过导入，无法在导入时插桩，且其顶层代码往往在定义函数后即调用，
+        故需以本方法返回的命名空间作为全局命名空间，通过 ``exec`` 执行其代码
+
+        :param types.ModuleType module: 代码所属的模块，其已有属性会复制到命名空间中
+        :param str name: 用于匹配通配符及在报告中显示的模块名，默认为模块的 ``__name__`` ，
+            如以 ``-m`` 运行的模块，其 ``__name__`` 为 ``__main__`` ，此处应为其原本的模块名
+        :param bool whole: 是否不论 ``patterns`` 插桩其中的全部函数及方法，仍会排除 ``exclude`` 中的函数/方法
+        :return: 模块无需插桩时返回模块的 ``__dict__``
+        :rtype: dict
+        """
+        name = name or module.__name__
+        if not whole and not self.matches(name):
+            return vars(module)
+        with self._lock:
+            done = self.instrumented.setdefault(name, [])
+            wrap = self._wrapper(module, name)
+
+        def selected(qualname):
+            """判断函数/方法是否需要插桩"""
+            return not self._excluded(name, qualname) if whole else self._selected(name, qualname)
+
+        def instrument_attr(attr, value):
+            """对顶层定义的函数及类插桩"""
+            if attr.startswith('__') and attr.endswith('__') and attr not in _DUNDER_ALLOWED:
+                return value
+            return self._instrument_attr(False, attr, value, module.__name__, wrap, selected, done)
+        return _Namespace(module, instrument_attr)
+
+    def _instrument_namespace(self, owner, module_name, prefix, wrap, selected, done):
+        """
+        对模块或类的命名空间插桩
+
+        :param owner: 模块或类
+        :param str module_name: 模块名，仅插桩在该模块中定义的对象
+        :param str prefix: 限定名前缀
+        :param function wrap: 封装函数的方法
+        :param function selected: 以限定名调用，判断函数/方法是否需要插桩
+        :param list done: 已插桩的限定名列表
+        """
+        is_class = inspect.isclass(owner)
+        for attr, value in list(vars(owner).items()):
+            if attr.startswith('__') and attr.endswith('__') and attr not in _DUNDER_ALLOWED:
+                continue
+            wrapped = self._instrument_attr(
+                is_class, prefix + attr, value, module_name, wrap, selected, done)
+            if wrapped is not value:
+                setattr(owner, attr, wrapped)
+
+    def _instrument_attr(self, is_class, qualname, value, module_name, wrap, selected, done):
+        """
+        对命名空间中的一个属性插桩，属性为类时对类的命名空间插桩
+
+        :param bool is_class: 属性是否属于类
+        :param str qualname: 属性的限定名
+        :param value: 属性值
+        :return: 插桩后的属性值，无需插桩时原样返回
+        """
+        if inspect.isclass(value):
+            if value.__module__ == module_name and value.__qualname__ == qualname:
+                self._instrument_namespace(value, module_name, qualname + '.', wrap, selected, done)
+            return value
+        if is_class and isinstance(value, (staticmethod, classmethod)):
+            func, rewrap = value.__func__, type(value)
+        elif isinstance(value, types.FunctionType):
+            func, rewrap = value, None
+        else:
+            return value
+        if func.__module__ != module_name or not selected(qualname):
+            return value
+        wrapped = wrap(func)
+        done.append(qualname)
+        return rewrap(wrapped) if rewrap else wrapped
+
+
+def instrument(patterns, exclude=(), profiler=PROFILER_TIME, registry=None, **options):
+    """
+    创建插桩器并开始插桩
+
+    :param list[str] patterns: 需插桩的模块名通配符，或 ``模块名:限定名`` 形式的函数/方法通配符
+    :param list[str] exclude: 排除的模块名通配符，或 ``模块名:限定名`` 形式的函数/方法通配符
+    :param str profiler: 使用的分析器，可选 ``time`` 、 ``memory`` 、 ``sampling`` 、 ``stopwatch`` ，
+        默认为 ``time``
+    :param registry: 各模块分析器加入的注册表，默认为全局注册表；使用秒表时为聚合模式使用的统计量注册表
+    :type registry: moprofiler.registry.ProfilerRegistry or moprofiler.stats.StatsRegistry
+    :param dict options: 分析器类装饰器或秒表的参数
+    :rtype: Instrumenter
+    """
+    return Instrumenter(patterns, exclude, profiler, registry, **options).install()
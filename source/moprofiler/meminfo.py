@@ -0,0 +1,183 @@
+# encoding=utf8
+"""
+提供秒表使用的内存采样后端
+
+所有后端均返回以 ``Byte`` 为单位的整数，可选后端如下:
+
+#. ``statm`` : 直接读取 ``/proc/self/statm`` 中的常驻内存页数，仅 Linux 可用，开销最低
+#. ``psutil`` : 通过缓存的 ``psutil.Process`` 句柄读取进程的 ``rss``
+#. ``tracemalloc`` : 读取 ``tracemalloc`` 当前追踪到的 Python 内存分配量，未启动追踪时将自动启动
+#. ``auto`` : 默认值，优先使用 ``statm`` ，不可用时回退为 ``psutil``
+
+进程句柄与文件描述符均会在 ``fork`` 之后于子进程中重建，避免读到父进程的内存信息
+"""
+from __future__ import absolute_import
+
+import os
+import threading
+
+import psutil
+
+from .memory import _process_backend
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+BACKEND_DEFAULT = 'auto'  #: 默认使用的内存采样后端
+STATM_PATH = '/proc/self/statm'  #: Linux 下记录进程内存页信息的文件
+BYTES_PER_MB = 1 << 20  #: 每 MB 对应的字节数
+
+
+class ProcessHandle(object):
+    """
+    缓存的进程句柄
+
+    首次使用时创建 ``psutil.Process`` 及 ``statm`` 文件描述符，之后直接复用，
+    当发现当前进程号变化（即发生了 ``fork`` ）时重建
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._process = None  # type: psutil.Process
+        self._statm_fd = None
+        self._page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+    def reset(self):
+        """
+        丢弃缓存的句柄，下次使用时重建
+
+        会在 ``fork`` 后的子进程中自动调用，此时父进程中的其他线程可能正持有锁，故同时重建锁
+        """
+        self._lock = threading.Lock()
+        fd, self._statm_fd = self._statm_fd, None
+        if fd is not None:
+            try:
+                os.close(fd)
+            except OSError:  # pragma: no cover
+                pass
+        self._pid = None
+        self._process = None
+
+    def _check_pid(self):
+        """进程号变化时丢弃旧句柄"""
+        if self._pid != os.getpid():
+            self.reset()
+            self._pid = os.getpid()
+
+    @property
+    def process(self):
+        """
+        当前进程的 ``psutil.Process`` 句柄
+
+        :rtype: psutil.Process
+        """
+        self._check_pid()
+        if self._process is None:
+            self._process = psutil.Process(self._pid)
+        return self._process
+
+    @property
+    def statm_fd(self):
+        """
+        以只读方式打开的 ``/proc/self/statm`` 文件描述符
+
+        :rtype: int
+        """
+        self._check_pid()
+        if self._statm_fd is None:
+            with self._lock:
+                if self._statm_fd is None:
+                    self._statm_fd = os.open(STATM_PATH, os.O_RDONLY)
+        return self._statm_fd
+
+    def rss_psutil(self):
+        """
+        通过 ``psutil`` 获取进程常驻内存
+
+        :return: 常驻内存，单位 ``Byte``
+        :rtype: int
+        """
+        return self.process.memory_info().rss
+
+    def rss_statm(self):
+        """
+        通过 ``/proc/self/statm`` 获取进程常驻内存
+
+        :return: 常驻内存，单位 ``Byte``
+        :rtype: int
+        """
+        fd = self.statm_fd
+        if hasattr(os, 'pread'):
+            data = os.pread(fd, 128, 0)
+        else:  # pragma: no cover
+            os.lseek(fd, 0, os.SEEK_SET)
+            data = os.read(fd, 128)
+        return int(data.split()[1]) * self._page_size
+
+
+PROCESS = ProcessHandle()  #: 进程级共享的进程句柄
+
+if hasattr(os, 'register_at_fork'):  # pragma: no cover
+    os.register_at_fork(after_in_child=PROCESS.reset)
+
+
+def traced_memory():
+    """
+    获取 ``tracemalloc`` 当前追踪到的内存分配量
+
+    :return: 当前已分配内存，单位 ``Byte``
+    :rtype: int
+    """
+    return tracemalloc.get_traced_memory()[0]
+
+
+def _statm_available():
+    """
+    判断当前平台能否读取 ``statm``
+
+    :rtype: bool
+    """
+    try:
+        PROCESS.rss_statm()
+    except (OSError, IOError, IndexError, ValueError):
+        return False
+    return True
+
+
+def get_sampler(backend=None):
+    """
+    获取内存采样函数
+
+    :param str backend: 后端名称，可选 ``auto`` 、 ``statm`` 、 ``psutil`` 、 ``tracemalloc`` ，默认为 ``auto``
+    :return: 无参数、返回字节数的采样函数
+    :rtype: function
+    :raises ValueError: 后端名称未知或当前平台不支持
+    """
+    backend = backend or BACKEND_DEFAULT
+    if backend == 'auto':
+        backend = 'statm' if _statm_available() else 'psutil'
+    if backend == 'statm':
+        if not _statm_available():
+            raise ValueError('当前平台不支持 statm 内存采样后端')
+        return PROCESS.rss_statm
+    if backend == 'psutil':
+        return PROCESS.rss_psutil
+    if backend == 'tracemalloc':
+        if _process_backend('tracemalloc') != 'tracemalloc':  # pragma: no cover
+            raise ValueError('当前 Python 版本不支持 tracemalloc 内存采样后端')
+        return traced_memory
+    raise ValueError('不支持的内存采样后端: {}'.format(backend))
+
+
+def bytes_to_mb(size):
+    """
+    将字节数换算为 MB
+
+    :param int size: 字节数
+    :return: MB
+    :rtype: float
+    """
+    return size / float(BYTES_PER_MB)
@@ -5,11 +5,12 @@
 from __future__ import absolute_import
 
 import logging
+import sys
 import types  # pylint: disable=W0611
 
 from memory_profiler import LineProfiler, choose_backend, show_results
 
-from . import base
+from . import allocation, base, registry
 
 try:
     import tracemalloc
@@ -20,6 +21,10 @@ except ImportError:  # pragma: no cover
 
 LOG = logging.getLogger(__name__)
 
+MODE_LINE = 'line'  #: 逐行分析模式
+MODE_ALLOCATION = 'allocation'  #: 分配分析模式
+MODES = (MODE_LINE, MODE_ALLOCATION)
+
 
 class MemoryProfilerWrapper(LineProfiler):
     """
@@ -36,6 +41,40 @@ class MemoryProfilerWrapper(LineProfiler):
         """
         show_results(self, stream=stream, precision=precision)
 
+    def snapshot(self):
+        """
+        获取当前统计结果的快照
+
+        :rtype: MemoryStatsSnapshot
+        """
+        return MemoryStatsSnapshot(self)
+
+
+class MemoryStatsSnapshot(object):
+    """
+    内存分析结果的快照
+
+    复制分析器中各代码块的逐行内存记录，可与分析器一样传给 ``show_results`` 输出
+    """
+
+    def __init__(self, profiler):
+        """
+        :param LineProfiler profiler: 内存分析器
+        """
+        self.code_map = _FrozenCodeMap(
+            (filename, list(lines)) for filename, lines in profiler.code_map.items())
+
+
+class _FrozenCodeMap(list):
+    """提供与 ``CodeMap.items`` 相同接口的代码块列表"""
+
+    def items(self):
+        """
+        :return: 依次产出 ``(文件名, 逐行记录)``
+        :rtype: Iterator[tuple]
+        """
+        return iter(self)
+
 
 def _process_backend(backend='psutil'):
     """
@@ -55,10 +94,13 @@ def _process_backend(backend='psutil'):
 class MemoryProfiler(base.ProfilerClassDecorator):
     """内存分析器的类装饰器"""
     profiler_factory = MemoryProfilerWrapper
+    report_kind = registry.KIND_MEMORY
 
     def __init__(
             self, _function=None, stream=None,
-            precision=1, backend='psutil', **kwargs):
+            precision=1, backend='psutil', mode=MODE_LINE, frames=1, group_by='lineno',
+            top=allocation.TOP_DEFAULT, sort_by='size', exclude_stdlib=True, exclude_self=True,
+            **kwargs):
         """
         内存分析器的类装饰器
 
@@ -66,22 +108,105 @@ class MemoryProfiler(base.ProfilerClassDecorator):
         :type _function: types.FunctionType or types.MethodType
         :param object stream: 输出方式，默认为 stdout ，可指定为文件
         :param int precision: 精度，默认为 1
-        :param str backend: 内存监控的 backend ，默认为 'psutil'
+        :param str backend: 内存监控的 backend ，默认为 'psutil' ，仅逐行分析模式使用
+        :param str mode: 分析模式， ``line`` 为逐行记录进程内存的增量， ``allocation`` 为对比进入与退出时的
+            ``tracemalloc`` 快照，统计期间新增且尚未释放的内存分配位置，详见 :py:mod:`moprofiler.allocation` 。
+            以下参数仅分配分析模式使用
+        :param int frames: 每个分配记录的调用栈深度，默认为 1
+        :param str group_by: 分配位置的分组方式，可选 ``filename`` 、 ``lineno`` 、 ``traceback`` ，默认为 ``lineno``
+        :param int top: 输出的分配位置个数，默认为 10 ，为空时全部输出
+        :param str sort_by: 排序方式，可选 ``size`` （净增字节数）、 ``count`` （净增内存块数），默认为 ``size``
+        :param bool exclude_stdlib: 是否排除标准库的调用帧，默认为 ``是``
+        :param bool exclude_self: 是否排除 moprofiler 自身的调用帧，默认为 ``是``
         """
-        self._backend = _process_backend(backend)
-        self.profiler_kwargs = {'backend': self._backend}
-
-        super(MemoryProfiler, self).__init__(_function=_function, **kwargs)
+        if mode not in MODES:
+            raise ValueError('不支持的分析模式: {}'.format(mode))
+        if sort_by not in allocation.SORT_BY_CHOICES:
+            raise ValueError('不支持的排序方式: {}'.format(sort_by))
+        self.mode = mode  #: 分析模式
+        if mode == MODE_ALLOCATION:
+            self.profiler_factory = allocation.AllocationTracker
+            profiler_kwargs = {
+                'frames': frames, 'group_by': group_by,
+                'exclude_stdlib': exclude_stdlib, 'exclude_self': exclude_self}
+        else:
+            self._backend = _process_backend(backend)
+            profiler_kwargs = {'backend': self._backend}
+        profiler_kwargs.update(kwargs.pop('profiler_kwargs', None) or {})
+
+        super(MemoryProfiler, self).__init__(
+            _function=_function, profiler_kwargs=profiler_kwargs, **kwargs)
 
         # 内部属性，装饰器参数
         self._stream = stream
         self._precision = precision
+        self._top = top
+        self._sort_by = sort_by
+
+    def snapshot_stats(self):
+        """
+        获取当前统计结果的快照
+
+        :return: 逐行内存记录（分配分析模式下为已排序的分配统计）、协程统计及垃圾回收统计
+        :rtype: tuple
+        """
+        if self.mode == MODE_ALLOCATION:
+            return (
+                self.profiler.snapshot(self._sort_by), self._coroutine_stats(), self._gc_snapshot())
+        return self.profiler.snapshot(), self._coroutine_stats(), self._gc_snapshot()
+
+    def render_stats(self, snapshot, stream=None):
+        """
+        输出统计结果的快照
+
+        :param tuple snapshot: 由 :py:meth:`snapshot_stats` 获取的快照
+        :param object stream: 输出方式，默认为 stdout ，可指定为文件
+        """
+        mstats, coroutine_stats, gc_stats = snapshot
+        if self.mode == MODE_ALLOCATION:
+            (stream or sys.stdout).write(allocation.format_stats(mstats, self._top))
+        else:
+            show_results(mstats, stream=stream, precision=self._precision)
+        self._print_coroutine_stats(stream, coroutine_stats)
+        self._print_gc_stats(stream, gc_stats)
+
+    def line_records(self):
+        """
+        获取逐行统计记录，数值为各行内存增量，单位 ``MiB``
+
+        ``memory_profiler`` 将每次调用开始时的进程内存整个计为函数首行（ ``def`` 或装饰器所在行）的增量，
+        按增量排序时该行总排在最前且并非函数本身的内存增长，故不计入记录
+
+        分配分析模式下为各分配位置（按调用栈分组时取最近的一帧）的净增内存，释放内存时为负数，
+        次数为该位置的内存发生变化的调用次数，按文件分组时行号为 0 ，函数名为分配位置所在的函数
+
+        :rtype: Iterator[registry.LineRecord]
+        """
+        if self.mode == MODE_ALLOCATION:
+            for stat in self.profiler.snapshot():
+                filename, lineno = stat.frames[-1]
+                yield registry.LineRecord(
+                    registry.KIND_MEMORY, filename, lineno,
+                    allocation.function_name(filename, lineno) if lineno else None,
+                    stat.calls, stat.size / 1048576.0)
+            return
+        code_map = self.profiler.code_map
+        # 与 CodeMap.items 相同，按被登记的各函数的代码对象遍历，从而获取各自的函数名
+        for filename, code, linenos in code_map._toplevel:  # pylint: disable=W0212
+            measures = code_map[code]
+            for lineno in linenos:
+                if lineno == code.co_firstlineno:
+                    continue
+                mem = measures.get(lineno)
+                if mem:
+                    increment, _total, occurrences = mem
+                    yield registry.LineRecord(
+                        registry.KIND_MEMORY, filename, lineno, code.co_name, occurrences,
+                        increment)
 
     def print_stats(self):
         """打印统计结果"""
-        self.profiler.print_stats(
-            stream=self._stream,
-            precision=self._precision)
+        self.render_stats(self.snapshot_stats(), self._stream)
 
 
 memory_profiler = MemoryProfiler  #: 此变量是为了向后兼容旧版本的命名
@@ -0,0 +1,249 @@
+# encoding=utf8
+"""
+提供后台线程持续采样的内存追踪
+
+秒表仅在进入/退出及内存打点时采样内存，两次采样之间先升后降的内存尖峰无法被发现，
+而内存分析器虽能发现，却需要开销很大的逐行追踪。
+
+:py:class:`MemoryTracer` 在有追踪进行时由后台线程按固定间隔采样进程内存，
+每次追踪记录期间的峰值、均值及降采样后的时间序列。时间序列的长度有固定上限，
+写满后相邻两点合并为一点（保留其中的较大值）并将采样步长加倍，故无论追踪多久，内存占用均固定，且不会丢失尖峰。
+
+可通过秒表的 ``mem_interval`` 参数开启，也可直接使用::
+
+    with memtrace.get_tracer(0.01).trace() as trace:
+        do_something()
+    print(trace.peak)
+"""
+from __future__ import absolute_import
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from . import clock, meminfo
+
+INTERVAL_DEFAULT = 0.01  #: 默认采样间隔，单位 ``s``
+CAPACITY_DEFAULT = 256  #: 时间序列的默认长度上限
+
+
+class MemoryTrace(object):
+    """
+    一次内存追踪的记录
+
+    所有内存值均为进程内存的绝对值，单位 ``Byte`` ，具体含义取决于所用的内存采样后端
+    """
+    __slots__ = ('capacity', 'count', 'sum', 'first', 'last', 'min', 'peak', 'peak_time',
+                 'stride', 'series', '_bucket')
+
+    def __init__(self, capacity=CAPACITY_DEFAULT):
+        """
+        :param int capacity: 时间序列的长度上限，需大于等于 2
+        """
+        if capacity < 2:
+            raise ValueError('时间序列的长度上限需大于等于 2: {}'.format(capacity))
+        self.capacity = capacity
+        self.count = 0  #: 采样次数
+        self.sum = 0  #: 采样值之和
+        self.first = None  #: 首次采样值
+        self.last = None  #: 最近一次采样值
+        self.min = None  #: 最小值
+        self.peak = None  #: 峰值
+        self.peak_time = None  #: 峰值出现的时刻，单位 ``ns``
+        self.stride = 1  #: 时间序列中每一点合并的采样次数
+        self.series = []  #: 已合并完毕的时间序列，每一点为 ``[时刻(ns), 该段内的最大值]``
+        self._bucket = None  # 正在合并的一点，为 [时刻, 最大值, 已合并次数]
+
+    @property
+    def mean(self):
+        """
+        采样均值
+
+        :rtype: float
+        """
+        return self.sum / float(self.count) if self.count else 0.0
+
+    def as_fields(self, begin_mem):
+        """
+        获取用于输出的变量，均为相对于进入时内存的变化
+
+        :param int begin_mem: 进入时的内存，单位 ``Byte``
+        :rtype: dict
+        """
+        return {
+            'mem_peak': self.peak - begin_mem,
+            'mem_peak_mb': meminfo.bytes_to_mb(self.peak - begin_mem),
+            'mem_mean': self.mean - begin_mem,
+            'mem_mean_mb': meminfo.bytes_to_mb(self.mean - begin_mem),
+            'mem_samples': self.count,
+        }
+
+    def add(self, t_ns, value):
+        """
+        记录一次采样
+
+        :param int t_ns: 采样时刻，单位 ``ns``
+        :param int value: 采样值
+        """
+        self.count += 1
+        self.sum += value
+        self.last = value
+        if self.first is None:
+            self.first = self.min = value
+        elif value < self.min:
+            self.min = value
+        if self.peak is None or value > self.peak:
+            self.peak, self.peak_time = value, t_ns
+
+        bucket = self._bucket
+        if bucket is None:
+            bucket = self._bucket = [t_ns, value, 0]
+        elif value > bucket[1]:
+            bucket[1] = value
+        bucket[2] += 1
+        if bucket[2] >= self.stride:
+            self.series.append(bucket[:2])
+            self._bucket = None
+            if len(self.series) >= self.capacity:
+                self._downsample()
+
+    def _downsample(self):
+        """将相邻两点合并为一点，并将采样步长加倍"""
+        series = self.series
+        self.series = [
+            [series[i][0], max(p[1] for p in series[i:i + 2])]
+            for i in range(0, len(series), 2)]
+        self.stride *= 2
+
+    def timeline(self):
+        """
+        获取时间序列，包含尚未合并完毕的最后一点
+
+        :return: ``(时刻(ns), 最大值)`` 列表
+        :rtype: list[tuple]
+        """
+        points = [tuple(p) for p in self.series]
+        if self._bucket is not None:
+            points.append(tuple(self._bucket[:2]))
+        return points
+
+
+class MemoryTracer(object):
+    """
+    后台内存追踪器
+
+    有追踪进行时，后台线程每隔 ``interval`` 秒采样一次进程内存，并记录到所有进行中的追踪；
+    没有追踪时后台线程阻塞等待，不产生开销。后台线程在首次追踪时启动，在 ``fork`` 后的子进程中首次追踪时重新启动
+    """
+
+    def __init__(self, interval=INTERVAL_DEFAULT, sampler=None, capacity=CAPACITY_DEFAULT):
+        """
+        :param float interval: 采样间隔，单位 ``s``
+        :param function sampler: 内存采样函数，返回字节数，默认按 :py:mod:`moprofiler.meminfo` 的默认后端创建
+        :param int capacity: 每次追踪的时间序列长度上限
+        """
+        if interval <= 0:
+            raise ValueError('采样间隔需大于 0: {}'.format(interval))
+        self.interval = interval
+        self.sampler = sampler or meminfo.get_sampler()
+        self.capacity = capacity
+        self.clock = clock.CLOCKS['monotonic_ns']
+        self._lock = threading.Lock()
+        self._traces = []
+        self._active = threading.Event()  # 有追踪进行时被设置
+        self._pid = None
+        self._thread = None  # type: threading.Thread
+
+    def _ensure_started(self):
+        """启动后台线程，若进程号变化（即发生了 ``fork`` ）则重新启动"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._thread = threading.Thread(target=self._run, name='moprofiler-memtrace')
+            self._thread.daemon = True
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def start_trace(self, initial=None):
+        """
+        开始一次追踪
+
+        :param int initial: 开始时的内存，已采样时可传入以避免重复采样
+        :rtype: MemoryTrace
+        """
+        trace = MemoryTrace(self.capacity)
+        trace.add(self.clock(), self.sampler() if initial is None else initial)
+        self._ensure_started()
+        with self._lock:
+            self._traces.append(trace)
+            self._active.set()
+        return trace
+
+    def stop_trace(self, trace, final=None):
+        """
+        结束一次追踪
+
+        :param MemoryTrace trace: :py:meth:`start_trace` 返回的追踪记录
+        :param int final: 结束时的内存，已采样时可传入以避免重复采样
+        :rtype: MemoryTrace
+        """
+        with self._lock:
+            try:
+                self._traces.remove(trace)
+            except ValueError:
+                pass
+            if not self._traces:
+                self._active.clear()
+        trace.add(self.clock(), self.sampler() if final is None else final)
+        return trace
+
+    @contextmanager
+    def trace(self):
+        """
+        在上下文中进行一次追踪
+
+        :return: 追踪记录，退出上下文后完整
+        :rtype: Iterator[MemoryTrace]
+        """
+        trace = self.start_trace()
+        try:
+            yield trace
+        finally:
+            self.stop_trace(trace)
+
+    def _run(self):
+        """后台线程，有追踪进行时按间隔采样"""
+        while True:
+            self._active.wait()
+            value = self.sampler()
+            now = self.clock()
+            with self._lock:
+                for trace in self._traces:
+                    trace.add(now, value)
+            time.sleep(self.interval)
+
+
+_TRACERS = {}
+_TRACERS_LOCK = threading.Lock()
+
+
+def get_tracer(interval=INTERVAL_DEFAULT, sampler=None):
+    """
+    获取进程内共享的后台内存追踪器，相同采样间隔及采样函数的追踪共用一个后台线程
+
+    :param float interval: 采样间隔，单位 ``s``
+    :param function sampler: 内存采样函数，默认按 :py:mod:`moprofiler.meminfo` 的默认后端创建
+    :rtype: MemoryTracer
+    """
+    sampler = sampler or meminfo.get_sampler()
+    key = (interval, sampler)
+    tracer = _TRACERS.get(key)
+    if tracer is None:
+        with _TRACERS_LOCK:
+            tracer = _TRACERS.get(key)
+            if tracer is None:
+                tracer = _TRACERS[key] = MemoryTracer(interval, sampler)
+    return tracer
@@ -0,0 +1,131 @@
+# encoding=utf8
+"""
+提供分析器使用的采样策略
+
+时间/内存分析器会对被观察函数的每一行进行追踪，开销远大于函数本身，
+通过采样策略可仅追踪部分调用，未被采样的调用将直接执行原函数，统计结果仅来自被采样的调用。
+
+可通过分析器的 ``sampling`` 参数指定，取值如下:
+
+#. ``None`` : 默认值，追踪每次调用
+#. ``0 < sampling < 1`` 的小数: 按该比例随机采样，如 ``0.01`` 表示约每百次调用采样一次
+#. 大于等于 1 的整数: 每 N 次调用采样一次，如 ``100`` 表示第 1 、 101 、 201 ... 次调用被采样
+#. :py:class:`SamplingPolicy` 的实例，如 :py:class:`BudgetSampling` ，按追踪耗时占墙上时间的比例上限采样
+"""
+from __future__ import absolute_import
+
+import itertools
+import numbers
+import random
+import threading
+
+from . import clock
+
+
+class SamplingPolicy(object):
+    """
+    采样策略基类
+
+    每次调用前通过 :py:meth:`should_sample` 决定是否追踪，被追踪的调用结束后通过 :py:meth:`record` 反馈其耗时
+    """
+
+    def should_sample(self):
+        """
+        是否追踪本次调用
+
+        :rtype: bool
+        """
+        return True
+
+    def record(self, elapsed_ns):
+        """
+        记录一次被追踪调用的耗时
+
+        :param int elapsed_ns: 耗时，单位 ``ns``
+        """
+
+
+class RateSampling(SamplingPolicy):
+    """按固定比例随机采样"""
+
+    def __init__(self, rate):
+        """
+        :param float rate: 采样比例，取值范围 ``(0, 1]``
+        """
+        if not 0 < rate <= 1:
+            raise ValueError('采样比例需在 (0, 1] 范围内: {}'.format(rate))
+        self.rate = rate
+
+    def should_sample(self):
+        return random.random() < self.rate
+
+
+class EveryNthSampling(SamplingPolicy):
+    """每 N 次调用采样一次"""
+
+    def __init__(self, n):
+        """
+        :param int n: 采样间隔的调用次数，需大于等于 1
+        """
+        if n < 1:
+            raise ValueError('采样间隔需大于等于 1: {}'.format(n))
+        self.n = n
+        self._counter = itertools.count()  # CPython 中 next 为原子操作，无需加锁
+
+    def should_sample(self):
+        return next(self._counter) % self.n == 0
+
+
+class BudgetSampling(SamplingPolicy):
+    """
+    按追踪耗时预算采样
+
+    在每个时间窗口内，仅当已追踪的累计耗时不超过窗口已流逝时间的 ``fraction`` 倍时，才追踪下一次调用，
+    从而将花费在追踪上的时间控制在墙上时间的一定比例以内
+    """
+
+    def __init__(self, fraction, window=60.0):
+        """
+        :param float fraction: 追踪耗时占墙上时间的比例上限，取值范围 ``(0, 1]`` ，如 ``0.01`` 表示不超过 1%
+        :param float window: 时间窗口长度，单位 ``s`` ，每个窗口开始时重新计算预算，默认为 60 秒
+        """
+        if not 0 < fraction <= 1:
+            raise ValueError('耗时比例需在 (0, 1] 范围内: {}'.format(fraction))
+        self.fraction = fraction
+        self.window_ns = int(window * clock.NS_PER_SEC)
+        self._clock = clock.CLOCKS['monotonic_ns']
+        self._lock = threading.Lock()
+        self._window_start = self._clock()
+        self._traced_ns = 0
+
+    def should_sample(self):
+        now = self._clock()
+        elapsed = now - self._window_start
+        if elapsed >= self.window_ns:
+            with self._lock:
+                if now - self._window_start >= self.window_ns:
+                    self._window_start, self._traced_ns = now, 0
+            elapsed = now - self._window_start
+        return self._traced_ns <= elapsed * self.fraction
+
+    def record(self, elapsed_ns):
+        with self._lock:
+            self._traced_ns += elapsed_ns
+
+
+def get_policy(sampling=None):
+    """
+    获取采样策略
+
+    :param sampling: 采样参数，取值详见模块说明
+    :type sampling: float or int or SamplingPolicy
+    :return: 采样策略，追踪每次调用时返回 None
+    :rtype: SamplingPolicy
+    """
+    if sampling is None or isinstance(sampling, SamplingPolicy):
+        return sampling
+    if isinstance(sampling, bool) or not isinstance(sampling, numbers.Number):
+        raise ValueError('不支持的采样参数: {!r}'.format(sampling))
+    if isinstance(sampling, numbers.Integral):
+        return EveryNthSampling(sampling) if sampling != 1 else None
+    return RateSampling(sampling) if sampling != 1 else None
@@ -0,0 +1,73 @@
+# encoding=utf8
+"""
+提供秒表的日志输出工具
+
+秒表每次输出前会先通过 ``logger.isEnabledFor`` 判断日志级别，被过滤的输出不会产生任何格式化开销；
+未被过滤的输出以 :py:class:`LazyMessage` 作为日志消息，直到处理器真正需要文本时才执行格式化。
+
+开启结构化输出后，日志记录上会额外附带 ``moprofiler`` 属性，
+其值为仅包含名称、事件类型及数值字段的字典，可由 JSON 日志处理器直接序列化，无需从文本中解析数字
+"""
+from __future__ import absolute_import
+
+import numbers
+import string
+
+import six
+
+EXTRA_KEY = 'moprofiler'  #: 结构化字段在日志记录上的属性名
+_FORMATTER = string.Formatter()
+
+
+class LazyMessage(object):
+    """
+    延迟格式化的日志消息
+
+    仅在被转换为字符串时才执行格式化，格式化所用的变量由多个字典依次合并，后者覆盖前者
+    """
+    __slots__ = ('fmt', 'fields', '_text')
+
+    def __init__(self, fmt, *fields):
+        """
+        :param str fmt: 格式化模板，需使用 format 的占位符格式
+        :param dict fields: 格式化所用的变量字典
+        """
+        self.fmt = fmt
+        self.fields = fields
+        self._text = None
+
+    def __str__(self):
+        if self._text is None:
+            self._text = _FORMATTER.vformat(self.fmt, (), self.as_dict())
+        return self._text
+
+    def as_dict(self):
+        """
+        合并后的格式化变量
+
+        :rtype: dict
+        """
+        if len(self.fields) == 1:
+            return self.fields[0]
+        merged = {}
+        for fields in self.fields:
+            merged.update(fields)
+        return merged
+
+
+def structured_fields(name, event, fields):
+    """
+    从格式化变量中提取可直接序列化的结构化字段
+
+    仅保留数值类型（不含布尔值）的字段，参数列表等任意对象将被忽略
+
+    :param str name: 秒表名称
+    :param str event: 事件类型，如 ``end`` 、 ``dotting`` 、 ``aggregate``
+    :param dict fields: 格式化变量字典
+    :rtype: dict
+    """
+    result = {'name': name, 'event': event}
+    for key, value in six.iteritems(fields):
+        if isinstance(value, numbers.Number) and not isinstance(value, bool):
+            result[key] = value
+    return result
@@ -0,0 +1,260 @@
+# encoding=utf8
+"""
+提供全进程的分析器注册表
+
+每个时间/内存分析器在创建时都会加入全局注册表 :py:data:`REGISTRY` ，
+注册表可将所有分析器的逐行统计合并为一份报告：时间分析按各行总耗时排序，内存分析按各行内存增量排序，
+从而无需逐个调用各被装饰对象的 ``print_stats`` ，即可得到全进程最热的代码行。
+
+报告可随时通过 :py:meth:`ProfilerRegistry.print_report` 输出，
+也可通过 :py:meth:`ProfilerRegistry.dump_at_exit` 在解释器退出时输出
+"""
+from __future__ import absolute_import
+
+import atexit
+import io
+import linecache
+import sys
+import threading
+import weakref
+from collections import OrderedDict, namedtuple
+
+import six
+
+KIND_TIME = 'time'  #: 时间分析器的统计类型
+KIND_MEMORY = 'memory'  #: 内存分析器的统计类型
+TOP_DEFAULT = 20  #: 报告中每种统计类型默认输出的行数
+
+#: 一行代码的统计记录， ``value`` 对时间分析为总耗时，单位 ``s`` ，对内存分析为内存增量，单位 ``MiB``
+LineRecord = namedtuple('LineRecord', ['kind', 'filename', 'lineno', 'func_name', 'hits', 'value'])
+
+SORT_TOTAL = 'total'  #: 按总耗时/总内存增量排序
+SORT_HITS = 'hits'  #: 按执行次数排序
+SORT_AVG = 'avg'  #: 按单次耗时/单次内存增量排序
+SORT_BY_CHOICES = (SORT_TOTAL, SORT_HITS, SORT_AVG)
+
+#: 各统计类型可选的输出单位，及其相对于记录中数值单位的倍数
+UNITS = {
+    KIND_TIME: OrderedDict([('s', 1), ('ms', 1e3), ('us', 1e6), ('ns', 1e9)]),
+    KIND_MEMORY: OrderedDict([('MiB', 1), ('KiB', 1024), ('B', 1024 * 1024)]),
+}
+#: 未指定单位时各统计类型的 ``(总量单位, 单次单位)``
+_DEFAULT_UNITS = {KIND_TIME: ('s', 'us'), KIND_MEMORY: ('MiB', 'MiB')}
+
+_TITLES = {
+    KIND_TIME: '时间分析汇总（按{}排序）',
+    KIND_MEMORY: '内存分析汇总（按{}排序）',
+}
+_SORT_TITLES = {
+    KIND_TIME: {SORT_TOTAL: '总耗时', SORT_HITS: '次数', SORT_AVG: '单次耗时'},
+    KIND_MEMORY: {SORT_TOTAL: '内存增量', SORT_HITS: '次数', SORT_AVG: '单次内存增量'},
+}
+_HEADER_FMT = '{:>12} {:>10} {:>12}  {:<40} {}'
+_HEADER_NAMES = {KIND_TIME: ('总耗时', '单次'), KIND_MEMORY: ('增量', '单次')}
+_ROW_FMT = ('{value:>12.{value_precision}f} {hits:>10} {per_hit:>12.{per_hit_precision}f}  '
+            '{location:<40} {code}')
+#: 各单位输出时保留的小数位数
+_PRECISION = {'s': 6, 'ms': 4, 'us': 2, 'ns': 0, 'MiB': 4, 'KiB': 2, 'B': 0}
+
+
+def sort_key(sort_by=SORT_TOTAL):
+    """
+    获取逐行记录的排序键
+
+    :param str sort_by: 排序方式，可选 ``total`` 、 ``hits`` 、 ``avg``
+    :rtype: function
+    """
+    if sort_by == SORT_TOTAL:
+        return lambda r: r.value
+    if sort_by == SORT_HITS:
+        return lambda r: r.hits
+    if sort_by == SORT_AVG:
+        return lambda r: r.value / r.hits if r.hits else 0
+    raise ValueError('不支持的排序方式: {}'.format(sort_by))
+
+
+def get_units(kind, unit=None):
+    """
+    获取统计类型在输出时使用的单位
+
+    :param str kind: 统计类型
+    :param str unit: 指定的单位，不适用于该统计类型时使用默认单位
+    :return: 总量与单次的 ``(单位, 倍数)``
+    :rtype: tuple[tuple[str, float]]
+    """
+    units = UNITS[kind]
+    total, per_hit = (unit, unit) if unit in units else _DEFAULT_UNITS[kind]
+    return (total, units[total]), (per_hit, units[per_hit])
+
+
+def merge_records(records):
+    """
+    按统计类型及代码位置合并逐行记录，次数与数值分别累加
+
+    :param records: 逐行记录
+    :type records: Iterable[LineRecord]
+    :rtype: list[LineRecord]
+    """
+    merged = OrderedDict()
+    for rec in records:
+        key = (rec.kind, rec.filename, rec.lineno)
+        prev = merged.get(key)
+        merged[key] = rec if prev is None else prev._replace(
+            hits=prev.hits + rec.hits, value=prev.value + rec.value)
+    return list(merged.values())
+
+
+def format_records(records, top=TOP_DEFAULT, sort_by=SORT_TOTAL, unit=None):
+    """
+    将逐行记录格式化为报告文本
+
+    :param records: 逐行记录，可包含多种统计类型
+    :type records: Iterable[LineRecord]
+    :param int top: 每种统计类型输出的行数，为空时全部输出
+    :param str sort_by: 排序方式，可选 ``total`` 、 ``hits`` 、 ``avg`` ，默认为 ``total``
+    :param str unit: 输出单位，时间可选 ``s`` 、 ``ms`` 、 ``us`` 、 ``ns`` ，内存可选 ``MiB`` 、 ``KiB`` 、 ``B`` ，
+        仅作用于对应的统计类型，指定后总量与单次均使用该单位；默认时间总量为 ``s`` 、单次为 ``us`` ，内存均为 ``MiB``
+    :rtype: str
+    """
+    if unit is not None and not any(unit in units for units in UNITS.values()):
+        raise ValueError('不支持的单位: {}'.format(unit))
+    key = sort_key(sort_by)
+    lines = []
+    merged = merge_records(records)
+    for kind in (KIND_TIME, KIND_MEMORY):
+        rows = sorted((r for r in merged if r.kind == kind), key=key, reverse=True)
+        if not rows:
+            continue
+        (total_unit, total_scale), (per_hit_unit, per_hit_scale) = get_units(kind, unit)
+        total_name, per_hit_name = _HEADER_NAMES[kind]
+        header = _HEADER_FMT.format(
+            '{}({})'.format(total_name, total_unit), '次数',
+            '{}({})'.format(per_hit_name, per_hit_unit), '位置', '代码')
+        lines.extend([_TITLES[kind].format(_SORT_TITLES[kind][sort_by]), header, '=' * len(header)])
+        for rec in rows[:top]:
+            lines.append(_ROW_FMT.format(
+                value=rec.value * total_scale,
+                value_precision=_PRECISION[total_unit],
+                hits=rec.hits,
+                per_hit=rec.value / rec.hits * per_hit_scale if rec.hits else 0,
+                per_hit_precision=_PRECISION[per_hit_unit],
+                location='{}:{} {}'.format(rec.filename, rec.lineno, rec.func_name or ''),
+                code=linecache.getline(rec.filename, rec.lineno).strip()))
+        lines.append('')
+    return '\n'.join(lines)
+
+
+class ProfilerRegistry(object):
+    """
+    分析器注册表
+
+    仅以弱引用持有分析器的类装饰器，不影响其回收
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._decorators = weakref.WeakSet()
+        self._exit_registered = False
+        self._exit_args = (None, TOP_DEFAULT)
+
+    def register(self, decorator):
+        """
+        加入注册表
+
+        :param moprofiler.base.ProfilerClassDecorator decorator: 分析器的类装饰器
+        """
+        with self._lock:
+            self._decorators.add(decorator)
+
+    def unregister(self, decorator):
+        """
+        移出注册表
+
+        :param moprofiler.base.ProfilerClassDecorator decorator: 分析器的类装饰器
+        """
+        with self._lock:
+            self._decorators.discard(decorator)
+
+    def decorators(self, kind=None):
+        """
+        获取已注册且已装饰了对象的分析器
+
+        :param str kind: 统计类型，为空时返回全部
+        :rtype: list[moprofiler.base.ProfilerClassDecorator]
+        """
+        with self._lock:
+            decorators = list(self._decorators)
+        return [d for d in decorators
+                if d.func is not None and (kind is None or d.report_kind == kind)]
+
+    def records(self, kind=None):
+        """
+        获取合并后的逐行记录，按数值从大到小排序
+
+        :param str kind: 统计类型，为空时返回全部
+        :rtype: list[LineRecord]
+        """
+        records = []
+        for decorator in self.decorators(kind):
+            records.extend(decorator.line_records())
+        return sorted(merge_records(records), key=lambda r: r.value, reverse=True)
+
+    def format_report(self, top=TOP_DEFAULT, sort_by=SORT_TOTAL, unit=None):
+        """
+        获取合并后的报告文本
+
+        :param int top: 每种统计类型输出的行数，为空时全部输出
+        :param str sort_by: 排序方式，详见 :py:func:`format_records`
+        :param str unit: 输出单位，详见 :py:func:`format_records`
+        :rtype: str
+        """
+        return format_records(self.records(), top, sort_by, unit)
+
+    def print_report(self, stream=None, top=TOP_DEFAULT, reset=False, sort_by=SORT_TOTAL,
+                     unit=None):
+        """
+        输出合并后的报告
+
+        :param object stream: 输出方式，默认为 stdout ，可指定为文件
+        :param int top: 每种统计类型输出的行数，为空时全部输出
+        :param bool reset: 输出后是否清空所有分析器的统计
+        :param str sort_by: 排序方式，详见 :py:func:`format_records`
+        :param str unit: 输出单位，详见 :py:func:`format_records`
+        """
+        report = self.format_report(top, sort_by, unit)
+        if report:
+            (stream or sys.stdout).write(report + '\n')
+        if reset:
+            self.reset()
+
+    def reset(self):
+        """清空所有已注册分析器的统计"""
+        for decorator in self.decorators():
+            decorator.reset_stats()
+
+    def dump_at_exit(self, stream=None, top=TOP_DEFAULT):
+        """
+        在解释器退出时输出合并后的报告，多次调用时仅最后一次的参数生效
+
+        :param stream: 输出方式，默认为 stdout ，可指定为文件对象或文件路径（以追加方式写入）
+        :type stream: object or str
+        :param int top: 每种统计类型输出的行数，为空时全部输出
+        """
+        self._exit_args = (stream, top)
+        if not self._exit_registered:
+            atexit.register(self._dump_at_exit)
+            self._exit_registered = True
+
+    def _dump_at_exit(self):
+        """退出时的回调"""
+        stream, top = self._exit_args
+        if isinstance(stream, six.string_types):
+            report = self.format_report(top)
+            if report:
+                with io.open(stream, 'a', encoding='utf-8') as f:
+                    f.write(six.ensure_text(report + '\n'))
+        else:
+            self.print_report(stream, top)
+
+
+REGISTRY = ProfilerRegistry()  #: 全局分析器注册表，所有分析器默认加入
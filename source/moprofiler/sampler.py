@@ -0,0 +1,488 @@
+# encoding=utf8
+"""
+提供低开销的统计采样 CPU 分析器
+
+时间分析器基于 ``line_profiler`` 追踪被装饰函数的每一行，通常会使代码变慢数倍，不适合在生产环境中常开。
+:py:class:`SamplingProfiler` 不追踪代码的执行，而是按固定间隔采集正在执行被装饰对象的线程的 Python 调用栈，
+统计各函数、各行出现在栈顶（自身）及栈中（累计）的次数，样本数乘以平均采样间隔即为估计耗时。
+被装饰对象自身的开销仅为进入与退出时的登记，与采样频率无关。
+
+支持两种采样方式:
+
+#. ``thread`` : 默认方式，由后台线程每隔 ``interval`` 秒通过 ``sys._current_frames`` 读取各线程的调用栈，
+   可采样任意线程，采样的是墙上时间，等待 IO/锁的时间同样会被计入。
+   采样线程需获取 GIL 才能读取调用栈，被采样线程执行纯 Python 代码时，实际间隔会被拉长到线程切换间隔
+   （ ``sys.getswitchinterval()`` ，默认 5ms ）左右，故按实际经过的时间而非 ``interval`` 估计耗时
+#. ``signal`` : 通过 ``ITIMER_PROF`` 定时器在进程每消耗 ``interval`` 秒 CPU 时间时触发 ``SIGPROF`` 信号，
+   在信号处理函数中读取主线程的调用栈，仅采样主线程，且仅支持 Unix 系统。
+   进程内同一时间只有一个定时器，其间隔取首个开始采样的分析器的间隔
+
+调用栈从栈顶记录到被装饰对象的栈帧为止，故各被装饰对象的统计互不包含其调用方。
+结果可输出为文本，也可输出为折叠栈格式，直接用于绘制火焰图::
+
+    @SamplingProfiler(print_res=False)
+    def handle(request):
+        ...
+
+    handle.print_stats()
+    handle.write_collapsed('handle.folded')
+"""
+from __future__ import absolute_import
+
+import linecache
+import logging
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from six.moves import _thread
+
+from . import base, calltree, clock, registry
+
+try:
+    import signal
+except ImportError:  # pragma: no cover
+    signal = None
+
+LOG = logging.getLogger(__name__)
+
+#: 最高精度的单调时钟，返回整数纳秒， ``Python 2`` 中回退为 ``time.time``
+_CLOCK = clock.CLOCKS['perf_counter_ns']
+
+MODE_THREAD = 'thread'  #: 由后台线程采样
+MODE_SIGNAL = 'signal'  #: 由 ``SIGPROF`` 信号采样
+MODES = (MODE_THREAD, MODE_SIGNAL)
+INTERVAL_DEFAULT = 0.005  #: 默认采样间隔，单位 ``s``
+MAX_DEPTH_DEFAULT = 128  #: 默认记录的最大调用栈深度
+TOP_DEFAULT = 20  #: 默认输出的函数/行数
+
+#: 一次采样的统计快照， ``interval`` 为平均每个样本代表的时间，单位 ``s`` ，
+#: ``stacks`` 为由外到内的 ``(文件名, 函数名, 行号)`` 元组到样本数的映射
+SampleStats = namedtuple('SampleStats', ['interval', 'samples', 'stacks'])
+
+
+class _ThreadWatcher(object):
+    """
+    采样线程，进程内相同采样间隔的分析器共用一个
+
+    有分析器正在采样时每隔 ``interval`` 秒读取一次所有线程的栈帧并分发给各分析器，
+    没有时阻塞等待，在 ``fork`` 后的子进程中首次采样时重新启动
+    """
+
+    def __init__(self, interval):
+        """
+        :param float interval: 采样间隔，单位 ``s``
+        """
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._samplers = ()  # 正在采样的分析器，仅在持有锁时整体替换
+        self._active = threading.Event()
+        self._pid = None
+
+    def add(self, sampler):
+        """
+        :param StackSampler sampler: 开始采样的分析器
+        """
+        with self._lock:
+            self._samplers += (sampler,)
+            self._active.set()
+            if self._pid != os.getpid():
+                thread = threading.Thread(target=self._run, name='moprofiler-sampler')
+                thread.daemon = True
+                thread.start()
+                self._pid = os.getpid()
+
+    def remove(self, sampler):
+        """
+        :param StackSampler sampler: 结束采样的分析器
+        """
+        with self._lock:
+            self._samplers = tuple(s for s in self._samplers if s is not sampler)
+            if not self._samplers:
+                self._active.clear()
+
+    def _run(self):
+        """后台线程，有分析器正在采样时按间隔采样"""
+        while True:
+            self._active.wait()
+            last = _CLOCK()
+            while self._samplers:
+                time.sleep(self.interval)
+                frames = sys._current_frames()  # pylint: disable=W0212
+                now = _CLOCK()
+                elapsed, last = clock.ns_to_sec(now - last), now
+                for sampler in self._samplers:
+                    for ident in list(sampler.threads):
+                        frame = frames.get(ident)
+                        if frame is not None:
+                            sampler.sample(ident, frame, elapsed)
+                del frames
+
+
+def _is_main_thread():
+    """
+    当前线程是否为主线程， ``Python 2`` 中没有 ``threading.main_thread``
+
+    :rtype: bool
+    """
+    if hasattr(threading, 'main_thread'):
+        return threading.current_thread() is threading.main_thread()
+    return isinstance(threading.current_thread(), threading._MainThread)  # pylint: disable=W0212
+
+
+class _SignalTimer(object):
+    """
+    ``SIGPROF`` 定时器，进程内只有一个，有分析器正在采样时启动，没有时停止并恢复原信号处理函数
+
+    仅能在主线程中启停，在其他线程中开始采样的分析器不会被采样
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samplers = ()
+        self._previous = None
+
+    def add(self, sampler):
+        """
+        :param StackSampler sampler: 开始采样的分析器
+        """
+        with self._lock:
+            if not self._samplers:
+                if not _is_main_thread():
+                    LOG.warning('signal 采样方式仅能在主线程中启动，当前调用不会被采样')
+                    return
+                self._previous = signal.signal(signal.SIGPROF, self._handle)
+                signal.setitimer(signal.ITIMER_PROF, sampler.interval, sampler.interval)
+            self._samplers += (sampler,)
+
+    def remove(self, sampler):
+        """
+        :param StackSampler sampler: 结束采样的分析器
+        """
+        with self._lock:
+            if sampler not in self._samplers:
+                return
+            self._samplers = tuple(s for s in self._samplers if s is not sampler)
+            if not self._samplers:
+                signal.setitimer(signal.ITIMER_PROF, 0)
+                signal.signal(signal.SIGPROF, self._previous or signal.SIG_DFL)
+                self._previous = None
+
+    def _handle(self, _signum, frame):
+        """信号处理函数，在主线程中执行，不能获取任何锁"""
+        ident = _thread.get_ident()
+        for sampler in self._samplers:
+            sampler.sample(ident, frame, sampler.interval)
+
+
+_WATCHERS = {}
+_WATCHERS_LOCK = threading.Lock()
+_SIGNAL_TIMER = _SignalTimer()
+
+
+def _get_source(mode, interval):
+    """
+    获取采样来源
+
+    :param str mode: 采样方式
+    :param float interval: 采样间隔，单位 ``s``
+    :rtype: _ThreadWatcher or _SignalTimer
+    """
+    if mode == MODE_SIGNAL:
+        return _SIGNAL_TIMER
+    watcher = _WATCHERS.get(interval)
+    if watcher is None:
+        with _WATCHERS_LOCK:
+            watcher = _WATCHERS.get(interval)
+            if watcher is None:
+                watcher = _WATCHERS[interval] = _ThreadWatcher(interval)
+    return watcher
+
+
+class StackSampler(object):
+    """
+    调用栈采样器，作为采样分析器使用的分析器
+
+    仅采样正在执行被追踪对象的线程，调用栈从栈顶记录到被追踪对象的栈帧为止。
+    采样在后台线程或信号处理函数中进行，故记录样本时不获取任何锁，依靠 GIL 保证单次字典更新的原子性
+    """
+
+    def __init__(self, interval=INTERVAL_DEFAULT, mode=MODE_THREAD, max_depth=MAX_DEPTH_DEFAULT):
+        """
+        :param float interval: 采样间隔，单位 ``s``
+        :param str mode: 采样方式，可选 ``thread`` 、 ``signal``
+        :param int max_depth: 记录的最大调用栈深度，超出时丢弃外层的栈帧
+        """
+        if interval <= 0:
+            raise ValueError('采样间隔需大于 0: {}'.format(interval))
+        if mode not in MODES:
+            raise ValueError('不支持的采样方式: {}'.format(mode))
+        if mode == MODE_SIGNAL and not hasattr(signal, 'setitimer'):
+            raise ValueError('当前系统不支持 signal 采样方式')
+        self.interval = interval
+        self.mode = mode
+        self.max_depth = max_depth
+        self.samples = 0  #: 样本总数
+        self.sampled_time = 0.0  #: 各样本所代表时间之和，单位 ``s``
+        self.stacks = {}  #: 由外到内的 ``(文件名, 函数名, 行号)`` 元组到样本数的映射
+        self.threads = {}  #: 正在执行被追踪对象的线程标识到嵌套层数的映射
+        self._codes = set()
+        self._lock = threading.Lock()
+        self._source = _get_source(mode, interval)
+
+    def add_function(self, func):
+        """
+        登记被追踪对象，调用栈记录到其栈帧为止
+
+        :param function func: 被追踪的函数
+        """
+        code = getattr(getattr(func, '__func__', func), '__code__', None)
+        if code is not None:
+            self._codes.add(code)
+
+    def enable_by_count(self):
+        """当前线程进入被追踪对象"""
+        ident = _thread.get_ident()
+        with self._lock:
+            depth = self.threads.get(ident, 0)
+            self.threads[ident] = depth + 1
+            if depth == 0 and len(self.threads) == 1:
+                self._source.add(self)
+
+    def disable_by_count(self):
+        """当前线程退出被追踪对象"""
+        ident = _thread.get_ident()
+        with self._lock:
+            depth = self.threads.get(ident, 0) - 1
+            if depth > 0:
+                self.threads[ident] = depth
+                return
+            self.threads.pop(ident, None)
+            if not self.threads:
+                self._source.remove(self)
+
+    def sample(self, ident, frame, elapsed):
+        """
+        记录一个线程的调用栈
+
+        :param int ident: 线程标识
+        :param types.FrameType frame: 该线程当前的栈帧
+        :param float elapsed: 该样本所代表的时间，即距上次采样经过的时间，单位 ``s``
+        """
+        if ident not in self.threads:
+            return
+        codes = self._codes
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_name, frame.f_lineno))
+            if code in codes:
+                break
+            frame = frame.f_back
+        else:
+            if frame is None:
+                return  # 尚未进入或已退出被追踪对象的栈帧
+        stack.reverse()
+        stack = tuple(stack)
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+        self.samples += 1
+        self.sampled_time += elapsed
+
+    def __call__(self, func):
+        """
+        封装被追踪对象，仅在其执行期间采样，生成器仅在其自身执行时采样
+
+        :param function func: 被追踪的函数或生成器函数
+        :rtype: function
+        """
+        self.add_function(func)
+        return base.wrap_profiled(self, func)
+
+    def snapshot(self):
+        """
+        获取当前统计结果的快照
+
+        :rtype: SampleStats
+        """
+        samples = self.samples
+        interval = self.sampled_time / samples if samples else self.interval
+        return SampleStats(interval, samples, dict(self.stacks))
+
+
+def function_stats(stats):
+    """
+    按函数汇总样本数
+
+    :param SampleStats stats: 统计快照
+    :return: ``(文件名, 函数名)`` 到 ``[自身样本数, 累计样本数]`` 的映射，递归调用在同一调用栈中仅累计一次
+    :rtype: dict
+    """
+    result = {}
+    for stack, count in stats.stacks.items():
+        seen = set()
+        for filename, func_name, _lineno in stack:
+            key = (filename, func_name)
+            if key not in seen:
+                seen.add(key)
+                result.setdefault(key, [0, 0])[1] += count
+        filename, func_name, _lineno = stack[-1]
+        result[(filename, func_name)][0] += count
+    return result
+
+
+def line_stats(stats):
+    """
+    按行汇总样本数
+
+    :param SampleStats stats: 统计快照
+    :return: ``(文件名, 行号, 函数名)`` 到 ``[自身样本数, 累计样本数]`` 的映射
+    :rtype: dict
+    """
+    result = {}
+    for stack, count in stats.stacks.items():
+        seen = set()
+        for filename, func_name, lineno in stack:
+            key = (filename, lineno, func_name)
+            if key not in seen:
+                seen.add(key)
+                result.setdefault(key, [0, 0])[1] += count
+        filename, func_name, lineno = stack[-1]
+        result[(filename, lineno, func_name)][0] += count
+    return result
+
+
+def iter_collapsed(stats):
+    """
+    输出为折叠栈格式
+
+    每行为以 ``;`` 分隔的由外到内的函数，空格后为样本数
+
+    :param SampleStats stats: 统计快照
+    :rtype: Iterator[str]
+    """
+    merged = {}
+    for stack, count in stats.stacks.items():
+        last = len(stack) - 1
+        path = ';'.join(
+            '{} ({}:{})'.format(func_name, os.path.basename(filename), lineno) if i == last
+            else '{} ({})'.format(func_name, os.path.basename(filename))
+            for i, (filename, func_name, lineno) in enumerate(stack))
+        merged[path] = merged.get(path, 0) + count
+    for path in sorted(merged):
+        yield '{} {}'.format(path, merged[path])
+
+
+def format_stats(stats, top=TOP_DEFAULT):
+    """
+    将统计快照格式化为文本，分别按自身样本数输出前 N 个函数与前 N 行
+
+    :param SampleStats stats: 统计快照
+    :param int top: 输出的函数/行数，为空时全部输出
+    :rtype: str
+    """
+    total = float(stats.samples or 1)
+    header = '{:>8} {:>8} {:>8} {:>8} {:>10}  {}'.format('自身', '自身%', '累计', '累计%', '估计(s)', '{}')
+    lines = ['采样分析（样本数: {}，平均间隔: {:.6f}s）'.format(stats.samples, stats.interval)]
+
+    funcs = sorted(
+        function_stats(stats).items(), key=lambda item: (item[1][0], item[1][1]), reverse=True)
+    lines.extend(['', header.format('函数'), '=' * 72])
+    for (filename, func_name), (self_count, cumulative) in funcs[:top]:
+        lines.append('{:>8} {:>7.1f}% {:>8} {:>7.1f}% {:>10.4f}  {} ({})'.format(
+            self_count, self_count * 100 / total, cumulative, cumulative * 100 / total,
+            cumulative * stats.interval, func_name, filename))
+
+    rows = sorted(((k, v) for k, v in line_stats(stats).items() if v[0]),
+                  key=lambda item: item[1][0], reverse=True)
+    lines.extend(['', header.format('行'), '=' * 72])
+    for (filename, lineno, func_name), (self_count, cumulative) in rows[:top]:
+        lines.append('{:>8} {:>7.1f}% {:>8} {:>7.1f}% {:>10.4f}  {}:{} {}  {}'.format(
+            self_count, self_count * 100 / total, cumulative, cumulative * 100 / total,
+            self_count * stats.interval, filename, lineno, func_name,
+            linecache.getline(filename, lineno).strip()))
+    lines.append('')
+    return '\n'.join(lines)
+
+
+class SamplingProfiler(base.ProfilerClassDecorator):
+    """采样分析器的类装饰器"""
+    profiler_factory = StackSampler
+    report_kind = registry.KIND_TIME
+
+    def __init__(
+            self, _function=None, stream=None, interval=INTERVAL_DEFAULT, mode=MODE_THREAD,
+            max_depth=MAX_DEPTH_DEFAULT, top=TOP_DEFAULT, collapsed_file=None, **kwargs):
+        """
+        采样分析器的类装饰器
+
+        按固定间隔采样被装饰对象执行期间的调用栈，统计各函数、各行的样本数
+
+        :param _function: 被封装的对象，由解释器自动传入，不需关心
+        :type _function: types.FunctionType or types.MethodType
+        :param object stream: 输出方式，默认为 stdout ，可指定为文件
+        :param float interval: 采样间隔，单位 ``s`` ，默认为 0.005
+        :param str mode: 采样方式，可选 ``thread`` 、 ``signal`` ，默认为 ``thread``
+        :param int max_depth: 记录的最大调用栈深度，默认为 128
+        :param int top: 输出的函数/行数，默认为 20 ，为空时全部输出
+        :param str collapsed_file: 每次输出结果时，以折叠栈格式覆盖写入的文件路径，可直接用于绘制火焰图
+        """
+        profiler_kwargs = {'interval': interval, 'mode': mode, 'max_depth': max_depth}
+        profiler_kwargs.update(kwargs.pop('profiler_kwargs', None) or {})
+        super(SamplingProfiler, self).__init__(
+            _function=_function, profiler_kwargs=profiler_kwargs, **kwargs)
+
+        # 内部属性，装饰器参数
+        self._stream = stream
+        self._top = top
+        self._collapsed_file = collapsed_file
+
+    def snapshot_stats(self):
+        """
+        获取当前统计结果的快照
+
+        :return: 采样统计、协程统计及垃圾回收统计
+        :rtype: tuple
+        """
+        return self.profiler.snapshot(), self._coroutine_stats(), self._gc_snapshot()
+
+    def render_stats(self, snapshot, stream=None):
+        """
+        输出统计结果的快照
+
+        :param tuple snapshot: 由 :py:meth:`snapshot_stats` 获取的快照
+        :param object stream: 输出方式，默认为 stdout ，可指定为文件
+        """
+        sstats, coroutine_stats, gc_stats = snapshot
+        (stream or sys.stdout).write(format_stats(sstats, self._top))
+        self._print_coroutine_stats(stream, coroutine_stats)
+        self._print_gc_stats(stream, gc_stats)
+        if self._collapsed_file:
+            calltree.write_collapsed(iter_collapsed(sstats), self._collapsed_file, 'w')
+
+    def line_records(self):
+        """
+        获取逐行统计记录，次数为各行的自身样本数，数值为其估计耗时，单位 ``s``
+
+        :rtype: Iterator[registry.LineRecord]
+        """
+        sstats = self.profiler.snapshot()
+        for (filename, lineno, func_name), (self_count, _cumulative) in line_stats(sstats).items():
+            if self_count:
+                yield registry.LineRecord(
+                    registry.KIND_TIME, filename, lineno, func_name,
+                    self_count, self_count * sstats.interval)
+
+    def write_collapsed(self, file_or_path):
+        """
+        将当前统计结果以折叠栈格式写入文件，可直接用于绘制火焰图
+
+        :param file_or_path: 文件路径（以追加方式写入）或可写的文件对象
+        :type file_or_path: str or object
+        """
+        calltree.write_collapsed(iter_collapsed(self.profiler.snapshot()), file_or_path)
+
+    def print_stats(self):
+        """打印统计结果"""
+        self.render_stats(self.snapshot_stats(), self._stream)
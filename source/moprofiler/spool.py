@@ -0,0 +1,286 @@
+# encoding=utf8
+"""
+提供多进程下分析结果的落盘与合并工具
+
+在 gunicorn 、 ``multiprocessing.Pool`` 等预先 ``fork`` 的多进程场景中，各工作进程的分析结果随进程退出而丢失。
+通过 :py:func:`install` 指定落盘目录后，每个进程会在退出时将其时间/内存分析器的逐行统计及秒表聚合统计
+写入该目录下以进程号及代际命名的文件，之后可通过 :py:func:`merge` 或 :py:func:`print_report` 将所有进程的结果合并。
+
+``fork`` 出的子进程会继承父进程中已有的统计，安装后子进程会在 ``fork`` 后立即清空继承的统计，
+故父进程的结果仅由父进程自身写出，不会被重复计算
+"""
+from __future__ import absolute_import
+
+import atexit
+import glob
+import io
+import json
+import logging
+import os
+import sys
+import threading
+
+import six
+
+from . import clock, registry, stats
+
+try:
+    from multiprocessing import util as mp_util
+except ImportError:  # pragma: no cover
+    mp_util = None
+
+LOG = logging.getLogger(__name__)
+
+SPOOL_SUFFIX = '.mprof.json'  #: 落盘文件的后缀
+SPOOL_VERSION = 1  #: 落盘文件的格式版本
+
+_STOPWATCH_HEADER_FMT = '{:<30} {:>10} {:>12} {:>12} {:>12} {:>12}'
+STOPWATCH_HEADER = _STOPWATCH_HEADER_FMT.format('秒表', '次数', '平均(s)', 'P50(s)', 'P99(s)', '最大(s)')
+STOPWATCH_ROW_FMT = '{name:<30} {count:>10} {mean:>12.6f} {p50:>12.6f} {p99:>12.6f} {max:>12.6f}'
+_STOPWATCH_SORT_TITLES = {
+    registry.SORT_TOTAL: '总耗时', registry.SORT_HITS: '次数', registry.SORT_AVG: '平均耗时'}
+#: 各排序方式对应的秒表统计量属性
+STOPWATCH_SORT_ATTRS = {
+    registry.SORT_TOTAL: 'sum', registry.SORT_HITS: 'count', registry.SORT_AVG: 'mean'}
+
+
+class Spool(object):
+    """
+    分析结果的落盘目录
+
+    每个进程仅对应一个文件，同一进程多次写入时覆盖之前的文件，故可定期写入而不会重复计算
+    """
+
+    def __init__(self, directory, profiler_registry=None, stats_registry=None):
+        """
+        :param str directory: 落盘目录，不存在时自动创建
+        :param registry.ProfilerRegistry profiler_registry: 分析器注册表，默认为全局注册表
+        :param stats.StatsRegistry stats_registry: 秒表统计量注册表，默认为全局注册表
+        """
+        self.directory = directory
+        self.profiler_registry = profiler_registry or registry.REGISTRY
+        self.stats_registry = stats_registry or stats.REGISTRY
+        self.generation = 0  #: 进程的代际，即距安装落盘的进程被 ``fork`` 的层数
+        self._started = clock.CLOCKS['time_ns']()
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._exit_dumped = False
+
+    @property
+    def path(self):
+        """
+        当前进程的落盘文件路径
+
+        :rtype: str
+        """
+        return os.path.join(self.directory, '{}-{}-{}{}'.format(
+            self._pid, self.generation, self._started, SPOOL_SUFFIX))
+
+    def after_fork(self):
+        """
+        在 ``fork`` 后的子进程中调用
+
+        清空从父进程继承的统计，并以子进程的进程号及新的代际写入
+        """
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._started = clock.CLOCKS['time_ns']()
+        self._exit_dumped = False
+        self.generation += 1
+        self.profiler_registry.reset()
+        self.stats_registry.reset()
+
+    def dump(self):
+        """
+        将当前进程的分析结果写入落盘文件
+
+        :return: 落盘文件路径
+        :rtype: str
+        """
+        data = {
+            'version': SPOOL_VERSION,
+            'pid': self._pid,
+            'generation': self.generation,
+            'started': self._started,
+            'lines': [list(rec) for rec in self.profiler_registry.records()],
+            'stopwatch': dict(
+                (name, running.to_dict())
+                for name, running in self.stats_registry.cumulative().items()),
+        }
+        with self._lock:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            path = self.path
+            tmp_path = path + '.tmp'
+            with io.open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(six.text_type(json.dumps(data)))
+            os.rename(tmp_path, path)  # 原子替换，合并时不会读到写了一半的文件
+        return path
+
+    def dump_at_exit(self):
+        """进程退出时写入，同一进程仅写入一次"""
+        if self._exit_dumped:
+            return
+        self._exit_dumped = True
+        try:
+            self.dump()
+        except Exception:  # pylint: disable=W0703
+            LOG.exception('写入落盘文件失败: %s', self.directory)
+
+
+def load(directory):
+    """
+    读取落盘目录下的所有文件
+
+    :param str directory: 落盘目录
+    :return: 各进程的落盘数据
+    :rtype: list[dict]
+    """
+    result = []
+    for path in sorted(glob.glob(os.path.join(directory, '*' + SPOOL_SUFFIX))):
+        with io.open(path, encoding='utf-8') as f:
+            try:
+                result.append(json.load(f))
+            except ValueError:  # pragma: no cover
+                LOG.warning('跳过无法解析的落盘文件: %s', path)
+    return result
+
+
+def merge(directory):
+    """
+    合并落盘目录下所有进程的分析结果
+
+    :param str directory: 落盘目录
+    :return: 合并后按数值排序的逐行记录，及按名称合并的秒表统计
+    :rtype: tuple[list[registry.LineRecord], dict[str, stats.RunningStats]]
+    """
+    records = []
+    stopwatch = {}
+    for data in load(directory):
+        records.extend(registry.LineRecord(*rec) for rec in data['lines'])
+        for name, stats_dict in data['stopwatch'].items():
+            running = stats.RunningStats.from_dict(stats_dict)
+            if name in stopwatch:
+                stopwatch[name].merge(running)
+            else:
+                stopwatch[name] = running
+    records = sorted(registry.merge_records(records), key=lambda r: r.value, reverse=True)
+    return records, stopwatch
+
+
+def format_report(directory, top=registry.TOP_DEFAULT):
+    """
+    获取落盘目录下所有进程合并后的报告文本
+
+    :param str directory: 落盘目录
+    :param int top: 每种统计类型输出的行数，为空时全部输出
+    :rtype: str
+    """
+    records, stopwatch = merge(directory)
+    lines = [registry.format_records(records, top)] if records else []
+    if stopwatch:
+        lines.append(format_stopwatch(stopwatch, top))
+    return '\n'.join(lines)
+
+
+def format_stopwatch(stopwatch, top=registry.TOP_DEFAULT, sort_by=registry.SORT_TOTAL, unit=None):
+    """
+    将按名称汇总的秒表统计格式化为报告文本
+
+    :param stopwatch: 秒表名称与统计量的映射，统计量的单位为 ``ns``
+    :type stopwatch: dict[str, stats.RunningStats]
+    :param int top: 输出的行数，为空时全部输出
+    :param str sort_by: 排序方式，可选 ``total`` （总耗时）、 ``hits`` （次数）、 ``avg`` （平均耗时），默认为 ``total``
+    :param str unit: 输出的时间单位，可选 ``s`` 、 ``ms`` 、 ``us`` 、 ``ns`` ，默认为 ``s``
+    :rtype: str
+    """
+    units = registry.UNITS[registry.KIND_TIME]
+    unit = unit if unit in units else 's'
+    attr = STOPWATCH_SORT_ATTRS[sort_by]
+    header = STOPWATCH_HEADER if unit == 's' else _STOPWATCH_HEADER_FMT.format(
+        '秒表', '次数', *['{}({})'.format(title, unit) for title in ('平均', 'P50', 'P99', '最大')])
+    lines = ['秒表汇总（按{}排序）'.format(_STOPWATCH_SORT_TITLES[sort_by]), header, '=' * len(header)]
+    ordered = sorted(stopwatch.items(), key=lambda item: getattr(item[1], attr), reverse=True)
+    for name, running in ordered[:top]:
+        lines.append(STOPWATCH_ROW_FMT.format(
+            name=name, **running.snapshot(scale=float(clock.NS_PER_SEC) / units[unit])))
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def print_report(directory, stream=None, top=registry.TOP_DEFAULT):
+    """
+    输出落盘目录下所有进程合并后的报告
+
+    :param str directory: 落盘目录
+    :param object stream: 输出方式，默认为 stdout ，可指定为文件
+    :param int top: 每种统计类型输出的行数，为空时全部输出
+    """
+    report = format_report(directory, top)
+    if report:
+        (stream or sys.stdout).write(report + '\n')
+
+
+_SPOOL = None  # type: Spool
+_HOOKED = False  # 进程退出及 fork 的回调是否已注册
+
+
+class _ForkToken(object):
+    """用于注册 ``multiprocessing`` 的 fork 回调，其要求传入可弱引用的对象"""
+
+
+_FORK_TOKEN = _ForkToken()
+
+
+def install(directory, profiler_registry=None, stats_registry=None):
+    """
+    安装落盘
+
+    安装后，当前进程及之后 ``fork`` 出的子进程均会在退出时将分析结果写入落盘目录，
+    子进程会在 ``fork`` 后清空从父进程继承的统计。重复安装时以最后一次为准
+
+    :param str directory: 落盘目录
+    :param registry.ProfilerRegistry profiler_registry: 分析器注册表，默认为全局注册表
+    :param stats.StatsRegistry stats_registry: 秒表统计量注册表，默认为全局注册表
+    :return: 当前进程的落盘对象，可调用其 :py:meth:`Spool.dump` 随时写入
+    :rtype: Spool
+    """
+    global _SPOOL, _HOOKED  # pylint: disable=W0603
+    _SPOOL = Spool(directory, profiler_registry, stats_registry)
+    if not _HOOKED:
+        _HOOKED = True
+        atexit.register(_dump_at_exit)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=_after_fork)
+        if mp_util is not None:
+            # multiprocessing 的工作进程通过 os._exit 退出，不会执行 atexit 的回调，
+            # 但会执行指定了 exitpriority 的 Finalize 回调，该回调需在其清空继承的回调后重新注册
+            mp_util.register_after_fork(_FORK_TOKEN, _register_finalizer)
+    return _SPOOL
+
+
+def uninstall():
+    """卸载落盘，之后进程退出时不再写入"""
+    global _SPOOL  # pylint: disable=W0603
+    _SPOOL = None
+
+
+def _after_fork():
+    """``fork`` 后子进程中的回调"""
+    if _SPOOL is not None:
+        _SPOOL.after_fork()
+
+
+def _register_finalizer(_token):
+    """
+    在 ``multiprocessing`` 的工作进程中注册退出回调
+
+    :param _ForkToken _token: 注册时传入的占位对象
+    """
+    mp_util.Finalize(None, _dump_at_exit, exitpriority=0)
+
+
+def _dump_at_exit():
+    """进程退出时的回调"""
+    if _SPOOL is not None:
+        _SPOOL.dump_at_exit()
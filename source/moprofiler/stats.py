@@ -0,0 +1,430 @@
+# encoding=utf8
+"""
+提供固定内存占用的流式统计工具
+
+用于在高频调用场景下汇总秒表的计时结果，而不必逐次输出日志，
+无论记录多少次，内存占用均保持有界
+"""
+from __future__ import absolute_import
+
+import math
+import threading
+
+from . import clock
+
+QUANTILES_DEFAULT = (0.5, 0.9, 0.99)  #: 默认输出的分位数
+
+
+class QuantileSketch(object):
+    """
+    流式分位数草图
+
+    采用对数分桶（即 DDSketch 算法），保证任意分位数估计值的相对误差不超过 ``relative_accuracy`` ，
+    桶的数量上限为 ``max_bins`` ，超出时合并最小的若干个桶，从而保证内存有界。
+    同参数的草图之间可以合并，便于汇总多线程/多进程的统计结果
+    """
+
+    def __init__(self, relative_accuracy=0.01, max_bins=2048):
+        """
+        :param float relative_accuracy: 分位数估计的相对误差上限，默认为 1%
+        :param int max_bins: 桶数量上限，默认为 2048
+        """
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.bins = {}  #: 桶序号与计数的映射
+        self.zero_count = 0  #: 小于等于零的值的计数
+        self.count = 0  #: 总计数
+
+    def _key(self, value):
+        """
+        计算值所属的桶序号
+
+        :param float value: 正数
+        :rtype: int
+        """
+        return int(math.ceil(math.log(value) / self._log_gamma))
+
+    def _value(self, key):
+        """
+        计算桶的代表值
+
+        :param int key: 桶序号
+        :rtype: float
+        """
+        return 2 * self._gamma ** key / (self._gamma + 1)
+
+    def add(self, value, count=1):
+        """
+        记录一个值
+
+        :param float value: 被记录的值
+        :param int count: 记录次数，默认为 1
+        """
+        if value > 0:
+            key = self._key(value)
+            self.bins[key] = self.bins.get(key, 0) + count
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+        else:
+            self.zero_count += count
+        self.count += count
+
+    def _collapse(self):
+        """将最小的若干个桶合并，使桶数量回到上限以内"""
+        keys = sorted(self.bins)
+        excess = keys[:len(keys) - self.max_bins + 1]
+        self.bins[excess[-1]] = sum(self.bins.pop(k) for k in excess)
+
+    def merge(self, other):
+        """
+        合并另一个草图
+
+        :param QuantileSketch other: 同参数的草图
+        :raises ValueError: 两个草图的相对误差不一致
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('无法合并相对误差不同的分位数草图')
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        while len(self.bins) > self.max_bins:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, q):
+        """
+        估计分位数
+
+        :param float q: 分位点，取值范围为 [0, 1]
+        :return: 分位数估计值，无记录时返回 None
+        :rtype: float
+        """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        cumulative = self.zero_count
+        if cumulative > rank:
+            return 0.0
+        for key in sorted(self.bins):
+            cumulative += self.bins[key]
+            if cumulative > rank:
+                return self._value(key)
+        return self._value(max(self.bins))  # pragma: no cover
+
+    def histogram(self):
+        """
+        获取直方图
+
+        :return: 按代表值从小到大排列的 ``(桶代表值, 计数)`` 列表，小于等于零的值计入代表值为 0 的桶
+        :rtype: list[tuple]
+        """
+        result = [(0.0, self.zero_count)] if self.zero_count else []
+        result.extend((self._value(key), self.bins[key]) for key in sorted(self.bins))
+        return result
+
+    def to_dict(self):
+        """
+        导出为可序列化的字典
+
+        :rtype: dict
+        """
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'max_bins': self.max_bins,
+            'bins': [[k, v] for k, v in sorted(self.bins.items())],
+            'zero_count': self.zero_count,
+            'count': self.count,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        从 :py:meth:`to_dict` 导出的字典还原
+
+        :param dict data: 导出的字典
+        :rtype: QuantileSketch
+        """
+        sketch = cls(data['relative_accuracy'], data['max_bins'])
+        sketch.bins = dict((int(k), v) for k, v in data['bins'])
+        sketch.zero_count = data['zero_count']
+        sketch.count = data['count']
+        return sketch
+
+
+class RunningStats(object):
+    """
+    流式统计量
+
+    记录计数、总和、最小值、最大值，以 Welford 算法计算均值与方差，
+    并以 :py:class:`QuantileSketch` 估计分位数
+    """
+
+    def __init__(self, relative_accuracy=0.01, max_bins=2048):
+        """
+        :param float relative_accuracy: 分位数估计的相对误差上限
+        :param int max_bins: 分位数草图的桶数量上限
+        """
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self._m2 = 0.0  # 与均值之差的平方和
+        self.sketch = QuantileSketch(relative_accuracy, max_bins)
+        self.started = clock.CLOCKS['monotonic_ns']()  #: 开始统计的时刻，单位 ``ns``
+
+    @property
+    def variance(self):
+        """
+        总体方差
+
+        :rtype: float
+        """
+        return self._m2 / self.count if self.count else 0.0
+
+    def add(self, value):
+        """
+        记录一个值
+
+        :param value: 被记录的值
+        :type value: int or float
+        """
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        delta = value - self.mean
+        self.mean += delta / float(self.count)
+        self._m2 += delta * (value - self.mean)
+        self.sketch.add(value)
+
+    def merge(self, other):
+        """
+        合并另一份统计量
+
+        :param RunningStats other: 另一份统计量
+        """
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self._m2 += other._m2 + delta * delta * self.count * other.count / float(count)  # pylint: disable=W0212
+        self.mean += delta * other.count / float(count)
+        self.count = count
+        self.sum += other.sum
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+    def snapshot(self, quantiles=QUANTILES_DEFAULT, scale=1):
+        """
+        获取当前统计结果
+
+        :param tuple quantiles: 需要输出的分位点，对应结果的键名为 ``p`` 加百分数，如 ``p99``
+        :param scale: 输出时除以的比例，如将纳秒换算为秒时传入 ``1e9``
+        :type scale: int or float
+        :return: 统计结果字典，包含 ``count`` 、 ``sum`` 、 ``min`` 、 ``max`` 、 ``mean`` 、
+            ``variance`` 、 ``stdev`` 及各分位数
+        :rtype: dict
+        """
+        scale = float(scale)
+        empty = not self.count
+        result = {
+            'count': self.count,
+            'sum': self.sum / scale,
+            'min': 0.0 if empty else self.min / scale,
+            'max': 0.0 if empty else self.max / scale,
+            'mean': self.mean / scale,
+            'variance': self.variance / scale / scale,
+            'stdev': math.sqrt(self.variance) / scale,
+        }
+        for q in quantiles:
+            value = self.sketch.quantile(q)
+            # 分位数估计值存在相对误差，将其限制在实际的最值范围内
+            value = 0.0 if value is None else min(max(value, self.min), self.max)
+            result['p{:g}'.format(q * 100)] = value / scale
+        return result
+
+    def to_dict(self):
+        """
+        导出为可序列化的字典
+
+        :rtype: dict
+        """
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.mean,
+            'm2': self._m2,
+            'sketch': self.sketch.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        从 :py:meth:`to_dict` 导出的字典还原
+
+        :param dict data: 导出的字典
+        :rtype: RunningStats
+        """
+        stats = cls()
+        stats.count = data['count']
+        stats.sum = data['sum']
+        stats.min = data['min']
+        stats.max = data['max']
+        stats.mean = data['mean']
+        stats._m2 = data['m2']  # pylint: disable=W0212
+        stats.sketch = QuantileSketch.from_dict(data['sketch'])
+        return stats
+
+    def copy(self):
+        """
+        复制一份统计量
+
+        :rtype: RunningStats
+        """
+        stats = RunningStats(self.sketch.relative_accuracy, self.sketch.max_bins)
+        stats.merge(self)
+        return stats
+
+
+class StatsRegistry(object):
+    """
+    按名称汇总的线程安全的统计量注册表
+
+    通过 :py:meth:`report` 取出用于汇总输出的统计项后，其统计仍计入 :py:meth:`cumulative` 返回的累计统计
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}  # type: dict[str, RunningStats]
+        self._reported = {}  # type: dict[str, RunningStats]  # 已汇总输出的统计
+
+    def record(self, name, value):
+        """
+        记录一个值
+
+        :param str name: 统计项名称
+        :param value: 被记录的值
+        :type value: int or float
+        :return: 记录后的统计量
+        :rtype: RunningStats
+        """
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = RunningStats()
+            stats.add(value)
+            return stats
+
+    def get(self, name):
+        """
+        获取统计项
+
+        :param str name: 统计项名称
+        :return: 统计量，不存在时返回 None
+        :rtype: RunningStats
+        """
+        return self._stats.get(name)
+
+    def names(self):
+        """
+        获取所有统计项名称
+
+        :rtype: list[str]
+        """
+        with self._lock:
+            return sorted(self._stats)
+
+    def pop(self, name):
+        """
+        取出并移除一个统计项
+
+        :param str name: 统计项名称
+        :return: 统计量，不存在时返回 None
+        :rtype: RunningStats
+        """
+        with self._lock:
+            return self._stats.pop(name, None)
+
+    def report(self, name):
+        """
+        取出一个统计项用于汇总输出，之后该名称的统计重新开始，而取出的统计仍计入累计统计
+
+        :param str name: 统计项名称
+        :return: 统计量，不存在时返回 None
+        :rtype: RunningStats
+        """
+        with self._lock:
+            stats = self._stats.pop(name, None)
+            if stats is not None:
+                reported = self._reported.get(name)
+                if reported is None:
+                    self._reported[name] = stats.copy()
+                else:
+                    reported.merge(stats)
+            return stats
+
+    def cumulative(self):
+        """
+        获取所有统计项的累计统计，包含已通过 :py:meth:`report` 汇总输出的统计
+
+        :return: 名称与统计量副本的映射
+        :rtype: dict[str, RunningStats]
+        """
+        with self._lock:
+            result = dict((name, stats.copy()) for name, stats in self._reported.items())
+            for name, stats in self._stats.items():
+                if name in result:
+                    result[name].merge(stats)
+                else:
+                    result[name] = stats.copy()
+            return result
+
+    def snapshot(self, name=None, reset=False, quantiles=QUANTILES_DEFAULT, scale=1):
+        """
+        获取统计结果快照
+
+        :param str name: 统计项名称，为空时返回所有统计项
+        :param bool reset: 获取后是否清空对应统计项，默认为否
+        :param tuple quantiles: 需要输出的分位点
+        :param scale: 输出时除以的比例
+        :type scale: int or float
+        :return: 指定名称时返回该项的统计结果字典（不存在时为 None），否则返回名称与统计结果的映射
+        :rtype: dict
+        """
+        with self._lock:
+            if name is not None:
+                if reset:
+                    self._reported.pop(name, None)
+                stats = self._stats.pop(name, None) if reset else self._stats.get(name)
+                return stats.snapshot(quantiles, scale) if stats else None
+            result = dict(
+                (k, v.snapshot(quantiles, scale)) for k, v in self._stats.items())
+            if reset:
+                self._stats.clear()
+                self._reported.clear()
+            return result
+
+    def reset(self, name=None):
+        """
+        清空统计结果，包括累计统计
+
+        :param str name: 统计项名称，为空时清空所有统计项
+        """
+        with self._lock:
+            if name is None:
+                self._stats.clear()
+                self._reported.clear()
+            else:
+                self._stats.pop(name, None)
+                self._reported.pop(name, None)
+
+
+REGISTRY = StatsRegistry()  #: 秒表聚合模式默认使用的全局注册表
@@ -4,36 +4,80 @@
 """
 from __future__ import absolute_import
 
+import inspect
 import logging
-import os
-import time
 import types  # pylint: disable=W0611
 from contextlib import contextmanager
-from functools import wraps
+from functools import partial, wraps
 
-import psutil
-from line_profiler import is_generator
+from . import (
+    base, calltree, clock, export, gcstats, meminfo, memtrace, record, stats, streaming)
 
-from . import base
+try:
+    from . import coroutine
+except SyntaxError:  # pragma: no cover
+    coroutine = None
 
 LOG = logging.getLogger(__name__)
 
+#: 当前线程/asyncio 任务中正在运行的秒表
+_CURRENT = base.context_local('moprofiler_stopwatch')
+
+
+def current_stopwatch():
+    """
+    获取当前线程/asyncio 任务中正在运行的秒表
+
+    秒表的状态按线程与 asyncio 任务隔离，并发调用同一个被装饰函数时，各自获取到的均为本次调用的秒表，
+    可用于在未继承 :py:class:`StopwatchMixin` 的普通函数中打点
+
+    :return: 正在运行的秒表，不在秒表观察范围内时返回 None
+    :rtype: Stopwatch
+    """
+    return _CURRENT.get()
+
 
 class Stopwatch(object):  # pylint: disable=R0902
     """秒表类"""
     LOGGING_LEVEL_DEFAULT = logging.INFO
     DOTTING_FMT_DEFAULT = '[性能] 当前耗时({idx}): {time_diff:.4f}s, 累计耗时: {time_total:.4f}s'
     DOTTING_FMT_WITH_MEM_DEFAULT = DOTTING_FMT_DEFAULT + \
-        ', 当前变化: {mem_diff:2d}M, 累计变化: {mem_total:2d}M'
+        ', 当前变化: {mem_diff_mb:.2f}M, 累计变化: {mem_total_mb:.2f}M'
     FINAL_FMT_ARGS_DEFAULT = '[性能] {name}, 参数列表: {args} {kwargs}, 耗时: {time_use:.4f}s'
     FINAL_FMT_DEFAULT = '[性能] {name}, 耗时: {time_use:.4f}s'
-    FINAL_FMT_ARGS_WITH_MEM_DEFAULT = FINAL_FMT_ARGS_DEFAULT + ', 内存变化: {mem_use:2d}M'
-    FINAL_FMT_WITH_MEM_DEFAULT = FINAL_FMT_DEFAULT + ', 内存变化: {mem_use:2d}M'
+    FINAL_FMT_ARGS_WITH_MEM_DEFAULT = FINAL_FMT_ARGS_DEFAULT + ', 内存变化: {mem_use_mb:.2f}M'
+    FINAL_FMT_WITH_MEM_DEFAULT = FINAL_FMT_DEFAULT + ', 内存变化: {mem_use_mb:.2f}M'
+    #: 开启后台内存追踪时，追加到默认模板后的内存峰值输出
+    FINAL_FMT_MEM_PEAK_SUFFIX = ', 内存峰值: {mem_peak_mb:.2f}M'
+    #: 开启垃圾回收统计时，追加到默认模板后的回收输出
+    FINAL_FMT_GC_SUFFIX = ', GC: {gc_collections}次/{gc_collected}个, GC 暂停: {gc_pause:.4f}s'
+    #: 指定 CPU 时钟时，追加到默认模板后的 CPU 耗时输出
+    DOTTING_FMT_CPU_SUFFIX = ', 当前 CPU: {cpu_diff:.4f}s, 累计 CPU: {cpu_total:.4f}s'
+    FINAL_FMT_CPU_SUFFIX = ', CPU 耗时: {cpu_use:.4f}s'
+    #: 被观察对象为协程/异步生成器时，追加到默认模板后的运行/挂起耗时输出
+    FINAL_FMT_ASYNC_SUFFIX = ', 运行: {run_use:.4f}s, 挂起: {suspend_use:.4f}s'
+    AGGREGATE_FMT_DEFAULT = '[性能] {name}, 调用次数: {count}, 平均耗时: {mean:.4f}s, ' \
+        '标准差: {stdev:.4f}s, 最小: {min:.4f}s, 最大: {max:.4f}s, ' \
+        'P50: {p50:.4f}s, P90: {p90:.4f}s, P99: {p99:.4f}s'
+    TREE_TITLE_DEFAULT = '[性能] {name} 调用树:\n'
+    #: 以流式模式观察生成器时，追加到默认模板后的逐元素统计输出
+    FINAL_FMT_STREAMING_SUFFIX = ', 元素数: {item_count}, 首个元素: {first_item_use:.4f}s, ' \
+        '生产: {run_use:.4f}s, 消费: {suspend_use:.4f}s, 单个元素 P50: {item_p50:.6f}s, ' \
+        'P99: {item_p99:.6f}s, 吞吐: {throughput:.1f}/s, 结束: {status}'
+    #: 生成器的结束状态，依次为迭代完毕、被消费者关闭、抛出异常
+    STATUS_DONE, STATUS_CLOSED, STATUS_ERROR = 'done', 'closed', 'error'
+
+    def __init__(self, wrap_param=None):
+        """
+        秒表对象保存的是一次调用的计时状态，并发的调用需各自使用独立的秒表对象，
+        通过 :py:meth:`wrap_function` 等方法封装时，每次调用均会基于当前秒表的参数创建新的秒表
 
-    def __init__(self):
-        self.time_buf = []  #: 用来存储计时打点时间
-        self.mem_buf = []  #: 用来存储打点内存
-        self.name = ''  #: 秒表的名称，可在装饰时设置，默认为使用被装饰方法的方法名
+        :param dict wrap_param: 封装时传入的参数字典，若传入则直接用其初始化对象属性
+        """
+        self.time_buf = []  #: 用来存储计时打点时间，单位 ``ns``
+        self.cpu_buf = []  #: 用来存储打点 CPU 时间，单位 ``ns`` ，仅在指定 CPU 时钟时记录
+        self.mem_buf = []  #: 用来存储打点内存，单位 ``Byte``
+        self.name = ''  #: 秒表的名称，可在装饰时设置，默认为使用被装饰方法的限定名
         self.dkwargs = {}  #: 用来存储最终输出时使用的变量
         self.dotting_param_pre = {'kwargs': {}}  #: 用来记录上次打点输出时的参数信息
         #: 用来日志输出的 logger
@@ -41,6 +85,35 @@ class Stopwatch(object):  # pylint: disable=R0902
         self.logging_level = None  #: 日志输出级别
         self.final_fmt = ''  #: 输出最终计时结果的字符串模板
         self.is_print_memory = False  #: 是否打印内存
+        self.clock = clock.get_clock()  #: 计时使用的时钟，返回整数纳秒
+        self.cpu_clock = None  #: 统计 CPU 时间使用的时钟，为空时不统计
+        self.run_ns = None  #: 协程在事件循环上真正运行的时间，单位 ``ns`` ，仅观察协程时记录
+        self.mem_sampler = None  #: 内存采样函数，返回字节数，首次采样时按默认后端创建
+        #: 后台内存追踪器，为空时不在后台采样内存
+        self.mem_tracer = None  # type: memtrace.MemoryTracer
+        #: 本次调用的后台内存追踪记录
+        self.mem_trace = None  # type: memtrace.MemoryTrace
+        self.print_gc = False  #: 是否统计被观察函数执行期间的垃圾回收
+        #: 本次调用的垃圾回收统计
+        self.gc_stats = None  # type: gcstats.GCStats
+        self.aggregate = False  #: 是否开启聚合模式，开启后不再逐次输出，而是汇总输出统计结果
+        self.report_every = None  #: 聚合模式下每累计多少次调用输出一次汇总
+        self.report_interval_ns = None  #: 聚合模式下每隔多久输出一次汇总，单位 ``ns``
+        self.registry = stats.REGISTRY  #: 聚合模式下使用的统计量注册表
+        self.parent = None  # type: Stopwatch  #: 调用当前被观察函数时正在运行的外层秒表
+        self.depth = 0  #: 在调用树中的深度，最外层为 0
+        self.child_ns = 0  #: 内层秒表的累计耗时，单位 ``ns``
+        self.node = None  # type: calltree.CallTreeNode  #: 以当前秒表为根的调用树
+        self.print_tree = False  #: 作为最外层秒表结束时，是否输出调用树
+        self.collapsed_file = None  #: 作为最外层秒表结束时，以折叠栈格式追加写入调用树的文件
+        self.structured = False  #: 是否在日志记录上附带结构化字段
+        self.exporter = None  # type: export.Exporter  #: 后台输出器，为空时在调用线程中同步输出
+        self.streaming = False  #: 是否以流式模式观察生成器，逐个元素统计生产耗时
+        #: 流式模式下的逐元素计时器
+        self.item_timer = None  # type: streaming.ItemTimer
+        self._param = None  # 解析后的封装参数，用于为每次调用创建新的秒表
+        if wrap_param is not None:
+            self._init_param(wrap_param)
 
     def __call__(self, func, wrap_param):
         """
@@ -52,31 +125,180 @@ class Stopwatch(object):  # pylint: disable=R0902
         :return: 装饰后的函数 or 方法
         :rtype: types.FunctionType or types.MethodType
         """
-        if is_generator(func):
+        if coroutine and coroutine.is_async(func):
+            self._init_param(self.resolve_param(wrap_param, func))
+            run = self.get_runner(func)
+
+            @wraps(func)
+            def inner(*args, **kwargs):
+                """
+                在被装饰协程/异步生成器执行前后进行秒表计时
+                """
+                return run(self.spawn(), func, args, kwargs)
+            wrapper = coroutine.as_coroutine_function(inner) \
+                if inspect.iscoroutinefunction(func) else inner
+        elif inspect.isgeneratorfunction(func):
             wrapper = self.wrap_generator(func, wrap_param)
         else:
             wrapper = self.wrap_function(func, wrap_param)
         return wrapper
 
-    def _init_param(self, wrap_param):
+    @classmethod
+    def get_runner(cls, func):
         """
-        初始化对象属性
+        获取用于观察被装饰对象一次执行的方法
+
+        :param func: 被装饰的函数 or 方法
+        :type func: types.FunctionType or types.MethodType
+        :return: 以 ``(stopwatch, func, args, kwargs)`` 为参数的执行方法
+        :rtype: types.FunctionType
+        """
+        if coroutine and inspect.iscoroutinefunction(func):
+            return coroutine.run_coroutine
+        if coroutine and inspect.isasyncgenfunction(func):
+            return coroutine.run_async_generator
+        if inspect.isgeneratorfunction(func):
+            return cls.run_generator
+        return cls.run_function
+
+    @classmethod
+    def resolve_param(cls, wrap_param, func=None):
+        """
+        预先解析封装参数
+
+        将输出模板、logger、日志级别等可在装饰时确定的参数一次性解析完毕，
+        从而避免在每次调用被装饰函数时重复计算。已解析过的参数字典将被原样返回
 
         :param dict wrap_param: 封装时传入的参数字典
+        :param func: 被装饰的函数 or 方法，用于确定秒表的默认名称
+        :type func: types.FunctionType or types.MethodType
+        :return: 解析后的参数字典
+        :rtype: dict
         """
-        self.name = wrap_param.get('name')
-        self.logger = wrap_param.get('logger') or LOG  # type: logging.Logger
-        self.logging_level = wrap_param.get('logging_level') or self.LOGGING_LEVEL_DEFAULT
-        self.dkwargs = wrap_param.get('dkwargs')
-        self.is_print_memory = wrap_param.get('print_mem') or False
-        if self.is_print_memory:
-            self.final_fmt = wrap_param.get('fmt') or (
-                self.FINAL_FMT_ARGS_WITH_MEM_DEFAULT if wrap_param.get('print_args') else \
-                self.FINAL_FMT_WITH_MEM_DEFAULT)
+        if wrap_param.get('resolved'):
+            return wrap_param
+
+        mem_interval = wrap_param.get('mem_interval')
+        is_print_memory = wrap_param.get('print_mem') or bool(mem_interval)
+        cpu_clock = clock.get_clock(wrap_param['cpu_clock']) \
+            if wrap_param.get('cpu_clock') else None
+        if is_print_memory:
+            final_fmt = cls.FINAL_FMT_ARGS_WITH_MEM_DEFAULT if wrap_param.get('print_args') else \
+                cls.FINAL_FMT_WITH_MEM_DEFAULT
         else:
-            self.final_fmt = wrap_param.get('fmt') or (
-                self.FINAL_FMT_ARGS_DEFAULT if wrap_param.get('print_args') else \
-                self.FINAL_FMT_DEFAULT)
+            final_fmt = cls.FINAL_FMT_ARGS_DEFAULT if wrap_param.get('print_args') else \
+                cls.FINAL_FMT_DEFAULT
+        if mem_interval:
+            final_fmt += cls.FINAL_FMT_MEM_PEAK_SUFFIX
+        if wrap_param.get('print_gc'):
+            final_fmt += cls.FINAL_FMT_GC_SUFFIX
+        if cpu_clock:
+            final_fmt += cls.FINAL_FMT_CPU_SUFFIX
+        if func is not None and coroutine and coroutine.is_async(func):
+            final_fmt += cls.FINAL_FMT_ASYNC_SUFFIX
+        is_streaming = wrap_param.get('streaming') or False
+        if is_streaming and func is not None and inspect.isgeneratorfunction(func):
+            final_fmt += cls.FINAL_FMT_STREAMING_SUFFIX
+        aggregate = wrap_param.get('aggregate') or False
+        if aggregate:
+            final_fmt = cls.AGGREGATE_FMT_DEFAULT
+        report_interval = wrap_param.get('report_interval')
+        mem_sampler = meminfo.get_sampler(wrap_param.get('mem_backend')) \
+            if is_print_memory or wrap_param.get('mem_backend') else None
+        return {
+            'resolved': True,
+            'name': wrap_param.get('name') or (base.qualified_name(func) if func else ''),
+            'logger': wrap_param.get('logger') or LOG,
+            'logging_level': wrap_param.get('logging_level') or cls.LOGGING_LEVEL_DEFAULT,
+            'dkwargs': wrap_param.get('dkwargs'),
+            'print_mem': is_print_memory,
+            'fmt': wrap_param.get('fmt') or final_fmt,
+            'clock': clock.get_clock(wrap_param.get('clock')),
+            'cpu_clock': cpu_clock,
+            'mem_sampler': mem_sampler,
+            'mem_tracer': memtrace.get_tracer(mem_interval, mem_sampler) if mem_interval else None,
+            'print_gc': wrap_param.get('print_gc') or False,
+            'aggregate': aggregate,
+            'report_every': wrap_param.get('report_every'),
+            'report_interval_ns':
+                int(report_interval * clock.NS_PER_SEC) if report_interval else None,
+            'registry': wrap_param.get('registry') or stats.REGISTRY,
+            'print_tree': wrap_param.get('print_tree') or False,
+            'collapsed_file': wrap_param.get('collapsed_file'),
+            'structured': wrap_param.get('structured') or False,
+            'exporter': wrap_param.get('exporter'),
+            'streaming': is_streaming,
+        }
+
+    def _init_param(self, wrap_param):
+        """
+        初始化对象属性
+
+        :param dict wrap_param: 封装时传入的参数字典，可为 :py:meth:`resolve_param` 解析后的结果
+        """
+        param = self._param = self.resolve_param(wrap_param)
+        self.name = param['name']
+        self.logger = param['logger']  # type: logging.Logger
+        self.logging_level = param['logging_level']
+        # 封装参数在同一被装饰函数的所有调用间共享，故需复制一份，避免并发调用间相互覆盖
+        self.dkwargs = dict(param['dkwargs'] or {})
+        self.is_print_memory = param['print_mem']
+        self.final_fmt = param['fmt']
+        self.clock = param['clock']
+        self.cpu_clock = param['cpu_clock']
+        self.mem_sampler = param['mem_sampler']
+        self.mem_tracer = param['mem_tracer']
+        self.print_gc = param['print_gc']
+        self.aggregate = param['aggregate']
+        self.report_every = param['report_every']
+        self.report_interval_ns = param['report_interval_ns']
+        self.registry = param['registry']
+        self.print_tree = param['print_tree']
+        self.collapsed_file = param['collapsed_file']
+        self.structured = param['structured']
+        self.exporter = param['exporter']
+        self.streaming = param['streaming']
+
+    def spawn(self):
+        """
+        基于当前秒表的封装参数创建一个新的秒表，用于观察一次调用
+
+        :rtype: Stopwatch
+        """
+        return type(self)(self._param)
+
+    def _activate(self):
+        """
+        将当前秒表设为当前线程/asyncio 任务中正在运行的秒表
+
+        :return: 用于恢复的令牌
+        """
+        return _CURRENT.set(self)
+
+    @staticmethod
+    def _deactivate(token):
+        """
+        恢复设置前正在运行的秒表
+
+        :param object token: :py:meth:`_activate` 返回的令牌
+        """
+        _CURRENT.reset(token)
+
+    def _step(self, method, *args):
+        """
+        在当前秒表处于运行状态下推进一步生成器
+
+        生成器在两次迭代之间会将控制权交还调用方，故仅在生成器自身执行时将秒表设为正在运行
+
+        :param function method: 生成器的 ``send`` / ``throw`` / ``close`` 方法
+        :param list args: 方法的参数
+        :return: 生成器产出的值
+        """
+        token = self._activate()
+        try:
+            return method(*args)
+        finally:
+            self._deactivate(token)
 
     def _start(self, func, args, kwargs):
         """
@@ -87,49 +309,228 @@ class Stopwatch(object):  # pylint: disable=R0902
         :param list args: 被装饰函数被调用时的位置参数
         :param dict kwargs: 被装饰函数被调用时的关键字参数
         """
-        self.name = self.name or func.__name__
-        _begin_time = time.time()
+        self.name = self.name or base.qualified_name(func)
+        parent = _CURRENT.get()
+        if parent is not None and parent is not self:
+            self.parent = parent
+            self.depth = parent.depth + 1
         fmt_dict = {
             'name': self.name,
             'args': args,
             'kwargs': kwargs,
-            'begin_time': _begin_time,
+            'depth': self.depth,
         }
-        self.time_buf.append(_begin_time)
+        if self.cpu_clock:
+            _begin_cpu = self.cpu_clock()
+            self.cpu_buf.append(_begin_cpu)
+            fmt_dict['begin_cpu'] = _begin_cpu
 
-        _begin_mem = self._get_mem_info()
-        self.mem_buf.append(_begin_mem)
-        fmt_dict['begin_mem'] = _begin_mem
+        # 仅在需要输出内存时才于进入时采样，内存采样的开销远大于计时本身
+        if self.is_print_memory:
+            _begin_mem = self._get_mem_info()
+            self.mem_buf.append(_begin_mem)
+            fmt_dict['begin_mem'] = _begin_mem
+            if self.mem_tracer is not None:
+                self.mem_trace = self.mem_tracer.start_trace(_begin_mem)
+        if self.print_gc:
+            self.gc_stats = gcstats.MONITOR.start()
 
         self.dkwargs.update(fmt_dict)
+        # 最后读取时钟，尽量不把秒表自身的开销计入被观察函数
+        _begin_time = self.clock()
+        self.time_buf.append(_begin_time)
+        self.dkwargs['begin_time'] = _begin_time
 
     def _end(self):
         """
         结束秒表
         """
-        _end_time = time.time()
+        _end_time = self.clock()
         self.time_buf.append(_end_time)
         self.dkwargs['end_time'] = _end_time
-        self.dkwargs['time_use'] = _end_time - self.dkwargs['begin_time']
+        self.dkwargs['time_use_ns'] = _end_time - self.dkwargs['begin_time']
+        self.dkwargs['time_use'] = clock.ns_to_sec(self.dkwargs['time_use_ns'])
+        if self.cpu_clock:
+            _end_cpu = self.cpu_clock()
+            self.cpu_buf.append(_end_cpu)
+            self.dkwargs['cpu_use_ns'] = _end_cpu - self.dkwargs['begin_cpu']
+            self.dkwargs['cpu_use'] = clock.ns_to_sec(self.dkwargs['cpu_use_ns'])
+        if self.run_ns is not None:
+            self.dkwargs['run_use_ns'] = self.run_ns
+            self.dkwargs['run_use'] = clock.ns_to_sec(self.run_ns)
+            self.dkwargs['suspend_use_ns'] = self.dkwargs['time_use_ns'] - self.run_ns
+            self.dkwargs['suspend_use'] = clock.ns_to_sec(self.dkwargs['suspend_use_ns'])
         if self.is_print_memory:
             _end_mem = self._get_mem_info()
             self.mem_buf.append(_end_mem)
             self.dkwargs['end_mem'] = _end_mem
             self.dkwargs['mem_use'] = _end_mem - self.dkwargs['begin_mem']
+            self.dkwargs['mem_use_mb'] = meminfo.bytes_to_mb(self.dkwargs['mem_use'])
+            if self.mem_trace is not None:
+                self.dkwargs.update(self.mem_tracer.stop_trace(
+                    self.mem_trace, _end_mem).as_fields(self.dkwargs['begin_mem']))
+        if self.gc_stats is not None:
+            self.dkwargs.update(gcstats.MONITOR.stop(self.gc_stats).as_fields())
+        self._close_span()
+
+        if self.aggregate:
+            self._aggregate()
+            return
+        self._log(self.logging_level, 'end', self.final_fmt, self.dkwargs)
 
-        self.logger.log(self.logging_level, self.final_fmt.format(**self.dkwargs))
+    def _abort(self):
+        """
+        被观察函数抛出异常时放弃本次计时，不输出结果，仅释放计时期间占用的资源
+        """
+        if self.mem_trace is not None:
+            self.mem_tracer.stop_trace(self.mem_trace)
+            self.mem_trace = None
+        if self.gc_stats is not None:
+            gcstats.MONITOR.stop(self.gc_stats)
+            self.gc_stats = None
+
+    def _log(self, level, event, fmt, *fields):
+        """
+        输出日志
 
-    @staticmethod
-    def _get_mem_info():
+        先判断 logger 是否会处理该级别的日志，被过滤时不做任何处理；否则以延迟格式化的消息输出，
+        开启结构化输出时，额外在日志记录上附带数值字段
+
+        :param int level: 日志输出级别
+        :param str event: 事件类型，用于结构化字段
+        :param str fmt: 格式化模板
+        :param dict fields: 格式化所用的变量字典，后者覆盖前者
+        """
+        if not self.logger.isEnabledFor(level):
+            return
+        message = record.LazyMessage(fmt, *fields)
+        extra = {
+            record.EXTRA_KEY: record.structured_fields(self.name, event, message.as_dict()),
+        } if self.structured else None
+        if self.exporter is not None:
+            self.exporter.submit(export.LogItem(self.logger, level, message, extra))
+        elif extra is None:
+            self.logger.log(level, message)
+        else:
+            self.logger.log(level, message, extra=extra)
+
+    def _close_span(self):
+        """
+        结束当前秒表在调用树中的节点
+
+        计算自身耗时与内层秒表耗时，并将以当前秒表为根的调用树汇总到外层秒表，
+        若当前为最外层秒表，则按配置输出调用树
+        """
+        time_use_ns = self.dkwargs['time_use_ns']
+        self.dkwargs['child_use_ns'] = self.child_ns
+        self.dkwargs['child_use'] = clock.ns_to_sec(self.child_ns)
+        self.dkwargs['self_use_ns'] = time_use_ns - self.child_ns
+        self.dkwargs['self_use'] = clock.ns_to_sec(time_use_ns - self.child_ns)
+        if self.parent is None and not (self.print_tree or self.collapsed_file):
+            return
+
+        node = self._get_node()
+        node.count = 1
+        node.total_ns = time_use_ns
+        node.self_ns = time_use_ns - self.child_ns
+        if self.parent is not None:
+            self.parent._add_child(self)  # pylint: disable=W0212
+            return
+        if self.print_tree and self.logger.isEnabledFor(self.logging_level):
+            self._log(
+                self.logging_level, 'tree', '{tree_title}{tree}', {
+                    'tree_title': self.TREE_TITLE_DEFAULT.format(**self.dkwargs),
+                    'tree': node.format_tree(),
+                })
+        if self.collapsed_file:
+            node.write_collapsed(self.collapsed_file)
+
+    def _get_node(self):
+        """
+        获取以当前秒表为根的调用树，不存在时创建
+
+        :rtype: calltree.CallTreeNode
+        """
+        if self.node is None:
+            with calltree._MERGE_LOCK:  # pylint: disable=W0212
+                if self.node is None:
+                    self.node = calltree.CallTreeNode(self.name)
+        return self.node
+
+    def _add_child(self, child):
+        """
+        汇总一个已结束的内层秒表
+
+        :param Stopwatch child: 内层秒表
+        """
+        self._get_node().add_child(child.node)
+        with calltree._MERGE_LOCK:  # pylint: disable=W0212
+            self.child_ns += child.dkwargs['time_use_ns']
+
+    @property
+    def root(self):
+        """
+        当前调用链上最外层的秒表
+
+        :rtype: Stopwatch
+        """
+        outermost = self
+        while outermost.parent is not None:
+            outermost = outermost.parent
+        return outermost
+
+    def format_tree(self, fmt=calltree.TREE_FMT_DEFAULT, indent='    '):
+        """
+        将以当前秒表为根的调用树输出为缩进文本
+
+        可在被观察函数执行过程中调用，此时仅包含已结束的内层秒表，当前秒表自身的计数与耗时为 0
+
+        :param str fmt: 每个节点的输出模板，详见 :py:meth:`moprofiler.calltree.CallTreeNode.format_tree`
+        :param str indent: 每层的缩进字符串
+        :rtype: str
+        """
+        return self._get_node().format_tree(fmt, indent)
+
+    def write_collapsed(self, file_or_path):
+        """
+        将以当前秒表为根的调用树以折叠栈格式写入文件，可直接用于绘制火焰图
+
+        :param file_or_path: 文件路径（以追加方式写入）或可写的文件对象
+        :type file_or_path: str or object
+        """
+        self._get_node().write_collapsed(file_or_path)
+
+    def _aggregate(self):
+        """
+        聚合模式下记录本次耗时，并在满足条件时输出一次汇总
+
+        汇总输出后，该秒表名称下的统计将重新开始，故每行汇总描述的是距上次汇总以来的调用，
+        已输出的统计仍计入注册表的累计统计，供落盘及二进制文件使用
+        """
+        _stats = self.registry.record(self.name, self.dkwargs['time_use_ns'])
+        due = (self.report_every and _stats.count >= self.report_every) or (
+            self.report_interval_ns and
+            clock.CLOCKS['monotonic_ns']() - _stats.started >= self.report_interval_ns)
+        if not due:
+            return
+        # 并发时仅由成功取出统计项的调用者输出
+        _stats = self.registry.report(self.name)
+        if _stats is None:  # pragma: no cover
+            return
+        self._log(
+            self.logging_level, 'aggregate', self.final_fmt,
+            self.dkwargs, _stats.snapshot(scale=clock.NS_PER_SEC))
+
+    def _get_mem_info(self):
         """
         获取内存信息
 
-        :return: 当前进程已用内存(rss)，单位 ``MB``
+        :return: 当前进程已用内存，单位 ``Byte`` ，具体含义取决于所用的内存采样后端
         :rtype: int
         """
-        process = psutil.Process(os.getpid())
-        mem = process.memory_info().rss >> 20  # 为速度考虑，使用移位操作
-        return mem
+        if self.mem_sampler is None:
+            self.mem_sampler = meminfo.get_sampler()
+        return self.mem_sampler()
 
     def wrap_generator(self, func, wrap_param):
         """
@@ -148,20 +549,87 @@ class Stopwatch(object):  # pylint: disable=R0902
             """
             在被装饰函数执行前后进行秒表计时
             """
-            self._start(func, args, kwargs)
-
-            g = func(*args, **kwargs)
-            # 第一次迭代将不调用 send()
-            item = next(g)
-            _input = (yield item)
-            try:
-                while True:
-                    item = g.send(_input)
-                    _input = (yield item)
-            except StopIteration:
-                self._end()
+            return self.spawn().run_generator(func, args, kwargs)
         return inner
 
+    def run_generator(self, func, args, kwargs):
+        """
+        使用秒表观察一次生成器的执行
+
+        消费者通过 ``send`` 发送的值、 ``throw`` 抛入的异常均会转发给被观察的生成器，
+        ``close`` 时也会关闭被观察的生成器。无论生成器迭代完毕、被消费者提前关闭或抛出异常，
+        秒表均会结束并输出，结束状态记录在 ``status`` 变量中。
+
+        开启流式模式时，额外逐个元素统计生成器自身的生产耗时（不含消费者处理元素的时间），
+        各元素的耗时以固定内存的流式统计量记录，详见 :py:func:`stopwatch`
+
+        :param func: 被观察的生成器函数
+        :type func: types.FunctionType or types.MethodType
+        :param tuple args: 位置参数
+        :param dict kwargs: 关键字参数
+        :return: 被观察的生成器，其返回值为被观察的生成器的返回值
+        :rtype: types.GeneratorType
+        """
+        return base.forward_generator(
+            func(*args, **kwargs), self._streaming_step if self.streaming else self._step,
+            partial(self._start_generator, func, args, kwargs), self._finish_generator)
+
+    @classmethod
+    def generator_status(cls, error):
+        """
+        获取生成器/异步生成器的结束状态
+
+        :param BaseException error: 结束迭代的异常，迭代完毕时为 None
+        :rtype: str
+        """
+        if error is None:
+            return cls.STATUS_DONE
+        return cls.STATUS_CLOSED if isinstance(error, GeneratorExit) else cls.STATUS_ERROR
+
+    def _start_generator(self, func, args, kwargs):
+        """
+        在生成器首次迭代时启动秒表
+
+        :param func: 被观察的生成器函数
+        :type func: types.FunctionType or types.MethodType
+        :param tuple args: 位置参数
+        :param dict kwargs: 关键字参数
+        """
+        self._start(func, args, kwargs)
+        if self.streaming:
+            self.item_timer = streaming.ItemTimer(self.clock, self.dkwargs['begin_time'])
+
+    def _streaming_step(self, method, *args):
+        """
+        流式模式下推进一步生成器，并统计其生产耗时
+
+        :param function method: 生成器的 ``send`` / ``throw`` / ``close`` 方法
+        :param list args: 方法的参数
+        :return: 生成器产出的值
+        """
+        return self.item_timer.step(self._step, method, *args)
+
+    def _finish_generator(self, error):
+        """
+        生成器结束时结束秒表
+
+        :param BaseException error: 结束迭代的异常，迭代完毕时为 None
+        """
+        if self.item_timer is not None:
+            self.run_ns = self.item_timer.run_ns
+            self.dkwargs.update(self.item_timer.as_fields(self.clock()))
+        self.dkwargs['status'] = self.generator_status(error)
+        self._end()
+
+    @property
+    def item_stats(self):
+        """
+        流式模式下各元素的生产耗时统计，单位 ``ns`` ，未开始迭代或未开启流式模式时为 None
+
+        :rtype: stats.RunningStats
+        """
+        return self.item_timer.item_stats if self.item_timer is not None else None
+
     def wrap_function(self, func, wrap_param):
         """
         封装一个函数从而使用秒表对其进行观察
@@ -179,56 +647,123 @@ class Stopwatch(object):  # pylint: disable=R0902
             """
             在被装饰函数执行前后进行秒表计时
             """
-            self._start(func, args, kwargs)
-            result = func(*args, **kwargs)
-            self._end()
-            return result
+            return self.spawn().run_function(func, args, kwargs)
         return inner
 
+    def run_function(self, func, args, kwargs):
+        """
+        使用秒表观察一次函数的执行
+
+        :param func: 被观察的函数
+        :type func: types.FunctionType or types.MethodType
+        :param tuple args: 位置参数
+        :param dict kwargs: 关键字参数
+        :return: 被观察函数的返回值
+        """
+        self._start(func, args, kwargs)
+        token = self._activate()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException:
+            self._abort()
+            raise
+        finally:
+            self._deactivate(token)
+        self._end()
+        return result
+
     def dotting(self, fmt='', logging_level=None, memory=False, mute=False, **kwargs):
         """
         输出打点日志
 
         会在打点时记录当前的时间&进程内存使用(若 ``memory`` 为 ``True``)，并将其与上次的打点记录做差，
-        分别获取时间差 ``time_diff`` 、内存差 ``memory_diff`` ，再将其与进入函数时的记录做差，
-        分别获取到时间差 ``time_total`` 、内存差 ``memory_total`` 。
+        分别获取时间差 ``time_diff`` 、内存差 ``mem_diff`` ，再将其与进入函数时的记录做差，
+        分别获取到时间差 ``time_total`` 、内存差 ``mem_total`` 。
 
         将以上四个变量传入 ``fmt`` 模板中格式化后输出到 ``log`` 。
         除上述变量外，您还可以使用装饰器参数中指定的变量。
 
         注意仅当 ``memory`` 为真时，才会记录日志情况，否则将直接跳过。
+        若装饰时未开启 ``print_mem`` ，则进入函数/方法时不会采样内存，此时将以首次记录内存的打点作为基准。
 
         日志输出模板中可使用变量如下:
 
         #. ``idx`` : 当前打点的序号，从 *1* 开始
         #. ``time_diff`` : 距上次打点间的时间差
         #. ``time_total`` : 距函数/方法开始时的时间差
-        #. ``memory_diff`` : 距上次打点(memory=True)间的内存差，跳过未记录内存的时间打点，直到函数/方法进入时的内存记录
-        #. ``memory_total`` : 距函数/方法开始时的内存差
+        #. ``mem_diff`` : 距上次打点(memory=True)间的内存差，跳过未记录内存的时间打点，直到函数/方法进入时的内存记录，单位 ``Byte``
+        #. ``mem_total`` : 距函数/方法开始时的内存差，单位 ``Byte``
+        #. ``mem_diff_mb`` / ``mem_total_mb`` : 以 ``MB`` 为单位的上述内存差
+        #. ``time_diff_ns`` / ``time_total_ns`` : 以整数纳秒表示的上述时间差
+        #. ``cpu_diff`` / ``cpu_total`` : 距上次打点/函数开始时的 CPU 时间差，仅在装饰时指定 ``cpu_clock`` 时可用
+        #. ``cpu_diff_ns`` / ``cpu_total_ns`` : 以整数纳秒表示的上述 CPU 时间差
 
         :param str fmt: 用来输出打点日志的格式化模板，需使用 format 的占位符格式
         :param int logging_level: 日志输出级别，默认使用装饰当前方法时设置的级别，若无则使用类属性中定义的默认值
         :param bool memory: 是否记录内存使用，默认为 False
         :param bool mute: 静默打点，默认为 False ，若设为 True ，则当次仅记录时间/内存，不执行任何输出逻辑
         """
-        self.time_buf.append(time.time())
+        self.time_buf.append(self.clock())
+        if self.cpu_clock:
+            self.cpu_buf.append(self.cpu_clock())
         if memory:
-            self.mem_buf.append(self._get_mem_info())
-        if mute:
+            _mem = self._get_mem_info()
+            if not self.mem_buf:
+                self.mem_buf.append(_mem)
+            self.mem_buf.append(_mem)
+        _level = logging_level or self.logging_level
+        if mute or not self.logger.isEnabledFor(_level):
             return
 
-        idx = len(self.time_buf) - 1
         _fmt = fmt or (self.DOTTING_FMT_WITH_MEM_DEFAULT if memory else self.DOTTING_FMT_DEFAULT)
-        _level = logging_level or self.logging_level
-        kwargs.update(self.dkwargs)
+        if self.cpu_clock:
+            if not fmt:
+                _fmt += self.DOTTING_FMT_CPU_SUFFIX
+            kwargs['cpu_diff_ns'] = self.cpu_buf[-1] - self.cpu_buf[-2]
+            kwargs['cpu_total_ns'] = self.cpu_buf[-1] - self.cpu_buf[0]
+            kwargs['cpu_diff'] = clock.ns_to_sec(kwargs['cpu_diff_ns'])
+            kwargs['cpu_total'] = clock.ns_to_sec(kwargs['cpu_total_ns'])
+        time_diff_ns = self.time_buf[-1] - self.time_buf[-2]
+        time_total_ns = self.time_buf[-1] - self.time_buf[0]
+
+        kwargs.update(
+            time_diff=clock.ns_to_sec(time_diff_ns),
+            time_total=clock.ns_to_sec(time_total_ns),
+            time_diff_ns=time_diff_ns,
+            time_total_ns=time_total_ns,
+            idx=len(self.time_buf) - 1,
+        )
+        if memory:
+            kwargs.update(
+                mem_diff=self.mem_buf[-1] - self.mem_buf[-2],
+                mem_total=self.mem_buf[-1] - self.mem_buf[0],
+                mem_diff_mb=meminfo.bytes_to_mb(self.mem_buf[-1] - self.mem_buf[-2]),
+                mem_total_mb=meminfo.bytes_to_mb(self.mem_buf[-1] - self.mem_buf[0]),
+            )
+        else:
+            kwargs.update(mem_diff=None, mem_total=None, mem_diff_mb=None, mem_total_mb=None)
+        # 装饰器参数中的变量优先于打点时传入的变量
+        self._log(_level, 'dotting', _fmt, kwargs, self.dkwargs)
 
-        self.logger.log(_level, _fmt.format(
-            time_diff=self.time_buf[-1] - self.time_buf[-2],
-            time_total=self.time_buf[-1] - self.time_buf[0],
-            mem_diff=(self.mem_buf[-1] - self.mem_buf[-2]) if memory else None,
-            mem_total=(self.mem_buf[-1] - self.mem_buf[0]) if memory else None,
-            idx=idx,
-            **kwargs))
+
+class _CurrentStopwatch(object):
+    """
+    :py:attr:`StopwatchMixin.stopwatch` 属性的描述符
+
+    返回当前线程/asyncio 任务中正在运行的秒表，即最内层正在执行的被装饰函数/方法所使用的秒表，
+    与通过哪个对象访问无关：被装饰方法调用了另一个被装饰方法（无论是否属于同一对象）时，
+    在内层方法执行期间 ``self.stopwatch`` 为内层方法的秒表，返回后恢复为外层方法的秒表，
+    外层秒表可通过 :py:attr:`Stopwatch.parent` 或 :py:attr:`Stopwatch.root` 获取。
+
+    该属性只读，赋值时抛出 ``AttributeError`` ，避免实例属性覆盖描述符后静默地获取到错误的秒表。
+    描述符只作用于该属性，不会拦截对象其余属性的访问，被装饰方法内的属性访问仍为原生速度
+    """
+
+    def __get__(self, obj, owner=None):
+        return _CURRENT.get()
+
+    def __set__(self, obj, value):
+        raise AttributeError('stopwatch 属性为当前正在运行的秒表，不能赋值')
 
 
 class StopwatchMixin(base.ProfilerMixin):
@@ -239,8 +774,10 @@ class StopwatchMixin(base.ProfilerMixin):
 
     #. 针对需要多次调用的方法进行累加记录的场景
     #. 在一次代码执行流程中同时记录多个方法，并灵活控制记录结果的输出
+
+    被装饰方法内可通过 ``self.stopwatch`` / ``cls.stopwatch`` 获取本次调用的秒表，不在秒表观察范围内时为 None
     """
-    stopwatch = None  # type: Stopwatch
+    stopwatch = _CurrentStopwatch()  # type: Stopwatch
 
     @classmethod
     @contextmanager
@@ -248,22 +785,38 @@ class StopwatchMixin(base.ProfilerMixin):
         """
         获取秒表对象
 
-        :param object self_or_cls: 被代理的对象 or 类
+        秒表已改为通过 :py:attr:`stopwatch` 描述符从当前上下文中获取，此处不再代理被装饰方法的对象，
+        仅保留该上下文管理器供子类覆写，以便在被装饰方法执行前后根据调用参数进行额外处理
+
+        :param object self_or_cls: 被装饰方法的对象 or 类
         :param dict callargs: 调用该上下文管理器时传入的所有调用参数
-        :return: 返回被代理的对象 or 类
-        :rtype: Iterator[base.Proxy]
+        :return: 返回传给被装饰方法的对象 or 类
+        :rtype: Iterator[StopwatchMixin]
         """
         with super(StopwatchMixin, cls)._get_profiler(
             self_or_cls, **callargs) as _self_or_cls:
-            yield base.proxy(
-                _self_or_cls,
-                prop_name='stopwatch',
-                prop=Stopwatch())
+            yield _self_or_cls
+
 
+def _has_context(self_or_cls):
+    """
+    是否覆写了用于在被装饰方法执行前后进行额外处理的上下文管理器，
+    未覆写时默认实现不使用 callargs ，故无需绑定
+
+    :param StopwatchMixin self_or_cls: 被装饰方法的对象 or 类
+    :rtype: bool
+    """
+    return (base.overrides(self_or_cls, '_get_stopwatch', StopwatchMixin) or
+            base.overrides(self_or_cls, '_get_profiler', base.ProfilerMixin))
 
-def stopwatch(
+
+def stopwatch(  # pylint: disable=W0621
         _function=None, print_args=False, logger=None, print_mem=False,
-        fmt='', name='', logging_level=logging.INFO, **dkwargs):
+        fmt='', name='', logging_level=logging.INFO,
+        clock=clock.CLOCK_DEFAULT, cpu_clock=None, mem_backend=None, mem_interval=None,
+        aggregate=False, report_every=None, report_interval=None, registry=None,
+        print_tree=False, collapsed_file=None, structured=False, exporter=None, streaming=False,
+        print_gc=False, **dkwargs):
     """
     返回秒表监控下的函数或方法
 
@@ -274,8 +827,50 @@ def stopwatch(
     #. ``name`` : 当前秒表名称
     #. ``args`` : 被装饰函数/方法的位置参数
     #. ``kwargs`` : 被装饰函数/方法
-    #. ``time_use`` : 函数/方法执行耗时
-    #. ``mem_use`` : 函数/方法执行内存
+    #. ``time_use`` : 函数/方法执行耗时，单位 ``s``
+    #. ``time_use_ns`` : 函数/方法执行耗时，单位 ``ns``
+    #. ``cpu_use`` / ``cpu_use_ns`` : 函数/方法执行期间消耗的 CPU 时间，仅在指定 ``cpu_clock`` 时可用
+    #. ``mem_use`` : 函数/方法执行前后的内存变化，单位 ``Byte`` ，仅在开启 ``print_mem`` 时可用
+    #. ``mem_use_mb`` : 函数/方法执行前后的内存变化，单位 ``MB``
+    #. ``mem_peak`` / ``mem_peak_mb`` : 执行期间内存峰值相对于进入时的增量，单位 ``Byte`` / ``MB`` ，
+       仅在指定 ``mem_interval`` 时可用
+    #. ``mem_mean`` / ``mem_mean_mb`` : 执行期间内存均值相对于进入时的增量，仅在指定 ``mem_interval`` 时可用
+    #. ``mem_samples`` : 执行期间的内存采样次数，包含进入与退出时的采样，仅在指定 ``mem_interval`` 时可用
+    #. ``gc_collections`` 、 ``gc_collected`` 、 ``gc_uncollectable`` : 执行期间各代垃圾回收的次数、回收的对象数、
+       无法回收的对象数之和，仅在开启 ``print_gc`` 时可用
+    #. ``gc_pause`` / ``gc_pause_ns`` : 执行期间垃圾回收造成的暂停时间之和，仅在开启 ``print_gc`` 时可用
+    #. ``gc0_collections`` 、 ``gc2_pause`` 等: 按代的上述统计，代数为 0 至 2 ，仅在开启 ``print_gc`` 时可用
+    #. ``run_use`` / ``run_use_ns`` : 协程/异步生成器在事件循环上真正运行的时间，仅装饰协程时可用
+    #. ``depth`` : 在调用树中的深度，最外层的秒表为 0
+    #. ``self_use`` / ``self_use_ns`` : 扣除内层秒表耗时后的自身耗时
+    #. ``child_use`` / ``child_use_ns`` : 内层秒表的累计耗时
+    #. ``suspend_use`` / ``suspend_use_ns`` : 协程/异步生成器挂起等待的时间，仅装饰协程时可用
+    #. ``status`` : 生成器的结束状态， ``done`` 为迭代完毕， ``closed`` 为被消费者提前关闭， ``error`` 为抛出异常，
+       仅装饰生成器或异步生成器时可用
+
+    以流式模式( ``streaming=True`` )装饰生成器时，秒表会逐个元素统计生成器自身的生产耗时，不含消费者处理元素的时间，
+    各元素耗时以固定内存的流式统计量记录，可通过 :py:attr:`Stopwatch.item_stats` 获取，
+    详见 :py:mod:`moprofiler.streaming` ，输出模板中额外可使用:
+
+    #. ``item_count`` : 产出的元素个数
+    #. ``first_item_use`` / ``first_item_use_ns`` : 从开始迭代到产出首个元素的时间，未产出元素时为 0
+    #. ``run_use`` / ``run_use_ns`` : 生成器自身的累计生产耗时
+    #. ``suspend_use`` / ``suspend_use_ns`` : 控制权交还消费者的累计时间
+    #. ``item_mean`` 、 ``item_min`` 、 ``item_max`` 、 ``item_p50`` 、 ``item_p90`` 、 ``item_p99`` :
+       单个元素生产耗时的统计量，单位 ``s``
+    #. ``throughput`` : 吞吐量，即每秒产出的元素个数
+
+    开启聚合模式( ``aggregate=True`` )后，将不再逐次输出，而是按秒表名称汇总耗时，
+    每满 ``report_every`` 次调用或每隔 ``report_interval`` 秒输出一行汇总，
+    汇总后该名称的统计重新开始（已汇总的统计仍计入 :py:meth:`~moprofiler.stats.StatsRegistry.cumulative` ）；
+    也可通过 :py:data:`moprofiler.stats.REGISTRY` 随时获取快照或清空统计。
+    汇总输出模板中可使用变量如下（时间单位均为 ``s`` ）:
+
+    #. ``name`` : 当前秒表名称
+    #. ``count`` : 调用次数
+    #. ``sum`` 、 ``min`` 、 ``max`` 、 ``mean`` : 总耗时、最小、最大、平均耗时
+    #. ``variance`` 、 ``stdev`` : 耗时的方差、标准差
+    #. ``p50`` 、 ``p90`` 、 ``p99`` : 耗时的分位数，由固定内存的流式草图估计，相对误差不超过 1%
 
     :param _function: 被封装的对象，由解释器自动传入，不需关心
     :type _function: types.FunctionType or types.MethodType
@@ -283,8 +878,32 @@ def stopwatch(
     :param logging.Logger logger: 可传入指定的日志对象，便于统一输出样式，默认使用该模块中的全局 logger
     :param bool print_mem: 是否在方法退出时打印内存信息，默认为 False
     :param str fmt: 用于格式化输出的模板，可在了解所有内置参数变量后自行定制输出样式，若指定该参数则会忽略 print_args
-    :param str name: 关键字参数，被装饰方法代理生成的 stopwatch 所使用的名称，默认为使用被装饰方法的方法名
+    :param str name: 关键字参数，被装饰方法代理生成的 stopwatch 所使用的名称，
+        默认为使用被装饰方法的限定名（如 ``Class.method`` ）， ``Python 2`` 中为方法名
     :param int logging_level: 打印日志的级别，默认为 INFO
+    :param clock: 计时使用的时钟，可选 ``perf_counter_ns`` 、 ``monotonic_ns`` 、 ``process_time_ns`` 、
+        ``thread_time_ns`` ，也可传入返回整数纳秒的可调用对象，默认为 ``perf_counter_ns``
+    :type clock: str or function
+    :param cpu_clock: 额外统计 CPU 时间使用的时钟，一般为 ``process_time_ns`` 或 ``thread_time_ns`` ，
+        与墙上耗时对比即可区分等待锁/IO 的时间与真实的 CPU 消耗，默认不统计
+    :type cpu_clock: str or function
+    :param str mem_backend: 内存采样后端，可选 ``auto`` 、 ``statm`` 、 ``psutil`` 、 ``tracemalloc`` ，
+        详见 :py:mod:`moprofiler.meminfo` ，默认为 ``auto``
+    :param float mem_interval: 后台内存追踪的采样间隔，单位 ``s`` ，指定后被观察函数执行期间由后台线程按该间隔采样内存，
+        并输出期间的内存峰值，同时会开启 ``print_mem`` ，详见 :py:mod:`moprofiler.memtrace` ，默认不追踪
+    :param bool aggregate: 是否开启聚合模式，默认为 False
+    :param int report_every: 聚合模式下每累计多少次调用输出一次汇总，默认不按次数输出
+    :param float report_interval: 聚合模式下每隔多少秒输出一次汇总（在调用结束时检查），默认不按时间输出
+    :param stats.StatsRegistry registry: 聚合模式下使用的统计量注册表，默认为全局注册表
+    :param bool print_tree: 作为最外层秒表结束时，是否输出由内层秒表汇总而成的调用树，默认为 False
+    :param str collapsed_file: 作为最外层秒表结束时，以折叠栈格式追加写入调用树的文件路径，可直接用于绘制火焰图
+    :param bool structured: 是否在日志记录上附带结构化字段，开启后可通过日志记录的 ``moprofiler`` 属性
+        获取包含名称、事件类型及各数值字段的字典，详见 :py:mod:`moprofiler.record` ，默认为 False
+    :param moprofiler.export.Exporter exporter: 后台输出器，指定后日志记录仍在调用线程中创建，
+        但交由后台线程调用 logger 的处理器输出
+    :param bool streaming: 是否以流式模式观察生成器，仅对生成器生效，默认为 False
+    :param bool print_gc: 是否统计并输出执行期间（含生成器/协程挂起的时间）的垃圾回收，
+        回收会暂停所有线程，故同时计入所有进行中的调用，详见 :py:mod:`moprofiler.gcstats` ，默认为 False
     :return: 装饰后的函数
     :rtype: types.FunctionType or types.MethodType
     """
@@ -299,34 +918,76 @@ def stopwatch(
         'logging_level': logging_level,
         'dkwargs': dkwargs,
         'print_mem': print_mem,
+        'clock': clock,
+        'cpu_clock': cpu_clock,
+        'mem_backend': mem_backend,
+        'mem_interval': mem_interval,
+        'aggregate': aggregate,
+        'report_every': report_every,
+        'report_interval': report_interval,
+        'registry': registry,
+        'print_tree': print_tree,
+        'collapsed_file': collapsed_file,
+        'structured': structured,
+        'exporter': exporter,
+        'streaming': streaming,
+        'print_gc': print_gc,
     }
 
     def wrapper(func):
         """
         装饰器封装函数
+
+        在装饰时一次性解析秒表参数、判断是否为生成器/协程并创建用于获取 callargs 的绑定器，
+        从而使每次调用时仅剩计时本身的开销
         """
-        @wraps(func)
-        def inner(*args, **kwargs):
-            """
-            使用秒表封装被装饰对象
+        param = Stopwatch.resolve_param(wrap_param, func)
+        run = Stopwatch.get_runner(func)
+        binder = base.CallargsBinder(func)
 
-            若被封装方法的首个位置参数继承了 StopwatchMixin 则将被封装方法所用的
-            self_or_cls 进行代理，从而在方法内可以访问到被代理的 stopwatch 属性
+        def get_context(args, kwargs):
+            """
+            获取执行被装饰方法时进入的上下文
 
-            若被封装方法的首个位置参数未继承 StopwatchMixin 则作为普通函数处理
+            若被封装方法的首个位置参数继承了 StopwatchMixin ，且其类覆写了 _get_stopwatch / _get_profiler ，
+            则绑定 callargs 并返回其 _get_stopwatch 上下文，否则返回 None 直接执行
 
-            :param list args: 位置参数
+            :param tuple args: 位置参数
+            :param dict kwargs: 关键字参数
+            :rtype: contextlib.AbstractContextManager
             """
             if not (args and base.is_instance_or_subclass(args[0], StopwatchMixin)):
                 # 若当前被装饰的方法未继承 StopwatchMixin ，则将其作为普通函数装饰
-                _stopwatch_wrapper = Stopwatch()(func, wrap_param)
-                return _stopwatch_wrapper(*args, **kwargs)
-
+                return None
             self_or_cls = args[0]  # type: StopwatchMixin
-            callargs = base.get_callargs(func, *args, **kwargs)
+            if not _has_context(self_or_cls):
+                return None
+            callargs = binder.bind(*args, **kwargs)
             callargs.pop("cls", None)
-            with self_or_cls._get_stopwatch(self_or_cls, **callargs) as _self_or_cls:
-                _stopwatch_wrapper = _self_or_cls.stopwatch(func, wrap_param)
-                return _stopwatch_wrapper(_self_or_cls, *args[1:], **kwargs)
+            return self_or_cls._get_stopwatch(self_or_cls, **callargs)
+
+        def call(args, kwargs):
+            """使用新的秒表观察一次调用"""
+            return run(Stopwatch(param), func, args, kwargs)
+
+        if coroutine and inspect.iscoroutinefunction(func):
+            # 协程需在被等待时才进入上下文，使上下文覆盖协程的整个执行过程
+            return coroutine.as_context_coroutine_function(func, get_context, call)
+
+        @wraps(func)
+        def inner(*args, **kwargs):
+            """
+            使用秒表封装被装饰对象
+
+            方法内可通过 stopwatch 属性访问到本次调用的秒表，
+            callargs 仅在其类覆写了 _get_stopwatch / _get_profiler 时才会绑定，否则直接执行
+
+            :param list args: 位置参数
+            """
+            context = get_context(args, kwargs)
+            if context is None:
+                return run(Stopwatch(param), func, args, kwargs)
+            with context as _self_or_cls:
+                return run(Stopwatch(param), func, (_self_or_cls,) + args[1:], kwargs)
         return inner
     return wrapper if not invoked else wrapper(func)
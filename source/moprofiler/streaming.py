@@ -0,0 +1,78 @@
+# encoding=utf8
+"""
+提供生成器的流式观察
+
+生成器每产出一个元素都会将控制权交还消费者，仅在迭代前后计时无法区分生成器自身的生产耗时与消费者处理元素的时间。
+:py:class:`ItemTimer` 在生成器每推进一步前后计时，逐个元素统计生产耗时，
+各元素耗时以固定内存的流式统计量记录，故无论生成器产出多少元素，内存占用均固定。
+
+可通过秒表的 ``streaming`` 参数开启，详见 :py:func:`moprofiler.stopwatch.stopwatch`
+"""
+from __future__ import absolute_import
+
+from . import clock as _clock
+from . import stats
+
+
+class ItemTimer(object):
+    """
+    生成器逐元素计时器
+    """
+
+    def __init__(self, clock, begin_ns):
+        """
+        :param function clock: 返回整数纳秒的时钟函数
+        :param int begin_ns: 生成器开始迭代的时间，单位 ``ns``
+        """
+        self.clock = clock
+        self.begin_ns = begin_ns
+        self.item_stats = stats.RunningStats()  #: 各元素的生产耗时统计，单位 ``ns``
+        self.run_ns = 0  #: 生成器自身的累计生产耗时，单位 ``ns``
+        self.first_item_ns = None  #: 首个元素产出时距开始的时间，单位 ``ns`` ，未产出元素时为 None
+
+    def step(self, step, method, *args):
+        """
+        推进一步生成器，并统计其生产耗时
+
+        :param function step: 推进生成器的方法，以 ``method`` 及其参数调用
+        :param function method: 生成器的 ``send`` / ``throw`` / ``close`` 方法
+        :param list args: 方法的参数
+        :return: 生成器产出的值
+        """
+        begin = self.clock()
+        try:
+            item = step(method, *args)
+        finally:
+            elapsed = self.clock() - begin
+            self.run_ns += elapsed
+        # 关闭生成器时没有参数，也不产出元素，其中的清理逻辑仅计入生产耗时
+        if args:
+            self.item_stats.add(elapsed)
+            if self.first_item_ns is None:
+                self.first_item_ns = self.clock() - self.begin_ns
+        return item
+
+    def as_fields(self, end_ns):
+        """
+        获取用于输出的变量
+
+        :param int end_ns: 生成器结束迭代的时间，单位 ``ns``
+        :rtype: dict
+        """
+        item_stats = self.item_stats
+        first_item_ns = self.first_item_ns or 0
+        snapshot = item_stats.snapshot(scale=_clock.NS_PER_SEC)
+        time_use_ns = end_ns - self.begin_ns
+        return {
+            'item_count': item_stats.count,
+            'first_item_use_ns': first_item_ns,
+            'first_item_use': _clock.ns_to_sec(first_item_ns),
+            'item_mean': snapshot['mean'],
+            'item_min': snapshot['min'],
+            'item_max': snapshot['max'],
+            'item_p50': snapshot['p50'],
+            'item_p90': snapshot['p90'],
+            'item_p99': snapshot['p99'],
+            'throughput': (
+                item_stats.count * _clock.NS_PER_SEC / float(time_use_ns) if time_use_ns else 0.0),
+        }
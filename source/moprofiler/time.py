@@ -7,9 +7,9 @@ from __future__ import absolute_import
 import logging
 import types  # pylint: disable=W0611
 
-from line_profiler import LineProfiler
+from line_profiler import LineProfiler, show_text
 
-from . import base
+from . import base, registry
 
 LOG = logging.getLogger(__name__)
 
@@ -17,6 +17,7 @@ LOG = logging.getLogger(__name__)
 class TimeProfiler(base.ProfilerClassDecorator):
     """时间分析器的类装饰器"""
     profiler_factory = LineProfiler
+    report_kind = registry.KIND_TIME
 
     def __init__(
             self, _function=None, stream=None,
@@ -39,12 +40,46 @@ class TimeProfiler(base.ProfilerClassDecorator):
         self._output_unit = output_unit
         self._stripzeros = stripzeros
 
-    def print_stats(self):
-        """打印统计结果"""
-        self.profiler.print_stats(
-            stream=self._stream,
+    def snapshot_stats(self):
+        """
+        获取当前统计结果的快照
+
+        :return: 逐行统计结果、协程统计及垃圾回收统计
+        :rtype: tuple
+        """
+        return self.profiler.get_stats(), self._coroutine_stats(), self._gc_snapshot()
+
+    def render_stats(self, snapshot, stream=None):
+        """
+        输出统计结果的快照
+
+        :param tuple snapshot: 由 :py:meth:`snapshot_stats` 获取的快照
+        :param object stream: 输出方式，默认为 stdout ，可指定为文件
+        """
+        lstats, coroutine_stats, gc_stats = snapshot
+        show_text(
+            lstats.timings, lstats.unit,
             output_unit=self._output_unit,
+            stream=stream,
             stripzeros=self._stripzeros)
+        self._print_coroutine_stats(stream, coroutine_stats)
+        self._print_gc_stats(stream, gc_stats)
+
+    def line_records(self):
+        """
+        获取逐行统计记录，数值为各行总耗时，单位 ``s``
+
+        :rtype: Iterator[registry.LineRecord]
+        """
+        lstats = self.profiler.get_stats()
+        for (filename, _first_lineno, func_name), lines in lstats.timings.items():
+            for lineno, hits, total in lines:
+                yield registry.LineRecord(
+                    registry.KIND_TIME, filename, lineno, func_name, hits, total * lstats.unit)
+
+    def print_stats(self):
+        """打印统计结果"""
+        self.render_stats(self.snapshot_stats(), self._stream)
 
 
 time_profiler = TimeProfiler  #: 此变量是为了向后兼容旧版本的命名
@@ -78,3 +78,84 @@ class TestBase(object):
         callargs.pop('cls', None)
         assert expect == callargs
         assert expect == base.get_callargs(test_closure_call, 10, 20, 1, 2, e='e', d='d')
+
+    @staticmethod
+    def test_callargs_binder():
+        """测试 callargs 绑定器包含默认值及可变参数，并将绑定方法的 cls 计入其中"""
+        def plain(a, b=2, c=3):
+            return a + b + c
+
+        def kwonly(a, *args, **kwargs):
+            return a
+
+        cases = [
+            (plain, (1,), {}, {'a': 1, 'b': 2, 'c': 3}),
+            (plain, (1, 5), {'c': 6}, {'a': 1, 'b': 5, 'c': 6}),
+            (plain, (), {'a': 1, 'c': 4}, {'a': 1, 'b': 2, 'c': 4}),
+            (kwonly, (1,), {}, {'a': 1, 'args': (), 'kwargs': {}}),
+            (kwonly, (1, 2, 3), {'x': 4}, {'a': 1, 'args': (2, 3), 'kwargs': {'x': 4}}),
+            (A.test_closure, (1, 2, 3), {'y': 4},
+             {'cls': A, 'a': 1, 'b': 2, 'args': (3,), 'kwargs': {'y': 4}}),
+        ]
+        for func, args, kwargs, expect in cases:
+            assert base.CallargsBinder(func).bind(*args, **kwargs) == expect
+
+        binder = base.CallargsBinder(plain)
+        for args, kwargs in [((), {}), ((1, 2, 3, 4), {}), ((1,), {'a': 2}), ((1,), {'d': 1})]:
+            with pytest.raises(TypeError):
+                binder.bind(*args, **kwargs)
+        assert base.get_binder(test_closure) is base.get_binder(test_closure)
+
+    @staticmethod
+    def test_overrides():
+        """测试判断方法是否被覆写"""
+        class B(base.ProfilerMixin):  # pylint: disable=C0111
+            pass
+
+        class C(B):  # pylint: disable=C0111
+            @classmethod
+            def _get_profiler(cls, self_or_cls, **callargs):
+                return base.ProfilerMixin._get_profiler(self_or_cls, **callargs)
+
+        assert not base.overrides(B(), '_get_profiler', base.ProfilerMixin)
+        assert base.overrides(C, '_get_profiler', base.ProfilerMixin)
+        assert base.overrides(C(), '_get_profiler', base.ProfilerMixin)
+
+    @staticmethod
+    def test_forward_generator():
+        """测试逐步驱动生成器，每一步均经过 step ，并返回被封装的生成器的返回值"""
+        events = []
+
+        def step(method, *args):
+            events.append(method.__name__)
+            return method(*args)
+
+        def generate():
+            received = yield 1
+            try:
+                yield received
+            except KeyError:
+                yield 'caught'
+            return 'result'
+
+        def delegate():
+            result = yield from base.forward_generator(
+                generate(), step, lambda: events.append('start'), events.append)
+            return result
+
+        g = delegate()
+        assert next(g) == 1 and g.send(2) == 2 and g.throw(KeyError()) == 'caught'
+        with pytest.raises(StopIteration) as exc_info:
+            next(g)
+        assert exc_info.value.value == 'result'
+        assert events == ['start', 'send', 'send', 'throw', 'send', 'close', None]
+
+        del events[:]
+        g = base.forward_generator(generate(), step, finish=events.append)
+        next(g)
+        with pytest.raises(ValueError):
+            g.throw(ValueError())
+        g = base.forward_generator(generate(), step, finish=events.append)
+        next(g)
+        g.close()
+        assert isinstance(events[3], ValueError) and isinstance(events[-1], GeneratorExit)
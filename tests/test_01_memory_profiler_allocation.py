@@ -0,0 +1,223 @@
+# encoding=utf8
+"""
+测试内存分析器的分配分析模式
+"""
+import json
+import tracemalloc
+
+import pytest
+
+from moprofiler import MemoryProfiler, allocation, binary
+from moprofiler.registry import ProfilerRegistry
+
+REGISTRY = ProfilerRegistry()
+HOLD = []
+
+
+class ListStream(object):
+    """将写入内容收集到列表中，便于断言"""
+
+    def __init__(self):
+        self.texts = []
+
+    def write(self, text):
+        self.texts.append(text)
+
+    def flush(self):
+        pass
+
+
+def keep(n):
+    """分配并持有 n 个字符串"""
+    HOLD.extend('item-{}'.format(i) * 8 for i in range(n))
+
+
+def leak(n):
+    """经由标准库分配并持有内存"""
+    HOLD.append(json.dumps(list(range(n))))
+
+
+def _line_of(func, offset):
+    """获取函数中某一行的行号"""
+    return func.__code__.co_firstlineno + offset
+
+
+@pytest.fixture(autouse=True)
+def _cleanup():
+    """每个用例结束后释放持有的内存并停止 tracemalloc"""
+    del HOLD[:]
+    yield
+    del HOLD[:]
+    tracemalloc.stop()
+
+
+def release():
+    """释放持有的内存"""
+    del HOLD[:]
+
+
+class TestMemoryProfilerAllocation(object):
+    """测试内存分析器的分配分析模式"""
+
+    @staticmethod
+    def test_top_sites():
+        """测试按行统计持有的内存分配，并按净增字节数输出"""
+        stream = ListStream()
+        profiled = MemoryProfiler(keep, mode='allocation', stream=stream, registry=REGISTRY)
+        assert isinstance(profiled.profiler, allocation.AllocationTracker)
+        profiled(1000)
+        profiled(1000)
+
+        stats, _coroutine_stats, _gc_stats = profiled.snapshot_stats()
+        top = stats[0]
+        assert top.frames == ((__file__, _line_of(keep, 2)),)
+        assert top.count >= 2000 and top.size >= 2000 * 40
+        assert all(not allocation.is_self(f) for s in stats for f, _l in s.frames)
+        text = ''.join(stream.texts)
+        assert '内存分配分析' in text and '{}:{}'.format(__file__, _line_of(keep, 2)) in text
+        assert "HOLD.extend('item-{}'.format(i) * 8 for i in range(n))" in text
+
+        record = next(iter(profiled.line_records()))
+        assert top.calls == 2
+        assert record.hits == top.calls and record.value == pytest.approx(top.size / 1048576.0)
+        assert record.func_name == 'keep'
+
+        profiled.reset_stats()
+        assert profiled.snapshot_stats()[0] == []
+
+    @staticmethod
+    def test_released():
+        """测试退出前已释放的内存不被计入"""
+        def temporary():
+            data = [str(i) for i in range(1000)]
+            return len(data)
+
+        profiled = MemoryProfiler(temporary, mode='allocation', print_res=False, registry=REGISTRY)
+        assert profiled() == 1000
+        assert sum(s.size for s in profiled.snapshot_stats()[0]) < 1000 * 20
+
+    @staticmethod
+    def test_function_name():
+        """测试按行号查找分配位置所在的最内层函数"""
+        def outer():
+            def inner():
+                return 1
+            return inner()
+
+        first = outer.__code__.co_firstlineno
+        assert allocation.function_name(__file__, _line_of(keep, 2)) == 'keep'
+        assert allocation.function_name(__file__, first) == 'outer'
+        assert allocation.function_name(__file__, first + 2) == 'inner'
+        assert allocation.function_name(__file__, first + 3) == 'outer'
+        assert allocation.function_name(__file__, 1) is None
+        assert allocation.function_name('<unknown>', 1) is None
+
+    @staticmethod
+    def test_exclude_stdlib():
+        """测试排除标准库的调用帧后，经由标准库的分配归到调用它的代码行"""
+        profiled = MemoryProfiler(
+            leak, mode='allocation', frames=8, print_res=False, registry=REGISTRY)
+        profiled(10000)
+        sites = [s.frames for s in profiled.snapshot_stats()[0]]
+        assert ((__file__, _line_of(leak, 2)),) == sites[0]
+        assert not any(allocation.is_stdlib(f) for frames in sites for f, _l in frames)
+
+        profiled = MemoryProfiler(
+            leak, mode='allocation', frames=8, exclude_stdlib=False,
+            print_res=False, registry=REGISTRY)
+        profiled(10000)
+        filename, _lineno = profiled.snapshot_stats()[0][0].frames[-1]
+        assert allocation.is_stdlib(filename)
+
+    @staticmethod
+    def test_group_by():
+        """测试按文件与按调用栈分组"""
+        def outer():
+            keep(500)
+            leak(5000)
+
+        profiled = MemoryProfiler(
+            outer, mode='allocation', frames=4, group_by='filename',
+            print_res=False, registry=REGISTRY)
+        profiled()
+        assert profiled.snapshot_stats()[0][0].frames == ((__file__, 0),)
+
+        profiled = MemoryProfiler(
+            outer, mode='allocation', frames=4, group_by='traceback',
+            sort_by='count', print_res=False, registry=REGISTRY)
+        profiled()
+        top = profiled.snapshot_stats()[0][0]
+        assert (__file__, _line_of(outer, 1)) in top.frames
+        assert top.frames[-1] == (__file__, _line_of(keep, 2))
+
+    @staticmethod
+    def test_generator():
+        """测试生成器仅在自身执行时被追踪"""
+        def produce():
+            for i in range(3):
+                HOLD.append('x' * (1000 + i))
+                yield i
+
+        profiled = MemoryProfiler(produce, mode='allocation', print_res=False, registry=REGISTRY)
+        for _i in profiled():
+            HOLD.append('y' * 100000)
+        stats = profiled.snapshot_stats()[0]
+        assert stats[0].frames == ((__file__, _line_of(produce, 2)),)
+        assert sum(s.size for s in stats) < 100000
+
+    @staticmethod
+    def test_generator_close():
+        """测试 throw 转发给被追踪的生成器，提前关闭时被追踪的生成器同样被关闭"""
+        events = []
+
+        def produce():
+            try:
+                while True:
+                    try:
+                        yield len(HOLD)
+                    except KeyError:
+                        events.append('thrown')
+            finally:
+                HOLD.append('z' * 2000)
+                events.append('closed')
+
+        profiled = MemoryProfiler(produce, mode='allocation', print_res=False, registry=REGISTRY)
+        g = profiled()
+        next(g)
+        g.throw(KeyError())
+        g.close()
+        assert events == ['thrown', 'closed']
+        site = ((__file__, _line_of(produce, 8)),)
+        assert any(s.frames == site for s in profiled.snapshot_stats()[0])
+
+    @staticmethod
+    def test_invalid():
+        """测试不支持的参数"""
+        with pytest.raises(ValueError):
+            MemoryProfiler(keep, mode='unknown', registry=REGISTRY)
+        with pytest.raises(ValueError):
+            MemoryProfiler(keep, mode='allocation', sort_by='unknown', registry=REGISTRY)
+        with pytest.raises(ValueError):
+            MemoryProfiler(keep, mode='allocation', group_by='unknown', registry=REGISTRY)
+        assert allocation.is_stdlib(json.__file__)
+        assert allocation.is_stdlib('<frozen importlib._bootstrap>')
+        assert not allocation.is_stdlib(pytest.__file__)
+        assert not allocation.is_stdlib(__file__)
+
+    @staticmethod
+    def test_freed(tmp_path):
+        """测试释放内存时净增为负数，次数仍为非负数，且可写入二进制文件"""
+        tracemalloc.start()
+        keep(1000)
+        profiled = MemoryProfiler(release, mode='allocation', print_res=False, registry=REGISTRY)
+        profiled()
+        stats = profiled.snapshot_stats()[0]
+        freed = [s for s in stats if s.frames == ((__file__, _line_of(keep, 2)),)][0]
+        assert freed.count <= -1000 and freed.size < 0 and freed.calls == 1
+
+        records = list(profiled.line_records())
+        assert all(r.hits >= 0 for r in records) and min(r.value for r in records) < 0
+        path = str(tmp_path / 'freed.mprof')
+        profiled.dump_stats(path)
+        with binary.load(path) as reader:
+            assert min(r.value for r in reader.lines()) < 0
@@ -7,6 +7,7 @@ import gc
 from memory_profiler import LineProfiler
 
 from moprofiler import MemoryProfiler
+from moprofiler.registry import ProfilerRegistry
 
 
 @MemoryProfiler
@@ -77,6 +78,25 @@ class TestMemoryProfilerToFunction(object):
         p2 = _force_new_profiler.profiler
         assert p1 is not p2
 
+    @staticmethod
+    def test_line_records_func_name():
+        """测试多个函数共用分析器时，逐行统计记录中的函数名为各行所属的函数"""
+        registry = ProfilerRegistry()
+        first = MemoryProfiler(calc_sum_2.func, print_res=False, registry=registry)
+        second = MemoryProfiler(
+            calc_sum.func, print_res=False, registry=registry, profiler=first.profiler)
+        first(100)
+        second()
+        assert set(r.func_name for r in first.line_records()) == {'calc_sum', 'calc_sum_2'}
+
+    @staticmethod
+    def test_line_records_skip_first_line():
+        """测试逐行统计记录不含记录了调用前进程内存的函数首行"""
+        profiled = MemoryProfiler(calc_sum_2.func, print_res=False, registry=ProfilerRegistry())
+        profiled(100)
+        linenos = set(r.lineno for r in profiled.line_records())
+        assert linenos and calc_sum_2.func.__code__.co_firstlineno not in linenos
+
 
 if __name__ == '__main__':
     TestMemoryProfilerToFunction.test_memory_profiler_call()
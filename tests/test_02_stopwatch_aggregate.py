@@ -0,0 +1,177 @@
+# encoding=utf8
+"""
+测试秒表的聚合模式及流式统计工具
+"""
+import logging
+import random
+import time
+
+import pytest
+
+from moprofiler import StopwatchMixin, stats, stopwatch
+
+
+class ListHandler(logging.Handler):
+    """将日志记录收集到列表中，便于断言"""
+
+    def __init__(self):
+        super(ListHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record.getMessage())
+
+
+HANDLER = ListHandler()
+LOG = logging.getLogger('test_stopwatch_aggregate')
+LOG.addHandler(HANDLER)
+LOG.setLevel(logging.DEBUG)
+REGISTRY = stats.StatsRegistry()
+
+
+@stopwatch(logger=LOG, aggregate=True, report_every=100, registry=REGISTRY)
+def _every_100():
+    pass
+
+
+@stopwatch(logger=LOG, aggregate=True, report_interval=0.05, registry=REGISTRY,
+           fmt='{name} {count}')
+def _every_50ms():
+    time.sleep(0.01)
+
+
+class Handler(StopwatchMixin):
+    """测试 Mixin 的聚合模式"""
+
+    @stopwatch(logger=LOG, aggregate=True, registry=REGISTRY, name='handler')
+    def handle(self):
+        """处理请求"""
+        self.stopwatch.dotting(mute=True)
+
+
+def _exact_quantile(values, q):
+    """与草图同样的秩定义下的精确分位数"""
+    return sorted(values)[int(q * (len(values) - 1))]
+
+
+class TestStats(object):
+    """测试流式统计工具"""
+
+    @staticmethod
+    def test_sketch_accuracy():
+        """测试分位数估计的相对误差"""
+        values = [random.lognormvariate(10, 2) for _i in range(20000)]
+        sketch = stats.QuantileSketch()
+        for value in values:
+            sketch.add(value)
+        for q in (0.5, 0.9, 0.99):
+            exact = _exact_quantile(values, q)
+            assert abs(sketch.quantile(q) - exact) <= exact * 0.0101
+        assert stats.QuantileSketch().quantile(0.5) is None
+
+    @staticmethod
+    def test_sketch_bounded_and_merge():
+        """测试草图的内存有界且可合并"""
+        sketch = stats.QuantileSketch(max_bins=64)
+        other = stats.QuantileSketch(max_bins=64)
+        for i in range(1, 100000, 7):
+            sketch.add(i)
+            other.add(i * 1000)
+        other.add(0)
+        assert len(sketch.bins) <= 64
+        sketch.merge(other)
+        assert len(sketch.bins) <= 64
+        assert sketch.count == other.count * 2 - 1
+        restored = stats.QuantileSketch.from_dict(sketch.to_dict())
+        assert restored.quantile(0.99) == sketch.quantile(0.99)
+        with pytest.raises(ValueError):
+            sketch.merge(stats.QuantileSketch(relative_accuracy=0.05))
+
+    @staticmethod
+    def test_running_stats():
+        """测试流式统计量与精确结果一致"""
+        values = [random.randint(1, 10 ** 6) for _i in range(1001)]
+        left, right = stats.RunningStats(), stats.RunningStats()
+        for i, value in enumerate(values):
+            (left if i % 2 else right).add(value)
+        left.merge(right)
+        mean = sum(values) / float(len(values))
+        variance = sum((v - mean) ** 2 for v in values) / len(values)
+        snap = left.snapshot()
+        assert snap['count'] == len(values)
+        assert snap['sum'] == sum(values)
+        assert snap['min'] == min(values) and snap['max'] == max(values)
+        assert snap['mean'] == pytest.approx(mean)
+        assert snap['variance'] == pytest.approx(variance)
+        assert snap['p50'] == pytest.approx(_exact_quantile(values, 0.5), rel=0.0101)
+        restored = stats.RunningStats.from_dict(left.to_dict())
+        assert restored.snapshot() == snap
+
+
+class Other(StopwatchMixin):
+    """与 Handler 中的方法同名，测试默认名称可区分不同类中的同名方法"""
+
+    @stopwatch(logger=LOG, aggregate=True, registry=REGISTRY)
+    def handle(self):
+        """处理请求"""
+
+
+class Another(StopwatchMixin):
+    """与 Other 中的方法同名"""
+
+    @stopwatch(logger=LOG, aggregate=True, registry=REGISTRY)
+    def handle(self):
+        """处理请求"""
+
+
+class TestStopwatchAggregate(object):
+    """测试秒表的聚合模式"""
+
+    @staticmethod
+    def test_report_every():
+        """测试按调用次数汇总输出"""
+        del HANDLER.records[:]
+        for _i in range(250):
+            _every_100()
+        assert len(HANDLER.records) == 2
+        assert '调用次数: 100' in HANDLER.records[0]
+        assert 'P99' in HANDLER.records[0]
+        assert REGISTRY.snapshot('_every_100')['count'] == 50
+        # 已汇总输出的统计仍计入累计统计，供落盘及二进制文件使用
+        cumulative = REGISTRY.cumulative()['_every_100']
+        assert cumulative.count == 250 and REGISTRY.get('_every_100').count == 50
+
+    @staticmethod
+    def test_report_interval():
+        """测试按时间间隔汇总输出"""
+        del HANDLER.records[:]
+        for _i in range(12):
+            _every_50ms()
+        assert 1 <= len(HANDLER.records) <= 3
+        assert all(r.startswith('_every_50ms ') for r in HANDLER.records)
+
+    @staticmethod
+    def test_snapshot_and_reset():
+        """测试获取快照与清空统计"""
+        del HANDLER.records[:]
+        for _i in range(10):
+            Handler().handle()
+        assert not HANDLER.records
+        snap = REGISTRY.snapshot('handler', reset=True)
+        assert snap['count'] == 10
+        assert snap['min'] <= snap['p50'] <= snap['p99'] <= snap['max']
+        assert REGISTRY.snapshot('handler') is None
+        Handler().handle()
+        assert 'handler' in REGISTRY.names()
+        REGISTRY.reset()
+        assert REGISTRY.snapshot() == {}
+        assert not REGISTRY.cumulative()
+
+    @staticmethod
+    def test_qualified_name():
+        """测试不同类中的同名方法默认按限定名分别聚合"""
+        for _i in range(3):
+            Other().handle()
+        Another().handle()
+        assert REGISTRY.snapshot('Other.handle', reset=True)['count'] == 3
+        assert REGISTRY.snapshot('Another.handle', reset=True)['count'] == 1
@@ -0,0 +1,111 @@
+# encoding=utf8
+"""
+测试秒表的嵌套调用与调用树汇总
+"""
+import io
+import logging
+import time
+
+from moprofiler import StopwatchMixin, calltree, stopwatch
+from moprofiler.stopwatch import current_stopwatch
+
+
+class ListHandler(logging.Handler):
+    """将日志记录收集到列表中，便于断言"""
+
+    def __init__(self):
+        super(ListHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record.getMessage())
+
+
+HANDLER = ListHandler()
+LOG = logging.getLogger('test_stopwatch_calltree')
+LOG.addHandler(HANDLER)
+LOG.setLevel(logging.DEBUG)
+LOG.propagate = False
+FMT = '{name} {depth} {time_use_ns} {self_use_ns} {child_use_ns}'
+
+
+@stopwatch(logger=LOG, fmt=FMT)
+def _leaf():
+    time.sleep(0.01)
+
+
+class Service(StopwatchMixin):
+    """测试 Mixin 下的嵌套调用"""
+
+    @stopwatch(logger=LOG, fmt=FMT)
+    def step(self):
+        """内层步骤"""
+        _leaf()
+        _leaf()
+
+    @stopwatch(logger=LOG, fmt=FMT, print_tree=True)
+    def handle(self, stream):
+        """外层请求"""
+        for _i in range(3):
+            self.step()
+        assert current_stopwatch() is self.stopwatch
+        assert '_leaf [6次]' in self.stopwatch.format_tree()
+        self.stopwatch.write_collapsed(stream)
+
+
+class TestStopwatchCallTree(object):
+    """测试秒表的调用树"""
+
+    @staticmethod
+    def test_nested():
+        """测试嵌套调用的深度与自身耗时"""
+        del HANDLER.records[:]
+        stream = io.StringIO()
+        Service().handle(stream)
+        records = [r.split() for r in HANDLER.records if '调用树' not in r]
+        assert [(r[0], r[1]) for r in records[:3]] == [
+            ('_leaf', '2'), ('_leaf', '2'), ('Service.step', '1')]
+        for _name, _depth, time_use_ns, self_use_ns, child_use_ns in records:
+            assert int(self_use_ns) + int(child_use_ns) == int(time_use_ns)
+        name, depth, time_use_ns, self_use_ns, child_use_ns = records[-1]
+        assert (name, depth) == ('Service.handle', '0')
+        assert int(child_use_ns) >= 6 * 10 ** 7
+        assert int(self_use_ns) < int(child_use_ns)
+
+        tree = [r for r in HANDLER.records if '调用树' in r][0].splitlines()
+        assert tree[0] == '[性能] Service.handle 调用树:'
+        assert tree[1].startswith('Service.handle [1次]')
+        assert tree[2].startswith('    Service.step [3次]')
+        assert tree[3].startswith('        _leaf [6次]')
+        paths = [line.rsplit(' ', 1)[0] for line in stream.getvalue().splitlines()]
+        assert paths == ['Service.handle;Service.step', 'Service.handle;Service.step;_leaf']
+
+    @staticmethod
+    def test_collapsed_file(tmpdir):
+        """测试最外层秒表结束时以折叠栈格式写入文件"""
+        path = str(tmpdir.join('stacks.txt'))
+
+        @stopwatch(logger=LOG, fmt=FMT, collapsed_file=path)
+        def _root():
+            _leaf()
+
+        _root()
+        _root()
+        _leaf()
+        with open(path) as f:
+            lines = f.read().splitlines()
+        assert [line.rsplit(' ', 1)[0] for line in lines if '_leaf' in line] == \
+            ['_root;_leaf', '_root;_leaf']
+        assert all(int(line.rsplit(' ', 1)[1]) > 0 for line in lines)
+
+    @staticmethod
+    def test_merge():
+        """测试调用树节点的合并"""
+        root, other = calltree.CallTreeNode('a'), calltree.CallTreeNode('a')
+        for node in (root, other):
+            node.count, node.total_ns, node.self_ns = 1, 100, 40
+            child = node.child('b')
+            child.count, child.total_ns, child.self_ns = 2, 60, 60
+        root.merge(other)
+        assert list(root.iter_collapsed()) == ['a 80', 'a;b 120']
+        assert root.children['b'].count == 4
@@ -0,0 +1,92 @@
+# encoding=utf8
+"""
+测试秒表的时钟后端
+"""
+import logging
+import time
+
+import pytest
+
+from moprofiler import StopwatchMixin, clock, stopwatch
+
+
+class ListHandler(logging.Handler):
+    """将日志记录收集到列表中，便于断言"""
+
+    def __init__(self):
+        super(ListHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record.getMessage())
+
+
+HANDLER = ListHandler()
+LOG = logging.getLogger('test_stopwatch_clock')
+LOG.addHandler(HANDLER)
+LOG.setLevel(logging.DEBUG)
+
+
+@stopwatch(
+    logger=LOG, cpu_clock='thread_time_ns',
+    fmt='{time_use_ns} {cpu_use_ns} {time_use:.4f} {cpu_use:.4f}')
+def _sleep():
+    time.sleep(0.1)
+
+
+@stopwatch(logger=LOG, clock='monotonic_ns', cpu_clock='process_time_ns')
+def _busy():
+    _sum = 0
+    for _i in range(10 ** 5):
+        _sum += _i
+    return _sum
+
+
+class Dotting(StopwatchMixin):
+    """测试打点时的 CPU 时间"""
+
+    @stopwatch(logger=LOG, cpu_clock='process_time_ns')
+    def run(self):
+        """打点"""
+        time.sleep(0.05)
+        self.stopwatch.dotting(fmt='{time_diff_ns} {cpu_diff_ns} {time_total_ns} {cpu_total_ns}')
+        self.stopwatch.dotting()
+
+
+class TestStopwatchClock(object):
+    """测试秒表的时钟后端"""
+
+    @staticmethod
+    def test_get_clock():
+        """测试获取时钟"""
+        for name in ('perf_counter_ns', 'monotonic_ns', 'process_time_ns', 'thread_time_ns'):
+            assert isinstance(clock.get_clock(name)(), int)
+        assert clock.get_clock() is clock.CLOCKS[clock.CLOCK_DEFAULT]
+        assert clock.get_clock(time.perf_counter_ns) is time.perf_counter_ns
+        with pytest.raises(ValueError):
+            clock.get_clock('not_exists')
+        assert clock.ns_to_sec(1500000000) == 1.5
+
+    @staticmethod
+    def test_wall_and_cpu_time():
+        """测试墙上耗时与 CPU 耗时同时输出"""
+        del HANDLER.records[:]
+        _sleep()
+        time_use_ns, cpu_use_ns, time_use, _cpu_use = HANDLER.records[-1].split()
+        assert int(time_use_ns) >= 10 ** 8
+        assert int(cpu_use_ns) < int(time_use_ns) // 2
+        assert float(time_use) >= 0.1
+
+        assert _busy() == sum(range(10 ** 5))
+        assert 'CPU 耗时' in HANDLER.records[-1]
+
+    @staticmethod
+    def test_dotting_cpu_time():
+        """测试打点输出 CPU 时间差"""
+        del HANDLER.records[:]
+        Dotting().run()
+        time_diff_ns, cpu_diff_ns, time_total_ns, cpu_total_ns = \
+            [int(i) for i in HANDLER.records[0].split()]
+        assert time_diff_ns == time_total_ns >= 5 * 10 ** 7
+        assert cpu_diff_ns == cpu_total_ns < time_diff_ns
+        assert '累计 CPU' in HANDLER.records[1]
@@ -0,0 +1,107 @@
+# encoding=utf8
+"""
+测试并发调用下秒表状态的隔离
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from moprofiler import StopwatchMixin, stopwatch
+from moprofiler.stopwatch import current_stopwatch
+
+
+class ListHandler(logging.Handler):
+    """将日志记录收集到列表中，便于断言"""
+
+    def __init__(self):
+        super(ListHandler, self).__init__()
+        self.records = []
+        self._records_lock = threading.Lock()
+
+    def emit(self, record):
+        with self._records_lock:
+            self.records.append(record.getMessage())
+
+
+HANDLER = ListHandler()
+LOG = logging.getLogger('test_stopwatch_concurrency')
+LOG.addHandler(HANDLER)
+LOG.setLevel(logging.DEBUG)
+LOG.propagate = False
+FMT = '{name} {tag} {delay} {time_use_ns}'
+WORKERS = 16
+CALLS = 200
+
+
+@stopwatch(logger=LOG, fmt=FMT, tag='-', delay='-')
+def _work(tag, delay):
+    sw = current_stopwatch()
+    sw.dkwargs.update(tag=tag, delay=delay)
+    time.sleep(delay)
+    # 睡眠期间其他线程的调用不应影响本次调用的秒表
+    assert current_stopwatch() is sw
+    assert sw.dkwargs['args'] == (tag, delay)
+    return tag
+
+
+class Worker(StopwatchMixin):
+    """测试 Mixin 下的并发调用"""
+
+    @stopwatch(logger=LOG, fmt=FMT, tag='-', delay='-')
+    def work(self, tag, delay):
+        """工作"""
+        self.stopwatch.dkwargs.update(tag=tag, delay=delay)
+        time.sleep(delay)
+        assert current_stopwatch() is self.stopwatch
+        assert self.stopwatch.dkwargs['args'][1:] == (tag, delay)
+        return tag
+
+
+@stopwatch(logger=LOG, fmt=FMT, tag='-', delay='-')
+async def _async_work(tag, delay):
+    current_stopwatch().dkwargs.update(tag=tag, delay=delay)
+    await asyncio.sleep(delay)
+    assert current_stopwatch().dkwargs['args'] == (tag, delay)
+    return tag
+
+
+def _check_records(name, tags):
+    """检查每条记录的耗时均属于其自身的调用"""
+    records = [r.split() for r in HANDLER.records if r.startswith(name + ' ')]
+    assert sorted(int(r[1]) for r in records) == sorted(tags)
+    for _name, _tag, delay, time_use_ns in records:
+        assert float(delay) * 1e9 <= int(time_use_ns) < (float(delay) + 0.5) * 1e9
+
+
+class TestStopwatchConcurrency(object):
+    """测试并发调用下秒表状态的隔离"""
+
+    @staticmethod
+    def test_threads():
+        """测试多线程并发调用"""
+        del HANDLER.records[:]
+        worker = Worker()
+        tags = list(range(CALLS))
+        delays = [random.choice([0, 0.001, 0.005, 0.01]) for _t in tags]
+        with ThreadPoolExecutor(WORKERS) as pool:
+            assert list(pool.map(_work, tags, delays)) == tags
+            assert list(pool.map(worker.work, tags, delays)) == tags
+        _check_records('_work', tags)
+        _check_records('Worker.work', tags)
+
+    @staticmethod
+    def test_tasks():
+        """测试多个 asyncio 任务并发调用"""
+        del HANDLER.records[:]
+        tags = list(range(CALLS))
+
+        async def main():
+            return await asyncio.gather(*[
+                _async_work(t, random.choice([0, 0.001, 0.005, 0.01])) for t in tags])
+
+        assert asyncio.run(main()) == tags
+        assert current_stopwatch() is None
+        _check_records('_async_work', tags)
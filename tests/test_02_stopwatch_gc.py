@@ -0,0 +1,169 @@
+# encoding=utf8
+"""
+测试秒表与分析器的垃圾回收统计
+"""
+import gc
+import logging
+
+import pytest
+
+from moprofiler import MemoryProfiler, SamplingProfiler, TimeProfiler, gcstats, stopwatch
+from moprofiler.registry import ProfilerRegistry
+
+
+class RecordHandler(logging.Handler):
+    """将日志记录收集到列表中，便于断言"""
+
+    def __init__(self):
+        super(RecordHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class ListStream(object):
+    """将写入内容收集到列表中，便于断言"""
+
+    def __init__(self):
+        self.texts = []
+
+    def write(self, text):
+        self.texts.append(text)
+
+    def flush(self):
+        pass
+
+
+HANDLER = RecordHandler()
+LOG = logging.getLogger('test_stopwatch_gc')
+LOG.addHandler(HANDLER)
+LOG.setLevel(logging.INFO)
+LOG.propagate = False
+
+REGISTRY = ProfilerRegistry()
+CYCLES = 100
+
+
+def churn(n=CYCLES):
+    """创建 n 个循环引用的对象并立刻丢弃，最后触发一次完整回收"""
+    a = None
+    for _i in range(n):
+        a = []
+        a.append(a)
+    del a
+    gc.collect()
+
+
+@stopwatch(logger=LOG, print_gc=True)
+def churn_watched():
+    """被秒表观察的回收"""
+    churn()
+
+
+@stopwatch(logger=LOG, print_gc=True)
+def produce():
+    """仅在生成器执行期间回收"""
+    yield 1
+    churn()
+    yield 2
+
+
+class TestGCStats(object):
+    """测试垃圾回收统计"""
+
+    @staticmethod
+    def test_monitor():
+        """测试监视器仅在有观察时注册回调，并计入所有进行中的观察"""
+        monitor = gcstats.GCMonitor()
+        assert monitor._callback not in gc.callbacks  # pylint: disable=W0212
+        with monitor.observe() as outer:
+            with monitor.observe() as inner:
+                assert gc.callbacks.count(monitor._callback) == 1  # pylint: disable=W0212
+                churn()
+            gc.collect()
+        assert monitor._callback not in gc.callbacks  # pylint: disable=W0212
+        assert inner.collections[2] >= 1 and inner.collected[2] >= CYCLES
+        assert outer.collections[2] == inner.collections[2] + 1
+        assert outer.total_pause_ns > inner.total_pause_ns > 0
+
+        merged = inner.copy()
+        merged.merge(outer)
+        assert merged.total_collections == inner.total_collections + outer.total_collections
+        fields = merged.as_fields()
+        assert fields['gc_collections'] == merged.total_collections
+        assert fields['gc2_collections'] == merged.collections[2]
+        assert fields['gc_pause'] == pytest.approx(fields['gc_pause_ns'] / 1e9)
+
+    @staticmethod
+    def test_stopwatch():
+        """测试秒表输出执行期间的垃圾回收"""
+        del HANDLER.records[:]
+        churn_watched()
+        fields = HANDLER.records[-1].msg.as_dict()
+        assert fields['gc2_collections'] >= 1
+        assert fields['gc_collected'] >= CYCLES
+        assert fields['gc_pause'] > 0
+        assert 'GC 暂停' in HANDLER.records[-1].getMessage()
+
+        assert list(produce()) == [1, 2]
+        assert HANDLER.records[-1].msg.as_dict()['gc_collected'] >= CYCLES
+
+    @staticmethod
+    def test_profilers():
+        """测试分析器累计被采样调用期间的垃圾回收，并在输出结果时一并输出"""
+        for factory in (TimeProfiler, MemoryProfiler):
+            stream = ListStream()
+            profiled = factory(churn, print_gc=True, stream=stream, registry=REGISTRY)
+            profiled()
+            profiled()
+            assert profiled.gc_stats.collections[2] >= 2
+            assert profiled.gc_stats.collected[2] >= 2 * CYCLES
+            assert 'GC 回收次数' in ''.join(stream.texts)
+
+            snapshot = profiled.snapshot_stats()[-1]
+            profiled.reset_stats()
+            assert profiled.gc_stats.total_collections == 0 and snapshot.total_collections >= 2
+
+        profiled = TimeProfiler(churn, print_res=False, registry=REGISTRY)
+        profiled()
+        assert profiled.gc_stats is None and profiled.snapshot_stats()[-1] is None
+
+    @staticmethod
+    def test_profiler_generator():
+        """测试分析器仅在生成器自身执行时统计垃圾回收"""
+        def generate():
+            yield 1
+            churn()
+            yield 2
+
+        profiled = TimeProfiler(generate, print_gc=True, print_res=False, registry=REGISTRY)
+        for _item in profiled():
+            gc.collect()
+        assert profiled.gc_stats.collections[2] == 1
+
+    @staticmethod
+    def test_profiler_generator_close():
+        """
+        测试统计垃圾回收时，throw 转发给被装饰的生成器，提前关闭时被装饰的生成器同样被关闭
+
+        line_profiler 封装的生成器不转发 throw ，故使用采样分析器
+        """
+        events = []
+
+        def generate():
+            try:
+                while True:
+                    try:
+                        yield 1
+                    except KeyError:
+                        events.append('thrown')
+            finally:
+                events.append('closed')
+
+        profiled = SamplingProfiler(generate, print_gc=True, print_res=False, registry=REGISTRY)
+        g = profiled()
+        next(g)
+        assert g.throw(KeyError()) == 1
+        g.close()
+        assert events == ['thrown', 'closed']
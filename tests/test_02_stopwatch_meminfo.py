@@ -0,0 +1,86 @@
+# encoding=utf8
+"""
+测试秒表的内存采样后端
+"""
+import logging
+import os
+import tracemalloc
+
+import pytest
+
+from moprofiler import StopwatchMixin, meminfo, stopwatch
+
+
+class ListHandler(logging.Handler):
+    """将日志记录收集到列表中，便于断言"""
+
+    def __init__(self):
+        super(ListHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record.getMessage())
+
+
+HANDLER = ListHandler()
+LOG = logging.getLogger('test_stopwatch_meminfo')
+LOG.addHandler(HANDLER)
+LOG.setLevel(logging.DEBUG)
+
+
+def _make_waste():
+    """
+    创建使用 tracemalloc 后端的测试类
+
+    由于 tracemalloc 后端会在装饰时启动追踪，故在用例内创建，并在用例结束后停止追踪
+    """
+    class Waste(StopwatchMixin):
+        """浪费内存"""
+
+        @stopwatch(logger=LOG, print_mem=True, mem_backend='tracemalloc', fmt='{mem_use}')
+        def waste(self):
+            """分配约 8MB 内存并在打点后返回"""
+            a = [0] * (10 ** 6)
+            self.stopwatch.dotting(memory=True, fmt='{mem_diff} {mem_total} {mem_diff_mb:.2f}')
+            return a
+    return Waste
+
+
+class TestMemInfo(object):
+    """测试内存采样后端"""
+
+    @staticmethod
+    def test_samplers():
+        """测试各后端返回以字节为单位的内存"""
+        rss = meminfo.get_sampler('psutil')()
+        assert rss > 1 << 20
+        if os.path.exists(meminfo.STATM_PATH):
+            statm = meminfo.get_sampler('statm')()
+            assert abs(statm - rss) < 16 << 20
+            assert meminfo.get_sampler() == meminfo.PROCESS.rss_statm
+        assert isinstance(meminfo.get_sampler('tracemalloc')(), int)
+        tracemalloc.stop()
+        with pytest.raises(ValueError):
+            meminfo.get_sampler('not_exists')
+        assert meminfo.bytes_to_mb(3 << 19) == 1.5
+
+    @staticmethod
+    def test_cached_handle():
+        """测试进程句柄被缓存，且在进程号变化后重建"""
+        handle = meminfo.ProcessHandle()
+        process = handle.process
+        assert handle.process is process
+        handle._pid = -1  # 模拟 fork 后进程号的变化
+        assert handle.process is not process
+        assert handle.process.pid == os.getpid()
+
+    @staticmethod
+    def test_stopwatch_mem_in_bytes():
+        """测试秒表输出的内存变化保持字节精度"""
+        del HANDLER.records[:]
+        _make_waste()().waste()
+        tracemalloc.stop()
+        mem_diff, mem_total, mem_diff_mb = HANDLER.records[0].split()
+        assert int(mem_diff) == int(mem_total) >= 8 * 10 ** 6
+        assert float(mem_diff_mb) >= 7.6
+        assert int(HANDLER.records[1]) >= 8 * 10 ** 6
@@ -0,0 +1,101 @@
+# encoding=utf8
+"""
+测试秒表的后台内存追踪
+"""
+import logging
+import time
+
+import pytest
+
+from moprofiler import memtrace, stopwatch
+
+
+class RecordHandler(logging.Handler):
+    """将日志记录收集到列表中，便于断言"""
+
+    def __init__(self):
+        super(RecordHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+HANDLER = RecordHandler()
+LOG = logging.getLogger('test_stopwatch_memtrace')
+LOG.addHandler(HANDLER)
+LOG.setLevel(logging.INFO)
+LOG.propagate = False
+
+INTERVAL = 0.002
+SPIKE_MB = 64
+
+
+@stopwatch(logger=LOG, mem_interval=INTERVAL)
+def spike():
+    """分配后立刻释放的内存尖峰，进入与退出时的内存变化很小"""
+    data = b'x' * (SPIKE_MB << 20)
+    time.sleep(INTERVAL * 20)
+    del data
+    time.sleep(INTERVAL * 5)
+
+
+@stopwatch(logger=LOG, mem_interval=INTERVAL)
+def broken():
+    """抛出异常"""
+    time.sleep(INTERVAL * 2)
+    raise ValueError('broken')
+
+
+class TestMemoryTrace(object):
+    """测试后台内存追踪"""
+
+    @staticmethod
+    def test_trace_downsample():
+        """测试时间序列写满后合并相邻点并保留较大值"""
+        trace = memtrace.MemoryTrace(capacity=4)
+        for i in range(10):
+            trace.add(i, 100 if i == 3 else i)
+        assert trace.count == 10 and trace.peak == 100 and trace.peak_time == 3
+        assert trace.min == 0 and trace.mean == pytest.approx((sum(range(10)) - 3 + 100) / 10.0)
+        assert trace.stride == 4
+        assert trace.timeline() == [(0, 100), (4, 7), (8, 9)]
+        assert len(trace.series) < trace.capacity
+        with pytest.raises(ValueError):
+            memtrace.MemoryTrace(capacity=1)
+
+    @staticmethod
+    def test_tracer():
+        """测试追踪器在追踪期间持续采样，结束后停止"""
+        values = iter(range(1, 1000000))
+        tracer = memtrace.MemoryTracer(INTERVAL, sampler=lambda: next(values))
+        with tracer.trace() as trace:
+            time.sleep(INTERVAL * 20)
+        count = trace.count
+        assert count > 3 and trace.peak == trace.last
+        time.sleep(INTERVAL * 10)
+        assert trace.count == count
+        assert not tracer._traces  # pylint: disable=W0212
+        same = memtrace.get_tracer(INTERVAL, tracer.sampler)
+        assert same is memtrace.get_tracer(INTERVAL, tracer.sampler)
+        with pytest.raises(ValueError):
+            memtrace.MemoryTracer(0)
+
+    @staticmethod
+    def test_stopwatch_peak():
+        """测试秒表输出进入与退出之间的内存峰值"""
+        del HANDLER.records[:]
+        spike()
+        fields = HANDLER.records[-1].msg.as_dict()
+        assert fields['mem_peak_mb'] >= SPIKE_MB * 0.9
+        assert fields['mem_use_mb'] < SPIKE_MB / 2
+        assert fields['mem_samples'] > 3
+        assert '内存峰值' in HANDLER.records[-1].getMessage()
+
+    @staticmethod
+    def test_stopwatch_error():
+        """测试被观察函数抛出异常时结束追踪"""
+        tracer = memtrace.get_tracer(INTERVAL)
+        with pytest.raises(ValueError):
+            broken()
+        assert not tracer._traces  # pylint: disable=W0212
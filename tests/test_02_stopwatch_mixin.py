@@ -4,10 +4,11 @@
 """
 import logging
 import time
+from contextlib import contextmanager
 
 import pytest
 
-from moprofiler import StopwatchMixin, stopwatch
+from moprofiler import StopwatchMixin, base, stopwatch
 
 logging.basicConfig(
     level=logging.DEBUG,
@@ -61,6 +62,52 @@ class zzz(StopwatchMixin):
         self.stopwatch.dotting(memory=True)
 
 
+class Binding(StopwatchMixin):
+    """测试秒表属性的绑定"""
+
+    def __init__(self):
+        self.seen = []
+
+    @stopwatch(name='outer')
+    def outer(self):
+        """外层方法"""
+        self.seen.append((type(self), self.stopwatch.name))
+        self.inner()
+        self.seen.append((type(self), self.stopwatch.name))
+        self.marker = True
+
+    @stopwatch(name='inner')
+    def inner(self):
+        """内层方法"""
+        self.seen.append((type(self), self.stopwatch.name))
+        assert self.stopwatch.parent.name == 'outer' and self.stopwatch.root.name == 'outer'
+        with pytest.raises(AttributeError):
+            self.stopwatch = None
+
+
+class WithContext(StopwatchMixin):
+    """覆写了 _get_stopwatch 的类"""
+    received = []
+
+    @classmethod
+    @contextmanager
+    def _get_stopwatch(cls, self_or_cls, **callargs):
+        cls.received.append(callargs)
+        with super(WithContext, cls)._get_stopwatch(self_or_cls, **callargs) as _self_or_cls:
+            yield _self_or_cls
+
+    @stopwatch
+    def method(self, a, b=2, **kwargs):
+        """实例方法"""
+        return self.stopwatch.name
+
+    @classmethod
+    @stopwatch
+    def cls_method(cls, a):
+        """类方法"""
+        return cls.stopwatch.name
+
+
 @stopwatch
 def orz_function():
     """函数"""
@@ -84,6 +131,35 @@ class TestStopwatch(object):
         assert _tmp == [i for i in range(5)]
         orz_function()
 
+    @staticmethod
+    def test_stopwatch_binding():
+        """测试被装饰方法内的 self 为原对象，且 stopwatch 属性为本次调用的秒表"""
+        b = Binding()
+        assert b.stopwatch is None
+        b.outer()
+        assert b.seen == [(Binding, 'outer'), (Binding, 'inner'), (Binding, 'outer')]
+        assert b.marker is True
+        assert b.stopwatch is None and Binding.stopwatch is None
+
+    @staticmethod
+    def test_stopwatch_callargs(monkeypatch):
+        """测试仅在覆写了 _get_stopwatch 时绑定 callargs"""
+        w = WithContext()
+        assert w.method(1, c=3) == 'WithContext.method'
+        assert WithContext.cls_method(5) == 'WithContext.cls_method'
+        assert WithContext.received == [
+            {'self': w, 'a': 1, 'b': 2, 'kwargs': {'c': 3}},
+            {'a': 5},
+        ]
+
+        def _fail(*args, **kwargs):
+            raise AssertionError('未覆写时不应绑定 callargs')
+
+        monkeypatch.setattr(base.CallargsBinder, 'bind', _fail)
+        Binding().outer()
+        with pytest.raises(AssertionError):
+            w.method(1)
+
 
 if __name__ == '__main__':
     TestStopwatch.test_stopwatch()
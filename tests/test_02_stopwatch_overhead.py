@@ -0,0 +1,75 @@
+# encoding=utf8
+"""
+测试秒表装饰器的单次调用开销
+
+不对耗时设断言，墙钟时间受机器负载影响，仅断言调用路径的结构性质，开销的实测见 :py:mod:`benchmarks`
+"""
+import logging
+
+from moprofiler import record, stopwatch
+from moprofiler.stopwatch import Stopwatch
+
+# 使用一个不会输出的 logger ，从而仅衡量秒表本身的开销
+SILENT_LOG = logging.getLogger('test_stopwatch_overhead')
+SILENT_LOG.setLevel(logging.CRITICAL)
+SILENT_LOG.propagate = False
+
+# 会输出日志、但处理器丢弃日志的 logger
+LOUD_LOG = logging.getLogger('test_stopwatch_overhead_loud')
+LOUD_LOG.setLevel(logging.DEBUG)
+LOUD_LOG.propagate = False
+LOUD_LOG.addHandler(logging.NullHandler())
+
+LOOP = 1000
+
+
+def _noop():
+    pass
+
+
+class _CountingClock(object):
+    """记录被读取次数的时钟"""
+
+    def __init__(self):
+        self.reads = 0
+
+    def __call__(self):
+        self.reads += 1
+        return self.reads
+
+
+def _no_mem_info(_self):
+    """未开启内存输出时不应采样内存"""
+    raise AssertionError('未开启 print_mem 时采样了内存')
+
+
+class TestStopwatchOverhead(object):
+    """测试秒表装饰器的单次调用开销"""
+
+    @staticmethod
+    def test_clock_reads(monkeypatch):
+        """测试未开启内存、CPU 时间等统计时，每次调用仅读取两次时钟，且不采样内存"""
+        monkeypatch.setattr(Stopwatch, '_get_mem_info', _no_mem_info)
+        counting = _CountingClock()
+        watched = stopwatch(_noop, logger=SILENT_LOG, clock=counting)
+        for _i in range(LOOP):
+            watched()
+        assert counting.reads == 2 * LOOP
+
+    @staticmethod
+    def test_filtered_logger(monkeypatch):
+        """测试 logger 未启用对应日志级别时，不构造日志消息"""
+        messages = []
+        lazy_message = record.LazyMessage
+
+        def counting_message(*args):
+            messages.append(args)
+            return lazy_message(*args)
+        monkeypatch.setattr(record, 'LazyMessage', counting_message)
+
+        silent = stopwatch(_noop, logger=SILENT_LOG)
+        for _i in range(LOOP):
+            silent()
+        assert not messages
+        stopwatch(_noop, logger=LOUD_LOG)()
+        assert len(messages) == 1
@@ -0,0 +1,86 @@
+# encoding=utf8
+"""
+测试秒表的延迟格式化及结构化日志输出
+"""
+import logging
+
+from moprofiler import StopwatchMixin, record, stopwatch
+
+
+class RecordHandler(logging.Handler):
+    """将日志记录收集到列表中，便于断言"""
+
+    def __init__(self):
+        super(RecordHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):  # pylint: disable=W0621
+        self.records.append(record)
+
+
+class Counted(object):
+    """记录被格式化次数的对象"""
+    count = 0
+
+    def __format__(self, spec):
+        Counted.count += 1
+        return 'counted'
+
+
+HANDLER = RecordHandler()
+LOG = logging.getLogger('test_stopwatch_record')
+LOG.addHandler(HANDLER)
+LOG.setLevel(logging.INFO)
+LOG.propagate = False
+
+
+class Handler(StopwatchMixin):
+    """测试 Mixin 下的日志输出"""
+
+    @stopwatch(logger=LOG, fmt='{name} {obj}', obj=Counted(), logging_level=logging.DEBUG)
+    def muted(self):
+        """日志级别被过滤"""
+        self.stopwatch.dotting(fmt='{obj} {idx}')
+
+    @stopwatch(
+        logger=LOG, fmt='{name} {obj} {time_use:.4f}', obj=Counted(), structured=True,
+        cpu_clock='process_time_ns')
+    def structured(self):
+        """结构化输出"""
+        self.stopwatch.dotting(fmt='{obj} {idx}', note='n')
+
+
+class TestStopwatchRecord(object):
+    """测试秒表的日志输出"""
+
+    @staticmethod
+    def test_disabled_level():
+        """测试被过滤的日志级别不执行格式化"""
+        del HANDLER.records[:]
+        Counted.count = 0
+        Handler().muted()
+        assert not HANDLER.records
+        assert Counted.count == 0
+
+    @staticmethod
+    def test_lazy_and_structured():
+        """测试延迟格式化及结构化字段"""
+        del HANDLER.records[:]
+        Counted.count = 0
+        Handler().structured()
+        dotting, end = HANDLER.records
+        assert isinstance(end.msg, record.LazyMessage)
+        assert dotting.getMessage() == 'counted 1'
+        assert end.getMessage().startswith('Handler.structured counted ')
+        # 消息文本只会格式化一次
+        count = Counted.count
+        assert end.getMessage() == str(end.msg)
+        assert Counted.count == count
+
+        fields = getattr(end, record.EXTRA_KEY)
+        assert fields['name'] == 'Handler.structured' and fields['event'] == 'end'
+        assert isinstance(fields['time_use_ns'], int) and fields['time_use_ns'] > 0
+        assert 'cpu_use_ns' in fields and 'obj' not in fields and 'args' not in fields
+        fields = getattr(dotting, record.EXTRA_KEY)
+        assert fields['event'] == 'dotting' and fields['idx'] == 1
+        assert 'note' not in fields and 'mem_diff' not in fields
@@ -0,0 +1,161 @@
+# encoding=utf8
+"""
+测试秒表对生成器的流式观察
+"""
+import logging
+import time
+
+import pytest
+
+from moprofiler import record, stopwatch
+
+
+class RecordHandler(logging.Handler):
+    """将日志记录收集到列表中，便于断言"""
+
+    def __init__(self):
+        super(RecordHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):  # pylint: disable=W0621
+        self.records.append(record)
+
+
+HANDLER = RecordHandler()
+LOG = logging.getLogger('test_stopwatch_streaming')
+LOG.addHandler(HANDLER)
+LOG.setLevel(logging.INFO)
+LOG.propagate = False
+
+PRODUCE = 0.02
+CONSUME = 0.03
+CLEANED = []
+
+
+@stopwatch(logger=LOG, streaming=True)
+def produce(n):
+    """每个元素生产耗时 PRODUCE"""
+    try:
+        for i in range(n):
+            time.sleep(PRODUCE)
+            received = yield i
+            if received is not None:
+                yield received * 10
+    finally:
+        CLEANED.append(n)
+
+
+@stopwatch(logger=LOG)
+def plain(n):
+    """非流式模式"""
+    for i in range(n):
+        yield i
+
+
+@stopwatch(logger=LOG, streaming=True)
+def returning(n):
+    """返回已产出的元素个数"""
+    for i in range(n):
+        yield i
+    return n
+
+
+def _fields():
+    """获取最后一条日志的输出变量"""
+    return HANDLER.records[-1].msg.as_dict()
+
+
+class TestStopwatchStreaming(object):
+    """测试秒表对生成器的流式观察"""
+
+    @staticmethod
+    def test_streaming_fields():
+        """测试首个元素耗时、逐元素生产耗时均不含消费者的耗时"""
+        del HANDLER.records[:]
+        for _item in produce(3):
+            time.sleep(CONSUME)
+        fields = _fields()
+        assert fields['status'] == 'done'
+        assert fields['item_count'] == 3
+        assert PRODUCE <= fields['first_item_use'] < PRODUCE + CONSUME
+        assert PRODUCE <= fields['item_p50'] < PRODUCE + CONSUME
+        assert 3 * PRODUCE <= fields['run_use'] < 3 * PRODUCE + CONSUME
+        assert fields['suspend_use'] >= 3 * CONSUME
+        assert fields['throughput'] == pytest.approx(3 / fields['time_use'], rel=0.05)
+        assert '元素数: 3' in HANDLER.records[-1].getMessage()
+
+    @staticmethod
+    def test_close_early():
+        """测试消费者提前退出时关闭被观察的生成器并结束秒表"""
+        del HANDLER.records[:]
+        del CLEANED[:]
+        for item in produce(5):
+            if item == 1:
+                break
+        assert CLEANED == [5]
+        fields = _fields()
+        assert fields['status'] == 'closed'
+        assert fields['item_count'] == 2
+
+    @staticmethod
+    def test_send_and_throw():
+        """测试 send 与 throw 转发给被观察的生成器"""
+        del HANDLER.records[:]
+        g = produce(3)
+        assert next(g) == 0
+        assert g.send(4) == 40
+        with pytest.raises(KeyError):
+            g.throw(KeyError('k'))
+        fields = _fields()
+        assert fields['status'] == 'error'
+        assert fields['item_count'] == 2
+
+    @staticmethod
+    def test_producer_error():
+        """测试被观察的生成器抛出异常时结束秒表"""
+        @stopwatch(logger=LOG, streaming=True, structured=True)
+        def broken():
+            yield 1
+            raise ValueError('broken')
+
+        del HANDLER.records[:]
+        with pytest.raises(ValueError):
+            list(broken())
+        assert _fields()['status'] == 'error'
+        fields = getattr(HANDLER.records[-1], record.EXTRA_KEY)
+        assert fields['item_count'] == 1 and 'item_p99' in fields
+
+    @staticmethod
+    def test_empty():
+        """测试未产出元素的生成器"""
+        del HANDLER.records[:]
+        assert list(produce(0)) == []
+        fields = _fields()
+        assert fields['item_count'] == 0 and fields['first_item_use'] == 0
+
+    @staticmethod
+    def test_plain_close():
+        """测试非流式模式下提前关闭同样结束秒表，且不做逐元素统计"""
+        del HANDLER.records[:]
+        g = plain(3)
+        next(g)
+        g.close()
+        fields = _fields()
+        assert fields['status'] == 'closed'
+        assert 'item_count' not in fields
+        assert list(plain(2)) == [0, 1]
+        assert _fields()['status'] == 'done'
+
+    @staticmethod
+    def test_return_value():
+        """测试 yield from 被观察的生成器时获取其返回值"""
+        del HANDLER.records[:]
+        assert list(_yield_from(returning(3))) == [0, 1, 2, 3]
+        fields = _fields()
+        assert fields['status'] == 'done' and fields['item_count'] == 3
+
+
+def _yield_from(g):
+    """依次产出生成器的元素及其返回值"""
+    result = yield from g
+    yield result
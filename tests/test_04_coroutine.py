@@ -0,0 +1,255 @@
+# encoding=utf8
+"""
+测试秒表与分析器对协程及异步生成器的支持
+"""
+import asyncio
+import inspect
+import io
+import logging
+import time
+from contextlib import contextmanager
+
+from moprofiler import MemoryProfiler, StopwatchMixin, TimeProfiler, stopwatch
+
+
+class ListHandler(logging.Handler):
+    """将日志记录收集到列表中，便于断言"""
+
+    def __init__(self):
+        super(ListHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record.getMessage())
+
+
+HANDLER = ListHandler()
+LOG = logging.getLogger('test_coroutine')
+LOG.addHandler(HANDLER)
+LOG.setLevel(logging.DEBUG)
+FMT = '{time_use_ns} {run_use_ns} {suspend_use_ns}'
+
+
+def _busy(seconds):
+    """占用 CPU 指定时间"""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+@stopwatch(logger=LOG, fmt=FMT)
+async def _sleep_then_busy():
+    await asyncio.sleep(0.1)
+    _busy(0.05)
+    return 'done'
+
+
+@stopwatch(logger=LOG, fmt=FMT)
+async def _agen(n):
+    for i in range(n):
+        await asyncio.sleep(0.02)
+        _busy(0.01)
+        yield i
+
+
+CLEANUP = []
+
+
+@stopwatch(logger=LOG, fmt='{name} {status}')
+async def _agen_cleanup(n):
+    try:
+        for i in range(n):
+            await asyncio.sleep(0)
+            try:
+                yield i
+            except KeyError:
+                yield -1
+    finally:
+        await asyncio.sleep(0)
+        CLEANUP.append(n)
+
+
+@TimeProfiler(print_res=False)
+async def _profiled_agen_cleanup(n):
+    try:
+        for i in range(n):
+            yield i
+    finally:
+        CLEANUP.append(n)
+
+
+class Handler(StopwatchMixin):
+    """测试 Mixin 下的协程方法"""
+
+    @stopwatch(logger=LOG)
+    async def handle(self, x):
+        """处理请求"""
+        await asyncio.sleep(0.01)
+        self.stopwatch.dotting(fmt='dotting {idx}')
+        return x * 2
+
+
+@TimeProfiler(print_res=False)
+async def _time_profiled():
+    await asyncio.sleep(0.05)
+    total = 0
+    for i in range(1000):
+        total += i
+    return total
+
+
+@MemoryProfiler(print_res=False)
+async def _memory_profiled():
+    await asyncio.sleep(0.01)
+    a = [1] * (10 ** 5)
+    return len(a)
+
+
+class TestCoroutine(object):
+    """测试协程支持"""
+
+    @staticmethod
+    def test_stopwatch_coroutine():
+        """测试秒表区分协程的运行与挂起时间"""
+        del HANDLER.records[:]
+        assert inspect.iscoroutinefunction(_sleep_then_busy)
+        assert asyncio.run(_sleep_then_busy()) == 'done'
+        time_use_ns, run_use_ns, suspend_use_ns = [int(i) for i in HANDLER.records[-1].split()]
+        assert time_use_ns >= 15 * 10 ** 7
+        assert 5 * 10 ** 7 <= run_use_ns < 10 ** 8
+        assert suspend_use_ns >= 10 ** 8
+        assert run_use_ns + suspend_use_ns == time_use_ns
+
+    @staticmethod
+    def test_stopwatch_async_generator():
+        """测试秒表观察异步生成器"""
+        del HANDLER.records[:]
+
+        async def consume():
+            return [i async for i in _agen(3)]
+
+        assert asyncio.run(consume()) == [0, 1, 2]
+        time_use_ns, run_use_ns, suspend_use_ns = [int(i) for i in HANDLER.records[-1].split()]
+        assert run_use_ns >= 3 * 10 ** 7
+        assert suspend_use_ns >= 6 * 10 ** 7
+        assert time_use_ns >= 9 * 10 ** 7
+
+    @staticmethod
+    def test_stopwatch_mixin_coroutine():
+        """测试 Mixin 下协程方法的打点"""
+        del HANDLER.records[:]
+
+        async def main():
+            return await asyncio.gather(Handler().handle(1), Handler().handle(2))
+
+        assert asyncio.run(main()) == [2, 4]
+        assert HANDLER.records.count('dotting 1') == 2
+        assert sum('挂起' in r for r in HANDLER.records) == 2
+
+    @staticmethod
+    def test_profiler_coroutine():
+        """测试时间&内存分析器观察协程"""
+        assert asyncio.run(_time_profiled()) == sum(range(1000))
+        assert asyncio.run(_memory_profiled()) == 10 ** 5
+        for profiled in (_time_profiled, _memory_profiled):
+            assert profiled.coroutine_calls == 1
+            assert profiled.coroutine_suspend_ns > profiled.coroutine_run_ns
+
+        stream = io.StringIO()
+        _time_profiled._stream = stream
+        _time_profiled.print_stats()
+        output = stream.getvalue()
+        assert 'total += i' in output
+        assert '协程调用次数: 1' in output
+
+    @staticmethod
+    def test_async_generator_early_exit():
+        """测试异步生成器被提前退出、关闭或抛入异常时，被观察的异步生成器被关闭且秒表结束"""
+        del HANDLER.records[:]
+        del CLEANUP[:]
+
+        async def consume_break():
+            async for i in _agen_cleanup(5):
+                if i == 1:
+                    break
+            # 提前退出的异步生成器由事件循环在之后的迭代中关闭
+            while 5 not in CLEANUP:
+                await asyncio.sleep(0)
+
+        async def consume_aclose():
+            agen = _agen_cleanup(6)
+            assert await agen.__anext__() == 0
+            await agen.aclose()
+
+        async def consume_athrow():
+            agen = _agen_cleanup(7)
+            assert await agen.__anext__() == 0
+            assert await agen.athrow(KeyError()) == -1
+            assert await agen.__anext__() == 1
+            try:
+                await agen.athrow(ValueError())
+            except ValueError:
+                return 'raised'
+
+        asyncio.run(consume_break())
+        asyncio.run(consume_aclose())
+        assert asyncio.run(consume_athrow()) == 'raised'
+        assert asyncio.run(_consume_all(_agen_cleanup(2))) == [0, 1]
+        assert CLEANUP == [5, 6, 7, 2]
+        assert HANDLER.records == [
+            '_agen_cleanup closed', '_agen_cleanup closed',
+            '_agen_cleanup error', '_agen_cleanup done']
+
+    @staticmethod
+    def test_profiler_async_generator_early_exit():
+        """测试分析器观察的异步生成器被提前关闭时，被观察的异步生成器被关闭且本次调用被统计"""
+        del CLEANUP[:]
+        calls = _profiled_agen_cleanup.coroutine_calls
+
+        async def consume():
+            agen = _profiled_agen_cleanup(3)
+            assert await agen.__anext__() == 0
+            await agen.aclose()
+
+        asyncio.run(consume())
+        assert CLEANUP == [3]
+        assert _profiled_agen_cleanup.coroutine_calls == calls + 1
+
+
+async def _consume_all(agen):
+    """迭代异步生成器的全部元素"""
+    return [i async for i in agen]
+
+
+class OrderedContext(StopwatchMixin):
+    """覆写了 _get_stopwatch 的类，记录上下文与协程执行的顺序"""
+    order = []
+
+    @classmethod
+    @contextmanager
+    def _get_stopwatch(cls, self_or_cls, **callargs):
+        cls.order.append(('enter', callargs['x']))
+        with super(OrderedContext, cls)._get_stopwatch(self_or_cls, **callargs) as _self_or_cls:
+            yield _self_or_cls
+        cls.order.append(('exit', callargs['x']))
+
+    @stopwatch(logger=LOG)
+    async def handle(self, x):
+        """处理请求"""
+        self.order.append(('body', x))
+        await asyncio.sleep(0)
+        self.order.append(('body', x))
+        return self.stopwatch.name
+
+
+class TestCoroutineContext(object):
+    """测试协程方法的 _get_stopwatch 上下文"""
+
+    @staticmethod
+    def test_context_order():
+        """测试上下文在协程被等待时进入，并在协程执行完毕后退出"""
+        coro = OrderedContext().handle(1)
+        assert inspect.iscoroutinefunction(OrderedContext.handle)
+        assert not OrderedContext.order
+        assert asyncio.run(coro) == 'OrderedContext.handle'
+        assert OrderedContext.order == [('enter', 1), ('body', 1), ('body', 1), ('exit', 1)]
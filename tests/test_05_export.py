@@ -0,0 +1,132 @@
+# encoding=utf8
+"""
+测试后台输出器
+"""
+import io
+import logging
+import threading
+
+from moprofiler import MemoryProfiler, TimeProfiler, stopwatch
+from moprofiler.export import Exporter
+
+
+class ListHandler(logging.Handler):
+    """将日志记录收集到列表中，便于断言"""
+
+    def __init__(self):
+        super(ListHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class SlowItem(object):
+    """在后台线程中阻塞至被放行的结果"""
+
+    def __init__(self, event):
+        self.event = event
+
+    def render(self):
+        self.event.wait()
+        return 'slow\n'
+
+
+STREAM = io.StringIO()
+EXPORTER = Exporter(STREAM)
+HANDLER = ListHandler()
+LOG = logging.getLogger('test_export')
+LOG.addHandler(HANDLER)
+LOG.setLevel(logging.DEBUG)
+LOG.propagate = False
+
+
+@TimeProfiler(exporter=EXPORTER)
+def _time_profiled(n):
+    total = 0
+    for i in range(n):
+        total += i
+    return total
+
+
+@MemoryProfiler(exporter=EXPORTER)
+def _memory_profiled():
+    a = [1] * (10 ** 4)
+    return len(a)
+
+
+@stopwatch(logger=LOG, fmt='{name} {time_use_ns}', exporter=EXPORTER)
+def _watched():
+    return threading.current_thread().name
+
+
+class TestExporter(object):
+    """测试后台输出器"""
+
+    @staticmethod
+    def test_profiler():
+        """测试分析器结果在后台渲染输出"""
+        assert _time_profiled(100) == sum(range(100))
+        assert _time_profiled(10) == sum(range(10))
+        assert _memory_profiled() == 10 ** 4
+        assert EXPORTER.flush(5)
+        output = STREAM.getvalue()
+        assert output.count('total += i') == 2
+        assert 'a = [1] * (10 ** 4)' in output
+        # 快照不受之后调用的影响，第一次输出的命中次数仅来自第一次调用
+        assert ' 100 ' in output.split('Timer unit')[1]
+
+    @staticmethod
+    def test_stopwatch():
+        """测试秒表日志在调用线程创建、后台线程处理"""
+        del HANDLER.records[:]
+        caller = _watched()
+        assert EXPORTER.flush(5)
+        record, = HANDLER.records
+        assert record.threadName == caller
+        assert record.getMessage().startswith('_watched ')
+
+    @staticmethod
+    def test_backpressure():
+        """测试队列已满时丢弃或阻塞"""
+        stream = io.StringIO()
+        exporter = Exporter(stream, max_size=1)
+        event = threading.Event()
+        assert exporter.submit(SlowItem(event))
+        while not exporter._queue.empty():  # pylint: disable=W0212
+            pass
+        assert exporter.submit('a\n')
+        assert not exporter.submit('b\n')
+        assert exporter.dropped == 1
+        assert not exporter.flush(0.01)
+        event.set()
+        exporter.close()
+        assert stream.getvalue() == 'slow\na\n'
+
+        blocking = Exporter(stream, max_size=1, block=True)
+        for i in range(20):
+            blocking.submit('{}\n'.format(i))
+        blocking.close()
+        assert blocking.dropped == 0
+        assert stream.getvalue().endswith('18\n19\n')
+
+    @staticmethod
+    def test_targets(tmpdir):
+        """测试输出到文件及 logger"""
+        path = str(tmpdir.join('out.txt'))
+        exporter = Exporter(path)
+        exporter.submit('line 1\n')
+        exporter.submit('line 2\n')
+        exporter.close()
+        with open(path) as f:
+            assert f.read() == 'line 1\nline 2\n'
+
+        del HANDLER.records[:]
+        exporter = Exporter(LOG, level=logging.WARNING)
+        exporter.submit('text\n')
+        exporter.close()
+        assert [(r.levelno, r.getMessage()) for r in HANDLER.records] == [(logging.WARNING, 'text')]
+        # 关闭后再次提交将重新启动
+        exporter.submit('again\n')
+        exporter.close()
+        assert len(HANDLER.records) == 2
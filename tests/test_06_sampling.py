@@ -0,0 +1,106 @@
+# encoding=utf8
+"""
+测试分析器的采样策略
+"""
+import asyncio
+import time
+
+import pytest
+
+from moprofiler import MemoryProfiler, TimeProfiler, policy
+
+
+@TimeProfiler(print_res=False, sampling=10)
+def _every_10th(n):
+    total = 0
+    for i in range(n):
+        total += i
+    return total
+
+
+@MemoryProfiler(print_res=False, sampling=0.5)
+def _half():
+    return len([1] * 100)
+
+
+def _busy():
+    end = time.perf_counter() + 0.001
+    while time.perf_counter() < end:
+        pass
+
+
+@TimeProfiler(print_res=False, sampling=3)
+async def _async_every_3rd():
+    await asyncio.sleep(0)
+    return 1
+
+
+def _hits(profiled):
+    """被装饰函数中各行的命中次数"""
+    timings = list(profiled.profiler.get_stats().timings.values())
+    return max(hits for _lineno, hits, _time in timings[0]) if timings else 0
+
+
+class TestSampling(object):
+    """测试分析器的采样策略"""
+
+    @staticmethod
+    def test_every_nth():
+        """测试每 N 次调用采样一次"""
+        assert [_every_10th(5) for _i in range(95)] == [10] * 95
+        assert _every_10th.sampled_calls == 10
+        assert _every_10th.skipped_calls == 85
+        assert _hits(_every_10th) == 10 * (5 + 1)
+
+    @staticmethod
+    def test_reset_stats():
+        """测试清空统计结果时一并清空采样/跳过次数"""
+        profiled = TimeProfiler(print_res=False, sampling=3)(_busy)
+        for _i in range(7):
+            profiled()
+        assert (profiled.sampled_calls, profiled.skipped_calls) == (3, 4)
+        profiled.reset_stats()
+        assert (profiled.sampled_calls, profiled.skipped_calls) == (0, 0)
+        assert _hits(profiled) == 0
+
+    @staticmethod
+    def test_rate():
+        """测试按比例随机采样"""
+        for _i in range(400):
+            assert _half() == 100
+        assert 100 < _half.sampled_calls < 300
+        assert _half.sampled_calls + _half.skipped_calls == 400
+
+    @staticmethod
+    def test_budget():
+        """测试按耗时预算采样"""
+        budget = policy.BudgetSampling(0.2, window=10)
+        profiled = TimeProfiler(print_res=False, sampling=budget)(_busy)
+        begin = time.perf_counter()
+        while time.perf_counter() - begin < 0.3:
+            profiled()
+        assert profiled.skipped_calls > profiled.sampled_calls > 0
+        # 追踪耗时不超过墙上时间的 20% ，允许一次调用的误差
+        traced = budget._traced_ns  # pylint: disable=W0212
+        assert traced <= 0.2 * (time.perf_counter() - begin) * 1e9 + 5 * 10 ** 6
+
+    @staticmethod
+    def test_coroutine():
+        """测试协程的采样"""
+        async def main():
+            return [await _async_every_3rd() for _i in range(7)]
+
+        assert asyncio.run(main()) == [1] * 7
+        assert _async_every_3rd.sampled_calls == 3
+        assert _async_every_3rd.coroutine_calls == 3
+
+    @staticmethod
+    def test_get_policy():
+        """测试采样参数的解析"""
+        assert policy.get_policy() is None
+        assert policy.get_policy(1) is None
+        assert isinstance(policy.get_policy(0.1), policy.RateSampling)
+        assert isinstance(policy.get_policy(5), policy.EveryNthSampling)
+        for invalid in (0, 1.5, True, 'x'):
+            with pytest.raises(ValueError):
+                policy.get_policy(invalid)
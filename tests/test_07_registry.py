@@ -0,0 +1,100 @@
+# encoding=utf8
+"""
+测试分析器注册表及合并报告
+"""
+import io
+import time
+
+import pytest
+
+from moprofiler import MemoryProfiler, TimeProfiler, registry
+
+REGISTRY = registry.ProfilerRegistry()
+
+
+@TimeProfiler(print_res=False, registry=REGISTRY)
+def _slow():
+    time.sleep(0.02)  # slow line
+    return 1
+
+
+@TimeProfiler(print_res=False, registry=REGISTRY)
+def _fast():
+    total = 0  # fast line
+    return total
+
+
+@MemoryProfiler(print_res=False, registry=REGISTRY)
+def _alloc():
+    data = [0] * (3 * 10 ** 6)  # alloc line
+    return len(data)
+
+
+class TestProfilerRegistry(object):
+    """测试分析器注册表"""
+
+    @staticmethod
+    def test_merged_report():
+        """测试合并报告按耗时/内存增量排序"""
+        REGISTRY.reset()
+        for _i in range(2):
+            _slow()
+            _fast()
+        _alloc()
+        assert set(REGISTRY.decorators()) == {_slow, _fast, _alloc}
+        assert REGISTRY.decorators(registry.KIND_MEMORY) == [_alloc]
+
+        records = REGISTRY.records(registry.KIND_TIME)
+        assert records[0].func_name == '_slow' and records[0].hits == 2
+        assert records[0].value >= 0.04
+
+        stream = io.StringIO()
+        REGISTRY.print_report(stream, top=2)
+        lines = stream.getvalue().splitlines()
+        assert lines[0] == '时间分析汇总（按总耗时排序）'
+        assert lines[3].endswith('# slow line')
+        assert lines[5] == ''
+        assert lines[6] == '内存分析汇总（按内存增量排序）'
+        assert '# alloc line' in stream.getvalue()
+
+    @staticmethod
+    def test_reset():
+        """测试清空统计"""
+        _slow()
+        REGISTRY.reset()
+        assert not REGISTRY.records()
+        _fast()
+        assert {r.func_name for r in REGISTRY.records()} == {'_fast'}
+
+    @staticmethod
+    def test_merge_records():
+        """测试逐行记录的合并"""
+        rec = registry.LineRecord(registry.KIND_TIME, 'a.py', 1, 'f', 2, 0.5)
+        merged, = registry.merge_records([rec, rec._replace(hits=3, value=1.0)])
+        assert (merged.hits, merged.value) == (5, 1.5)
+        assert registry.format_records([]) == ''
+
+    @staticmethod
+    def test_sort_and_unit():
+        """测试报告的排序方式及输出单位"""
+        records = [
+            registry.LineRecord(registry.KIND_TIME, 'a.py', 1, 'many', 1000, 0.5),
+            registry.LineRecord(registry.KIND_TIME, 'a.py', 2, 'once', 1, 0.2),
+            registry.LineRecord(registry.KIND_MEMORY, 'a.py', 3, 'alloc', 2, 1.5),
+        ]
+        lines = registry.format_records(records, sort_by=registry.SORT_AVG, unit='ms').splitlines()
+        assert lines[0] == '时间分析汇总（按单次耗时排序）'
+        assert '总耗时(ms)' in lines[1] and '单次(ms)' in lines[1]
+        assert lines[3].split()[:3] == ['200.0000', '1', '200.0000']
+        assert lines[4].split()[:3] == ['500.0000', '1000', '0.5000']
+        assert '增量(MiB)' in lines[7]
+        assert lines[9].split()[:3] == ['1.5000', '2', '0.7500']
+
+        lines = registry.format_records(
+            records, sort_by=registry.SORT_HITS, unit='KiB').splitlines()
+        assert '总耗时(s)' in lines[1] and 'many' in lines[3]
+        assert lines[9].split()[:3] == ['1536.00', '2', '768.00']
+        with pytest.raises(ValueError):
+            registry.format_records(records, sort_by='x')
+        with pytest.raises(ValueError):
+            registry.format_records(records, unit='x')
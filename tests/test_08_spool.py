@@ -0,0 +1,78 @@
+# encoding=utf8
+"""
+测试多进程下分析结果的落盘与合并
+"""
+import io
+import multiprocessing
+import os
+
+from moprofiler import TimeProfiler, registry, spool, stats, stopwatch
+
+PROFILERS = registry.ProfilerRegistry()
+STATS = stats.StatsRegistry()
+
+
+@TimeProfiler(print_res=False, registry=PROFILERS)
+def _work(n):
+    total = 0
+    for i in range(n):
+        total += i  # work line
+    return total
+
+
+@stopwatch(aggregate=True, registry=STATS, name='task')
+def _task(n):
+    return _work(n), os.getpid()
+
+
+def _hits():
+    """合并后 work line 的命中次数"""
+    lineno = _work.func.__code__.co_firstlineno + 4
+    return [r.hits for r in PROFILERS.records() if r.lineno == lineno]
+
+
+class TestSpool(object):
+    """测试多进程下分析结果的落盘与合并"""
+
+    @staticmethod
+    def test_pool(tmpdir):
+        """测试进程池中各工作进程的结果合并，且父进程的结果不会被重复计算"""
+        directory = str(tmpdir.join('spool'))
+        parent = spool.install(directory, PROFILERS, STATS)
+        try:
+            _task(10)
+            assert _hits() == [10]
+            ctx = multiprocessing.get_context('fork')
+            with ctx.Pool(2) as pool:
+                results = pool.map(_task, [100] * 6)
+                pool.close()
+                pool.join()
+            assert _hits() == [10]
+            parent.dump()
+        finally:
+            spool.uninstall()
+
+        data = spool.load(directory)
+        pids = {d['pid'] for d in data}
+        assert pids >= {os.getpid()} | {pid for _r, pid in results} - {os.getpid()}
+        assert {d['generation'] for d in data if d['pid'] != os.getpid()} == {1}
+
+        records, stopwatch_stats = spool.merge(directory)
+        work_line = [r for r in records if r.lineno == _work.func.__code__.co_firstlineno + 4]
+        assert [r.hits for r in work_line] == [10 + 100 * 6]
+        assert stopwatch_stats['task'].count == 7
+
+        stream = io.StringIO()
+        spool.print_report(directory, stream)
+        output = stream.getvalue()
+        assert '# work line' in output
+        assert '秒表汇总' in output and 'task' in output
+
+    @staticmethod
+    def test_dump_overwrites(tmpdir):
+        """测试同一进程多次写入时覆盖之前的文件"""
+        directory = str(tmpdir)
+        local = spool.Spool(directory, PROFILERS, STATS)
+        first = local.dump()
+        assert local.dump() == first
+        assert len(spool.load(directory)) == 1
@@ -0,0 +1,94 @@
+# encoding=utf8
+"""
+测试分析结果的二进制存储格式
+"""
+import os
+
+import pytest
+
+from moprofiler import TimeProfiler, binary, registry, stats
+
+
+@TimeProfiler(print_res=False, registry=registry.ProfilerRegistry())
+def _work(n):
+    total = 0
+    for i in range(n):
+        total += i  # hot line
+    return total
+
+
+def _record(lineno, value, kind=registry.KIND_TIME, func_name='f'):
+    return registry.LineRecord(kind, 'a.py', lineno, func_name, 1, value)
+
+
+class TestBinary(object):
+    """测试二进制存储格式"""
+
+    @staticmethod
+    def test_round_trip(tmpdir):
+        """测试写入后读取的内容一致"""
+        path = str(tmpdir.join('profile.mprof'))
+        running = stats.RunningStats()
+        for value in range(1, 1001):
+            running.add(value * 1000)
+        writer = binary.ProfileWriter({'tag': '压测'})
+        writer.add_lines([
+            _record(1, 0.5), _record(2, 2.0), _record(1, 0.25),
+            _record(3, 4.0, registry.KIND_MEMORY, 'g'), _record(4, 1.0, func_name=None)])
+        writer.add_stopwatch('handler', running)
+        writer.add_stopwatch('empty', stats.RunningStats())
+        writer.write(path)
+
+        with binary.load(path) as reader:
+            assert reader.metadata['tag'] == '压测'
+            assert reader.metadata['pid'] == os.getpid()
+            assert reader.line_count == 4
+            assert [(r.lineno, r.value) for r in reader.lines()] == [
+                (3, 4.0), (2, 2.0), (4, 1.0), (1, 0.75)]
+            assert reader.line(3).hits == 2
+            assert reader.line(2).func_name is None
+            assert [r.lineno for r in reader.top(registry.KIND_TIME, 2)] == [2, 4]
+            assert [r.lineno for r in reader.lines(func_name='f')] == [2, 1]
+            with pytest.raises(IndexError):
+                reader.line(4)
+            functions = list(reader.functions(registry.KIND_TIME))
+            assert [(f.func_name, f.lines, f.value) for f in functions] == [
+                ('f', 2, 2.75), (None, 1, 1.0)]
+
+            assert reader.stopwatch_names() == ['handler', 'empty']
+            restored = reader.stopwatch('handler')
+            assert restored.snapshot() == running.snapshot()
+            assert sum(count for _value, count in reader.histogram('handler')) == 1000
+            assert reader.stopwatch('empty').snapshot()['count'] == 0
+            assert reader.stopwatch('missing') is None
+
+    @staticmethod
+    def test_dump_stats(tmpdir):
+        """测试分析器直接写入二进制文件"""
+        path = str(tmpdir.join('work.mprof'))
+        _work(100)
+        _work.dump_stats(path)
+        with binary.load(path) as reader:
+            first = _work.func.__code__.co_firstlineno
+            hits = dict((r.lineno - first, r.hits) for r in reader.lines(func_name='_work'))
+            assert hits == {2: 1, 3: 101, 4: 100, 5: 1}  # 首行为装饰器所在行
+
+    @staticmethod
+    def test_invalid_file(tmpdir, monkeypatch):
+        """测试读取非法文件，且校验失败时关闭已打开的文件"""
+        opened = []
+
+        def _open(*args):
+            opened.append(open(*args))  # pylint: disable=R1732
+            return opened[-1]
+
+        monkeypatch.setattr(binary, 'open', _open, raising=False)
+        path = tmpdir.join('bad.mprof')
+        path.write('not a profile')
+        with pytest.raises(ValueError):
+            binary.load(str(path))
+        empty = tmpdir.join('empty.mprof')
+        empty.write('')
+        with pytest.raises(ValueError):
+            binary.load(str(empty))
+        assert len(opened) == 2 and all(f.closed for f in opened)
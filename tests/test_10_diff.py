@@ -0,0 +1,103 @@
+# encoding=utf8
+"""
+测试两次分析结果的差异对比
+"""
+import json
+
+from moprofiler import binary, diff, registry, stats
+
+
+def _write(path, lines, stopwatch_ns):
+    """写入一份二进制分析结果"""
+    writer = binary.ProfileWriter()
+    writer.add_lines(registry.LineRecord(kind, filename, lineno, func, hits, value)
+                     for kind, filename, lineno, func, hits, value in lines)
+    running = stats.RunningStats()
+    for value in stopwatch_ns:
+        running.add(value)
+    writer.add_stopwatch('handler', running)
+    writer.write(path)
+    return path
+
+
+T, M = registry.KIND_TIME, registry.KIND_MEMORY
+
+
+class TestDiff(object):
+    """测试差异对比"""
+
+    @staticmethod
+    def test_diff(tmpdir):
+        """测试行号偏移后的匹配及退化/改进的排序"""
+        base = _write(str(tmpdir.join('base.mprof')), [
+            (T, '/ci/a/app.py', 10, 'handle', 1, 1.0),
+            (T, '/ci/a/app.py', 11, 'handle', 1, 0.5),
+            (T, '/ci/a/app.py', 12, 'handle', 1, 0.2),
+            (T, '/ci/a/app.py', 30, 'gone', 1, 0.3),
+            (M, '/ci/a/app.py', 40, 'load', 1, 10.0),
+        ], [10 ** 6] * 100)
+        # 整个文件下移了 5 行，handle 中第二行之后插入了一行
+        head = _write(str(tmpdir.join('head.mprof')), [
+            (T, '/home/b/app.py', 15, 'handle', 1, 1.0),
+            (T, '/home/b/app.py', 16, 'handle', 1, 0.8),
+            (T, '/home/b/app.py', 18, 'handle', 1, 0.1),
+            (T, '/home/b/app.py', 50, 'new', 1, 0.05),
+            (M, '/home/b/app.py', 45, 'load', 1, 4.0),
+        ], [2 * 10 ** 6] * 100)
+
+        result = diff.diff(base, head)
+        lines = result.select('line')
+        assert len(lines) == 6
+        regressions = result.regressions(scope='line')
+        assert [e.name for e in regressions] == ['app.py:16 handle', 'app.py:50 new']
+        assert abs(regressions[0].ratio - 0.6) < 1e-9
+        improvements = result.improvements(scope='line')
+        assert [e.name for e in improvements] == [
+            'app.py:45 load', 'app.py:30 gone', 'app.py:18 handle']
+        assert improvements[1].head is None
+
+        functions = dict((e.name, e) for e in result.select('function'))
+        assert abs(functions['app.py handle'].delta - 0.2) < 1e-9
+
+        stopwatch = dict((e.metric, e) for e in result.select('stopwatch'))
+        assert abs(stopwatch['mean'].ratio - 1.0) < 1e-9
+        assert result.has_regression(threshold=0.5, scope='stopwatch')
+        assert not result.has_regression(threshold=0.5, min_delta=1.0)
+
+        data = json.loads(json.dumps(result.to_dict(threshold=0.5)))
+        assert [e['name'] for e in data['regressions']] == \
+            ['app.py:16 handle', 'app.py:50 new', 'app.py new', 'handler', 'handler']
+        assert data['regressions'][1]['ratio'] is None
+
+        text = result.format_text(top=1)
+        assert text.startswith('退化（按增加量排序）: 6 项\n')
+        assert 'app.py:16 handle' in text and 'app.py:45 load' in text
+        assert 'handler [mean]' in result.format_text(scope='stopwatch')
+
+    @staticmethod
+    def test_negative_base(tmpdir):
+        """测试基准为负数（释放内存）时相对差值的符号与差值一致，且同名文件中的函数汇总为一项"""
+        base = _write(str(tmpdir.join('base.mprof')), [
+            (M, '/a/app.py', 10, 'load', 1, -4.0),
+            (M, '/b/app.py', 10, 'load', 1, -4.0),
+        ], [])
+        head = _write(str(tmpdir.join('head.mprof')), [
+            (M, '/c/app.py', 10, 'load', 1, -2.0),
+        ], [])
+        result = diff.diff(base, head)
+        functions = result.select('function')
+        assert len(functions) == 1
+        assert functions[0].delta == 6.0 and abs(functions[0].ratio - 0.75) < 1e-9
+        assert [e.name for e in result.regressions(scope='function')] == ['app.py load']
+        assert not result.improvements(scope='function')
+
+    @staticmethod
+    def test_match_tolerance():
+        """测试就近匹配的距离上限"""
+        base = [registry.LineRecord(T, 'a.py', n, 'f', 1, 1.0) for n in (1, 2)]
+        head = [registry.LineRecord(T, 'a.py', n, 'f', 1, 1.0) for n in (1, 9)]
+        pairs = diff.match_lines(base, head, tolerance=3)
+        assert [(b and b.lineno, h and h.lineno) for b, h in pairs] == [
+            (1, 1), (2, None), (None, 9)]
+        pairs = diff.match_lines(base, head, tolerance=10)
+        assert [(b and b.lineno, h and h.lineno) for b, h in pairs] == [(1, 1), (2, 9)]
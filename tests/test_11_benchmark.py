@@ -0,0 +1,65 @@
+# encoding=utf8
+"""
+测试自身开销的基准测试工具
+"""
+import json
+
+from benchmarks import harness, overhead
+
+ROUNDS = 1
+MIN_TIME = 0.001
+
+
+class TestBenchmark(object):
+    """测试基准测试工具"""
+
+    @staticmethod
+    def test_cases_with_baseline():
+        """测试按关键字筛选用例时一并测量其基线用例，且开销为与基线的差值"""
+        cases = overhead.get_cases('dotting')
+        names = set(c.name for c in cases)
+        assert names == {'bare', 'stopwatch', 'stopwatch_mixin', 'dotting', 'dotting_mute'}
+        results = dict(((r.name, r.shape), r) for r in harness.run_cases(cases, ROUNDS, MIN_TIME))
+        for shape in overhead.SHAPES:
+            assert results[('dotting', shape)].ns_per_call > 0
+        assert results[('dotting', 'function')].baseline == 'stopwatch'
+        assert results[('dotting', 'method')].baseline == 'stopwatch_mixin'
+        result = results[('stopwatch', 'generator')]
+        assert result.baseline == 'bare'
+        assert result.overhead_ns == result.ns_per_call - results[('bare', 'generator')].ns_per_call
+
+    @staticmethod
+    def test_profiler_cases():
+        """测试各调用形式的分析器用例均可执行"""
+        results = harness.run_cases(overhead.get_cases('profiler'), ROUNDS, MIN_TIME)
+        shapes = [r.shape for r in results if r.name == 'memory_profiler_print']
+        assert shapes == list(overhead.SHAPES)
+
+    @staticmethod
+    def test_save_and_compare(tmpdir):
+        """测试保存基线并与之对比"""
+        results = harness.run_cases(overhead.get_cases('stopwatch_silent'), ROUNDS, MIN_TIME)
+        path = str(tmpdir.join('baseline.json'))
+        harness.save(results, path)
+        with open(path) as f:
+            assert json.load(f)['environment']['python']
+        base = harness.load(path)
+        assert base == results
+
+        head = [r._replace(overhead_ns=r.overhead_ns * 2 + 1000)
+                if r.name == 'stopwatch_silent' else r for r in base]
+        comparisons = harness.compare(base, head)
+        regressed = harness.regressions(comparisons)
+        assert sorted(c.shape for c in regressed) == sorted(overhead.SHAPES)
+        assert '!' in harness.format_comparisons(comparisons)
+        assert not harness.regressions(harness.compare(base, base))
+
+    @staticmethod
+    def test_main(tmpdir):
+        """测试命令行入口，存在退化时以 1 退出"""
+        path = str(tmpdir.join('baseline.json'))
+        argv = ['-k', 'stopwatch_silent', '--rounds', '1', '--min-time', '0.001']
+        assert overhead.main(argv + ['--save', path]) == 0
+        base = harness.load(path)
+        harness.save([r._replace(overhead_ns=1.0) for r in base], path)
+        assert overhead.main(argv + ['--compare', path, '--min-delta', '0']) == 1
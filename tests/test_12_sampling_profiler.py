@@ -0,0 +1,179 @@
+# encoding=utf8
+"""
+测试采样分析器
+"""
+import io
+import threading
+import time
+
+import pytest
+
+from moprofiler import SamplingProfiler, sampler
+from moprofiler.registry import ProfilerRegistry
+
+REGISTRY = ProfilerRegistry()
+INTERVAL = 0.001
+BUSY = 0.2
+
+
+def spin(seconds):
+    """忙等待"""
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+
+def inner(seconds):
+    """被 outer 调用的热点函数"""
+    spin(seconds)
+
+
+def outer():
+    """一半时间在自身，一半时间在 inner 中"""
+    spin(BUSY / 2)
+    inner(BUSY / 2)
+
+
+def produce():
+    """仅在生成器自身执行时被采样"""
+    spin(BUSY / 4)
+    yield 1
+    spin(BUSY / 4)
+
+
+EVENTS = []
+
+
+def echo():
+    """回显消费者发送的值，记录抛入的异常及被关闭"""
+    value = None
+    try:
+        while True:
+            try:
+                value = yield value
+            except KeyError:
+                EVENTS.append('thrown')
+                value = 'caught'
+    finally:
+        EVENTS.append('closed')
+
+
+def _func_stats(profiled):
+    """按函数名汇总的自身/累计样本数"""
+    return dict((func_name, counts) for (_filename, func_name), counts in
+                sampler.function_stats(profiled.profiler.snapshot()).items())
+
+
+class TestSamplingProfiler(object):
+    """测试采样分析器"""
+
+    @staticmethod
+    def test_function_stats():
+        """测试按函数统计自身与累计样本数，调用栈止于被装饰对象"""
+        stream = io.StringIO()
+        profiled = SamplingProfiler(outer, interval=INTERVAL, stream=stream, registry=REGISTRY)
+        profiled()
+        snapshot = profiled.profiler.snapshot()
+        assert snapshot.samples > 10
+        assert all(stack[0][1] == 'outer' for stack in snapshot.stacks)
+
+        stats = _func_stats(profiled)
+        assert stats['outer'][1] == snapshot.samples
+        assert stats['inner'][1] == pytest.approx(snapshot.samples / 2.0, rel=0.5)
+        assert stats['spin'][0] > snapshot.samples * 0.8
+        assert not profiled.profiler.threads
+
+        text = stream.getvalue()
+        assert '采样分析' in text and 'inner' in text and 'while time.time() < end' in text
+
+        records = list(profiled.line_records())
+        assert sum(r.hits for r in records) == snapshot.samples
+        assert sum(r.value for r in records) == pytest.approx(BUSY, rel=0.3)
+
+        collapsed = io.StringIO()
+        profiled.write_collapsed(collapsed)
+        lines = collapsed.getvalue().splitlines()
+        assert sum(int(line.rsplit(' ', 1)[1]) for line in lines) == snapshot.samples
+        assert any(line.startswith('outer (') and ';inner (' in line for line in lines)
+
+        profiled.reset_stats()
+        assert profiled.profiler.snapshot().samples == 0
+
+    @staticmethod
+    def test_generator():
+        """测试生成器挂起期间不被采样"""
+        profiled = SamplingProfiler(produce, interval=INTERVAL, print_res=False, registry=REGISTRY)
+        for _item in profiled():
+            spin(BUSY)
+        stats = _func_stats(profiled)
+        assert set(stats) <= {'produce', 'spin'}
+        assert stats['produce'][1] < BUSY / INTERVAL
+
+    @staticmethod
+    def test_generator_send_throw_close():
+        """测试 send / throw 转发给被追踪的生成器，提前关闭时被追踪的生成器同样被关闭"""
+        del EVENTS[:]
+        profiled = SamplingProfiler(echo, interval=INTERVAL, print_res=False, registry=REGISTRY)
+        g = profiled()
+        assert next(g) is None
+        assert g.send(1) == 1
+        assert g.throw(KeyError()) == 'caught'
+        g.close()
+        assert EVENTS == ['thrown', 'closed']
+        assert not profiled.profiler.threads
+
+        g = profiled()
+        next(g)
+        with pytest.raises(ValueError):
+            g.throw(ValueError())
+        assert EVENTS == ['thrown', 'closed', 'closed']
+        assert not profiled.profiler.threads
+
+    @staticmethod
+    def test_generator_return_value():
+        """测试 yield from 被分析的生成器时获取其返回值，统计垃圾回收时同样如此"""
+        def generate():
+            yield 1
+            return 'result'
+
+        def delegate(g):
+            result = yield from g
+            yield result
+
+        for print_gc in (False, True):
+            profiled = SamplingProfiler(
+                generate, interval=INTERVAL, print_res=False, registry=REGISTRY, print_gc=print_gc)
+            assert list(delegate(profiled())) == [1, 'result']
+            assert not profiled.profiler.threads
+
+    @staticmethod
+    def test_threads():
+        """测试多个线程同时执行被装饰对象"""
+        profiled = SamplingProfiler(outer, interval=INTERVAL, print_res=False, registry=REGISTRY)
+        threads = [threading.Thread(target=profiled) for _i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert _func_stats(profiled)['outer'][1] > 10
+        assert not profiled.profiler.threads
+
+    @staticmethod
+    def test_signal():
+        """测试以 SIGPROF 信号采样 CPU 时间"""
+        import signal
+
+        previous = signal.getsignal(signal.SIGPROF)
+        profiled = SamplingProfiler(
+            outer, interval=INTERVAL, mode='signal', print_res=False, registry=REGISTRY)
+        profiled()
+        assert _func_stats(profiled)['inner'][1] > 5
+        assert signal.getsignal(signal.SIGPROF) == previous
+
+    @staticmethod
+    def test_invalid():
+        """测试不支持的参数"""
+        with pytest.raises(ValueError):
+            SamplingProfiler(outer, interval=0, registry=REGISTRY)
+        with pytest.raises(ValueError):
+            SamplingProfiler(outer, mode='unknown', registry=REGISTRY)
@@ -0,0 +1,322 @@
+# encoding=utf8
+"""
+测试模块级插桩及命令行入口
+"""
+import json
+import sys
+import textwrap
+
+import pytest
+
+from moprofiler import binary, cli, instrument, registry
+from moprofiler.base import ProfilerClassDecorator
+from moprofiler.time import TimeProfiler
+
+PACKAGE = 'instrument_demo'
+
+WORK = textwrap.dedent('''
+    import json
+    from os.path import join
+
+
+    def helper(n):
+        total = 0
+        for i in range(n):
+            total += i
+        return total
+
+
+    def skipped():
+        return 1
+
+
+    class Worker(object):
+        def __init__(self, n):
+            self.n = n
+
+        def __repr__(self):
+            return 'Worker'
+
+        def run(self):
+            return helper(self.n) + self.scale(2)
+
+        @classmethod
+        def scale(cls, x):
+            return x * 2
+
+        @staticmethod
+        def dump(x):
+            return json.dumps(x)
+
+        class Inner(object):
+            def ping(self):
+                return 'pong'
+''')
+
+JOB = textwrap.dedent('''
+    import sys
+    from instrument_demo.work import Worker
+
+    print('result', Worker(int(sys.argv[1])).run())
+    sys.exit(int(sys.argv[2]))
+''')
+
+BASES = textwrap.dedent('''
+    class Base(object):
+        def __init__(self, x):
+            self.x = x
+
+        def get(self):
+            return self.x
+
+
+    class Sub(Base):
+        def __init__(self, x):
+            Base.__init__(self, x + 1)
+''')
+
+MAIN = textwrap.dedent('''
+    import sys
+
+
+    def fib(n):
+        return n if n < 2 else fib(n - 1) + fib(n - 2)
+
+
+    class Job(object):
+        def run(self):
+            return fib(10)
+
+
+    if __name__ == '__main__':
+        import __main__
+        assert __main__.fib is fib and sys.modules['__main__'] is __main__
+        print('fib', Job().run())
+''')
+
+
+@pytest.fixture
+def package(tmp_path):
+    """在临时目录中创建被插桩的包，用例结束后清理"""
+    pkg = tmp_path / PACKAGE
+    pkg.mkdir()
+    (pkg / '__init__.py').write_text(u'')
+    (pkg / 'work.py').write_text(WORK)
+    (pkg / 'other.py').write_text(u'def other():\n    return 1\n')
+    (pkg / 'bases.py').write_text(BASES)
+    (pkg / 'main.py').write_text(MAIN)
+    (tmp_path / 'job.py').write_text(JOB)
+    (tmp_path / 'main.py').write_text(MAIN)
+    sys.path.insert(0, str(tmp_path))
+    saved_argv, saved_path = sys.argv, list(sys.path)
+    yield tmp_path
+    sys.argv = saved_argv
+    sys.path[:] = [p for p in saved_path if p != str(tmp_path)]
+    for name in list(sys.modules):
+        if name.split('.')[0] == PACKAGE:
+            del sys.modules[name]
+
+
+class TestInstrument(object):
+    """测试模块级插桩"""
+
+    @staticmethod
+    def test_instrument_on_import(package):  # pylint: disable=W0613,W0621
+        """测试导入时插桩，同一模块共用一个分析器并以模块为单位加入注册表"""
+        reg = registry.ProfilerRegistry()
+        instrumenter = instrument.instrument(
+            [PACKAGE + '.*'], exclude=[PACKAGE + '.other', PACKAGE + '.work:skipped'], registry=reg)
+        try:
+            from instrument_demo import other, work  # pylint: disable=E0401
+        finally:
+            instrumenter.uninstall()
+        assert instrumenter._finder is None  # pylint: disable=W0212
+
+        assert sorted(instrumenter.instrumented[PACKAGE + '.work']) == [
+            'Worker.Inner.ping', 'Worker.__init__', 'Worker.dump', 'Worker.run', 'Worker.scale',
+            'helper']
+        assert PACKAGE + '.other' not in instrumenter.instrumented
+        assert not isinstance(other.other, ProfilerClassDecorator)
+        assert not isinstance(work.skipped, ProfilerClassDecorator)
+        assert not isinstance(work.join, ProfilerClassDecorator)
+        assert isinstance(work.helper, ProfilerClassDecorator)
+
+        assert work.Worker(10).run() == 49
+        assert work.Worker.scale(3) == 6 and work.Worker.dump([1]) == '[1]'
+        assert work.Worker.Inner().ping() == 'pong' and repr(work.Worker(1)) == 'Worker'
+
+        profile = instrumenter.profiles[PACKAGE + '.work']
+        assert reg.decorators() == [profile]
+        assert all(d.profiler is profile.profiler for d in profile.decorators)
+        records = reg.records()
+        assert set(r.func_name for r in records) == {
+            '__init__', 'run', 'helper', 'scale', 'dump', 'ping'}
+        helper_loop = [r for r in records if r.func_name == 'helper' and r.hits == 10]
+        assert helper_loop
+
+        reg.reset()
+        assert reg.records() == []
+        assert all(d.profiler is profile.profiler for d in profile.decorators)
+        work.helper(3)
+        func_names = [r.func_name for r in reg.records()]
+        assert func_names and all(name == 'helper' for name in func_names)
+
+    @staticmethod
+    def test_class_access(package):  # pylint: disable=W0613,W0621
+        """测试通过类访问被插桩的方法，及子类显式调用基类的 __init__"""
+        reg = registry.ProfilerRegistry()
+        instrumenter = instrument.instrument([PACKAGE + '.bases'], registry=reg)
+        try:
+            from instrument_demo import bases  # pylint: disable=E0401
+        finally:
+            instrumenter.uninstall()
+        assert isinstance(vars(bases.Base)['get'], ProfilerClassDecorator)
+        assert bases.Sub(1).x == 2
+        assert bases.Base.get(bases.Base(3)) == 3 and bases.Sub(4).get() == 5
+        assert set(r.func_name for r in reg.records()) == {'__init__', 'get'}
+
+    @staticmethod
+    def test_shared_profiler(package, monkeypatch):  # pylint: disable=W0613,W0621
+        """测试同一模块中的函数共用一个分析器，插桩及清空统计时仅创建一次分析器"""
+        created = []
+        factory = TimeProfiler.profiler_factory
+
+        def counting_factory(*args, **kwargs):
+            created.append(args)
+            return factory(*args, **kwargs)
+        monkeypatch.setattr(TimeProfiler, 'profiler_factory', staticmethod(counting_factory))
+
+        reg = registry.ProfilerRegistry()
+        instrumenter = instrument.instrument([PACKAGE + '.work'], registry=reg)
+        try:
+            from instrument_demo import work  # pylint: disable=E0401
+        finally:
+            instrumenter.uninstall()
+        profile = instrumenter.profiles[PACKAGE + '.work']
+        assert len(profile.decorators) == 7 and len(created) == 1
+        reg.reset()
+        assert len(created) == 2
+        assert all(d.profiler is profile.profiler for d in profile.decorators)
+        assert work.Worker(3).run() == 7
+
+    @staticmethod
+    def test_already_imported(package):  # pylint: disable=W0613,W0621
+        """测试开始插桩时已导入的模块被立即插桩，且同一模块仅插桩一次"""
+        from instrument_demo import work  # pylint: disable=E0401
+        reg = registry.ProfilerRegistry()
+        instrumenter = instrument.Instrumenter(PACKAGE + '.work', profiler='memory', registry=reg)
+        instrumenter.install()
+        instrumenter.uninstall()
+        assert isinstance(work.helper, ProfilerClassDecorator)
+        helper = work.helper
+        assert instrumenter.instrument_module(work) == instrumenter.instrumented[PACKAGE + '.work']
+        assert work.helper is helper
+        assert reg.decorators()[0].report_kind == registry.KIND_MEMORY
+
+    @staticmethod
+    def test_invalid():
+        """测试不支持的分析器"""
+        with pytest.raises(ValueError):
+            instrument.Instrumenter('x', profiler='unknown')
+        assert not instrument.Instrumenter('*').matches('moprofiler.base')
+
+
+class TestCli(object):
+    """测试命令行入口"""
+
+    @staticmethod
+    def test_run_script(package, capsys):  # pylint: disable=W0621
+        """测试运行脚本并输出合并报告，返回脚本的退出码"""
+        code = cli.main(['-i', PACKAGE + '.*', str(package / 'job.py'), '10', '3'])
+        assert code == 3
+        out = capsys.readouterr().out
+        assert 'result 49' in out
+        assert '时间分析汇总' in out and 'total += i' in out
+
+    @staticmethod
+    def test_stopwatch(package, capsys):  # pylint: disable=W0621
+        """测试以秒表插桩指定的方法，按名称汇总输出"""
+        code = cli.main([
+            '-p', 'stopwatch', '-i', PACKAGE + '.work:Worker.*',
+            '-x', PACKAGE + '.work:Worker.dump',
+            '-s', 'hits', '-u', 'ms', str(package / 'job.py'), '5', '0'])
+        assert code == 0
+        lines = capsys.readouterr().out.splitlines()
+        assert lines[1] == '秒表汇总（按次数排序）' and '平均(ms)' in lines[2]
+        assert sorted(line.split()[0] for line in lines[4:-1]) == [
+            'Worker.__init__', 'Worker.run', 'Worker.scale']
+
+    @staticmethod
+    def test_json(package):  # pylint: disable=W0621
+        """测试以模块方式运行并输出 JSON"""
+        outfile = str(package / 'profile.json')
+        sys.path.insert(0, str(package))
+        code = cli.main([
+            '-f', 'json', '-o', outfile, '-n', '2', '-u', 'us', '-i', PACKAGE + '.*',
+            '-m', 'job', '100', '0'])
+        assert code == 0
+        with open(outfile) as f:
+            data = json.load(f)
+        assert data['target'] == 'job' and data['target_args'] == ['100', '0']
+        assert data['exit_code'] == 0
+        assert data['units'][registry.KIND_TIME] == 'us'
+        assert len(data['lines']) == 2 and data['lines'][0]['value'] >= data['lines'][1]['value']
+        assert data['lines'][0]['func_name'] == 'run' and data['stopwatch'] == []
+
+    @staticmethod
+    def test_binary(package):  # pylint: disable=W0621
+        """测试输出二进制格式，脚本抛出异常时仍输出已收集的结果"""
+        outfile = str(package / 'profile.mprof')
+        with pytest.raises(ValueError):
+            cli.main([
+                '-f', 'binary', '-o', outfile, '-i', PACKAGE + '.*',
+                str(package / 'job.py'), '5', 'x'])
+        with binary.load(outfile) as reader:
+            assert reader.metadata['target_args'] == ['5', 'x']
+            assert reader.metadata['exit_code'] == 1
+            assert set(r.func_name for r in reader.lines()) >= {'run', 'helper'}
+
+    @staticmethod
+    def test_main_script(package, capsys):  # pylint: disable=W0621
+        """测试未指定 -i 时，插桩脚本自身定义的函数及方法"""
+        main_module, argv, path = sys.modules['__main__'], sys.argv, list(sys.path)
+        outfile = str(package / 'profile.json')
+        assert cli.main(['-f', 'json', '-o', outfile, str(package / 'main.py')]) == 0
+        assert sys.modules['__main__'] is main_module
+        assert sys.argv is argv and sys.path == path
+        captured = capsys.readouterr()
+        assert 'fib 55' in captured.out and '警告' not in captured.err
+        with open(outfile) as f:
+            data = json.load(f)
+        assert {'fib', 'run'} <= set(line['func_name'] for line in data['lines'])
+
+    @staticmethod
+    def test_main_module(package, capsys):  # pylint: disable=W0621
+        """测试以 -m 运行模块且未指定 -i 时，插桩该模块自身定义的函数及方法"""
+        argv, path = sys.argv, list(sys.path)
+        outfile = str(package / 'profile.json')
+        code = cli.main(['-f', 'json', '-o', outfile, '-n', '0', '-m', PACKAGE + '.main'])
+        assert code == 0 and 'fib 55' in capsys.readouterr().out
+        assert sys.argv is argv and sys.path == path
+        with open(outfile) as f:
+            data = json.load(f)
+        assert {'fib', 'run'} <= set(line['func_name'] for line in data['lines'])
+
+        # 指定 -i 时，模块按其原本的模块名匹配
+        code = cli.main(['-p', 'stopwatch', '-i', PACKAGE + '.main:Job.*', '-m', PACKAGE + '.main'])
+        lines = capsys.readouterr().out.splitlines()
+        assert code == 0 and [line.split()[0] for line in lines[4:-1]] == ['Job.run']
+
+    @staticmethod
+    def test_nothing_instrumented(package, capsys):  # pylint: disable=W0621
+        """测试没有任何函数被插桩时输出警告"""
+        assert cli.main(['-i', 'no_such_module', str(package / 'main.py')]) == 0
+        assert '没有任何函数被插桩' in capsys.readouterr().err
+
+    @staticmethod
+    def test_usage(capsys):
+        """测试参数错误"""
+        for argv in ([], ['-f', 'binary', 'job.py'], ['-m']):
+            with pytest.raises(SystemExit):
+                cli.main(argv)
+        assert 'moprofiler: error' in capsys.readouterr().err
@@ -0,0 +1,55 @@
+# encoding=utf8
+"""
+测试时间/内存分析器装饰器的单次调用开销
+
+不对耗时设绝对上限，而是断言被装饰对象仅在首次调用或更换分析器时被封装一次
+"""
+from moprofiler import MemoryProfiler, TimeProfiler
+
+LOOP = 2000
+
+
+def _noop():
+    pass
+
+
+class TestProfilerOverhead(object):
+    """测试分析器装饰器的单次调用开销"""
+
+    @staticmethod
+    def test_time_profiler_overhead(monkeypatch):
+        """测试时间分析器仅封装一次被装饰函数，且各次调用的统计均被保留"""
+        profiled = TimeProfiler(print_res=False)(_noop)
+        profiler_class = type(profiled.profiler)
+        wrap = profiler_class.__call__
+        wrapped = []
+
+        def counting_wrap(self, func):
+            wrapped.append(func)
+            return wrap(self, func)
+        monkeypatch.setattr(profiler_class, '__call__', counting_wrap)
+
+        for _i in range(LOOP):
+            profiled()
+        assert wrapped == [_noop]
+        timings = list(profiled.profiler.get_stats().timings.values())
+        assert [hits for _lineno, hits, _time in timings[0]] == [LOOP]
+
+    @staticmethod
+    def test_memory_profiler_reuse():
+        """测试内存分析器仅封装一次被装饰函数"""
+        profiled = MemoryProfiler(print_res=False)(_noop)
+        profiled()
+        wrapped = profiled._profiled  # pylint: disable=W0212
+        profiled()
+        assert profiled._profiled is wrapped  # pylint: disable=W0212
+
+    @staticmethod
+    def test_force_new_profiler():
+        """测试强制使用新分析器时重新封装"""
+        profiled = TimeProfiler(print_res=False, force_new_profiler=True)(_noop)
+        profiled()
+        profiler, wrapped = profiled.profiler, profiled._profiled  # pylint: disable=W0212
+        profiled()
+        assert profiled.profiler is not profiler
+        assert profiled._profiled is not wrapped  # pylint: disable=W0212